@@ -1,8 +1,15 @@
+from src.utils.startup_profiler import StartupProfiler  # باید اولین import باشد تا زمان importها اندازه‌گیری شود
+import argparse
+import asyncio
 import logging
 import json
+import multiprocessing
 import os
+import signal
+import time
 from pathlib import Path
-from telegram import Update
+from typing import Optional
+from telegram import Bot, Update
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -12,7 +19,31 @@ from telegram.ext import (
     filters,
     ContextTypes,
 )
-from src.config import logger, TELEGRAM_BOT_TOKEN, BASE_URL, PORT, WEBHOOK_SECRET
+from telegram.request import BaseRequest
+from src.config import (
+    logger,
+    validate_env_vars,
+    TELEGRAM_BOT_TOKEN,
+    BASE_URL,
+    PORT,
+    WEBHOOK_SECRET,
+    FAST_LANE_CONCURRENCY,
+    FAST_LANE_QUEUE_SIZE,
+    SLOW_LANE_CONCURRENCY,
+    SLOW_LANE_QUEUE_SIZE,
+    PERSISTENCE_NAMESPACE,
+    PERSISTENCE_FLUSH_INTERVAL,
+    DEDUP_BACKEND,
+    DEDUP_TTL,
+    BOT_MODE,
+    WORKER_COUNT,
+    WORKER_MAX_BACKLOG,
+    WORKER_METRICS_PORT,
+    TELEGRAM_API_BASE_URL,
+    SESSION_PURGE_INTERVAL,
+    SCHOLARSHIP_SHEET_REFRESH_INTERVAL,
+    CONTENT_RELOAD_POLL_INTERVAL,
+)
 from src.handlers.user_manager import (
     start,
     select_language,
@@ -31,14 +62,50 @@ from src.handlers.user_manager import (
 )
 from src.handlers.menu_handler import main_menu_command, help_command, handle_menu_callback, handle_action_callback
 from src.handlers.message_handler import handle_text_message, handle_voice_message
-from src.database import initialize_connections, get_db_cursor, get_redis_client
+from src.handlers.admin_handler import (
+    profile_cpu_command,
+    memory_diff_command,
+    reload_knowledge_base_command,
+    isee_batch_command,
+    broadcast_command,
+)
+from src.database import setup_database, get_db_cursor, get_redis_client
 from src.services.isee_service import ISEEService
 from src.services.search_engine import SearchEngine
+from src.services.write_behind import write_behind
+from src.services.session_retention import purge_sessions_job
+from src.services.scholarship_matcher import refresh_scholarship_sheet_job
+from src.services.reminders import reminder_scheduler
+from src.services.content_reload import content_reload_job
+from src.services.broadcast import broadcast_engine
+from src.services.redis_persistence import RedisPersistence
+from src.services.webhook_server import (
+    WebhookServer,
+    LocalForwarder,
+    ShardedForwarder,
+    consume_shard,
+    start_metrics_server,
+)
+from src.services.telegram_request import InstrumentedRequest
 from src.utils.paginator import Paginator
 from src.utils.text_formatter import sanitize_markdown
 from src.utils.keyboard_builder import get_main_menu_keyboard
+from src.utils.update_scheduler import PriorityUpdateProcessor
+from src.utils.update_deduplicator import UpdateDeduplicator
+from src.utils.metrics import instrument_handler
 from src.data.knowledge_base import get_knowledge_base
+from src.data.callback_ids import from_base36
+
+IMPORTS_DONE = time.perf_counter()
 
+def _pagination_branch(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
+    prefix, _, action = update.callback_query.data.partition(":")
+    # شماره صفحه و callback_data ناشناخته در برچسب متریک نمی‌آیند تا تعداد سری‌ها محدود بماند
+    if prefix == "pg":
+        return "page"
+    return action if action in ("next", "prev") else "other"
+
+@instrument_handler("handle_pagination", branch=_pagination_branch)
 async def handle_pagination(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """مدیریت دکمه‌های صفحه‌بندی."""
     from src.handlers.user_manager import MAIN_MENU
@@ -48,8 +115,15 @@ async def handle_pagination(update: Update, context: ContextTypes.DEFAULT_TYPE)
     lang = context.user_data.get('language', 'fa')
     paginator = Paginator()
 
-    action = query.data.replace("pagination:", "")
-    if action == "next":
+    # «pg:<شماره صفحه base36>»؛ «pagination:next/prev» برای دکمه‌های پیام‌های قدیمی باقی مانده است
+    prefix, _, action = query.data.partition(":")
+    if prefix == "pg":
+        try:
+            page_data = paginator.get_page(user_id, from_base36(action))
+        except ValueError:
+            logger.warning(f"Invalid pagination callback for user {user_id}: {query.data}")
+            return MAIN_MENU
+    elif action == "next":
         page_data = paginator.get_next_page(user_id)
     elif action == "prev":
         page_data = paginator.get_prev_page(user_id)
@@ -72,12 +146,7 @@ async def handle_pagination(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     try:
         await query.message.edit_text(
-            sanitize_markdown(
-                f"{page_data['content']['content']}\n\n"
-                f"{'صفحه' if lang == 'fa' else 'Page' if lang == 'en' else 'Pagina'} "
-                f"{page_data['page_num']} {'از' if lang == 'fa' else 'of' if lang == 'en' else 'di'} "
-                f"{page_data['total_pages']}"
-            ),
+            sanitize_markdown(paginator.format_page(page_data, lang)),
             parse_mode='MarkdownV2',
             reply_markup=paginator.get_pagination_markup(page_data, lang)
         )
@@ -104,38 +173,40 @@ async def handle_pagination(update: Update, context: ContextTypes.DEFAULT_TYPE)
         )
     return MAIN_MENU
 
-async def main():
-    """راه‌اندازی ربات تلگرام با webhook."""
+def check_environment() -> None:
+    """بررسی توکن و متغیرهای محیطی موردنیاز (فقط یک بار در هر پردازه)."""
     if not TELEGRAM_BOT_TOKEN:
         logger.critical("TELEGRAM_BOT_TOKEN is not configured.")
         raise ValueError("TELEGRAM_BOT_TOKEN is missing.")
+    validate_env_vars()
 
-    # بررسی متغیرهای محیطی
-    required_vars = [
-        "TELEGRAM_BOT_TOKEN",
-        "OPENAI_API_KEY",
-        "DATABASE_URL",
-        "GOOGLE_CREDS",
-        "SHEET_ID",
-        "OPENWEATHERMAP_API_KEY",
-        "ADMIN_CHAT_ID",
-        "REDIS_URL",
-    ]
-    missing_vars = [var for var in required_vars if not os.getenv(var)]
-    if missing_vars:
-        logger.critical(f"Missing required environment variables: {', '.join(missing_vars)}")
-        raise EnvironmentError(f"Missing environment variables: {', '.join(missing_vars)}")
+async def error_handler(update, context):
+    """مدیریت خطاها."""
+    logger.error(f"Update {update} caused error: {context.error}")
+    if update and update.effective_message:
+        error_text = {
+            'fa': "خطایی رخ داد. لطفاً دوباره امتحان کنید.",
+            'en': "An error occurred. Please try again.",
+            'it': "Si è verificato un errore. Riprova."
+        }
+        lang = context.user_data.get('language', 'fa') if context.user_data else 'fa'
+        await update.effective_message.reply_text(
+            sanitize_markdown(error_text.get(lang)),
+            parse_mode='MarkdownV2',
+        )
 
-    # مقداردهی اولیه اتصال‌های پایگاه داده و Redis
-    try:
-        initialize_connections()
-        redis_client = get_redis_client()
-        if redis_client is None:
-            logger.warning("Redis client not initialized. Pagination and session features may not work.")
-    except Exception as e:
-        logger.critical(f"Failed to initialize database and Redis connections: {e}")
-        raise
+def telegram_endpoints() -> dict:
+    """آدرس‌های Bot API؛ با TELEGRAM_API_BASE_URL می‌توان ربات را به سرور محلی تست وصل کرد."""
+    if not TELEGRAM_API_BASE_URL:
+        return {}
+    base = TELEGRAM_API_BASE_URL.rstrip('/')
+    return {"base_url": f"{base}/bot", "base_file_url": f"{base}/file/bot"}
 
+def build_application(redis_client, request: Optional[BaseRequest] = None) -> Application:
+    """
+    ساخت Application تلگرام به همراه همه handlerها (مشترک بین حالت تک‌پردازه و workerها).
+    request برای جایگزینی لایه HTTP ربات (مثلاً در تست بار) است.
+    """
     # بارگذاری knowledge base
     try:
         knowledge_base = get_knowledge_base()
@@ -145,15 +216,41 @@ async def main():
         logger.error(f"Failed to load knowledge base: {e}")
         knowledge_base = {}
 
-    # ایجاد اپلیکیشن تلگرام
-    try:
-        application = (
-            Application.builder()
-            .token(TELEGRAM_BOT_TOKEN)
-            .read_timeout(10)
-            .write_timeout(10)
-            .build()
+    # ایجاد اپلیکیشن تلگرام با زمان‌بند دو مسیره و حذف آپدیت‌های تکراری
+    deduplicator = UpdateDeduplicator(
+        redis_client=redis_client if DEDUP_BACKEND == "redis" else None,
+        ttl=DEDUP_TTL,
+        namespace=PERSISTENCE_NAMESPACE,
+    )
+    update_processor = PriorityUpdateProcessor(
+        fast_concurrency=FAST_LANE_CONCURRENCY,
+        fast_queue_size=FAST_LANE_QUEUE_SIZE,
+        slow_concurrency=SLOW_LANE_CONCURRENCY,
+        slow_queue_size=SLOW_LANE_QUEUE_SIZE,
+        deduplicator=deduplicator,
+    )
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .request(request or InstrumentedRequest(read_timeout=10, write_timeout=10))
+        .concurrent_updates(update_processor)
+    )
+    endpoints = telegram_endpoints()
+    if endpoints:
+        builder = builder.base_url(endpoints["base_url"]).base_file_url(endpoints["base_file_url"])
+    # ذخیره وضعیت کاربران در Redis تا چند replica و ری‌استارت‌ها برای کاربر شفاف باشند
+    persistence = None
+    if redis_client is not None:
+        persistence = RedisPersistence(
+            redis_client,
+            namespace=PERSISTENCE_NAMESPACE,
+            flush_interval=PERSISTENCE_FLUSH_INTERVAL,
         )
+        builder = builder.persistence(persistence)
+    else:
+        logger.warning("Redis not available; user_data and conversation states will not be persisted.")
+    try:
+        application = builder.build()
     except Exception as e:
         logger.critical(f"Failed to initialize Telegram application: {e}")
         raise
@@ -162,6 +259,7 @@ async def main():
     application.bot_data['knowledge_base'] = knowledge_base
     application.bot_data['db_manager'] = None  # در صورت نیاز به شیء خاص جایگزین شود
     application.bot_data['OPENWEATHERMAP_API_KEY'] = os.getenv("OPENWEATHERMAP_API_KEY")
+    application.bot_data['update_processor'] = update_processor
 
     # تنظیم ConversationHandler برای ثبت‌نام کاربر، ISEE، و جستجو
     isee_service = ISEEService(knowledge_base, None)
@@ -187,65 +285,247 @@ async def main():
                 CommandHandler("profile", show_profile_command),
                 CallbackQueryHandler(handle_menu_callback, pattern="^menu:"),
                 CallbackQueryHandler(handle_action_callback, pattern="^action:"),
-                CallbackQueryHandler(handle_pagination, pattern="^pagination:"),
+                CallbackQueryHandler(handle_pagination, pattern="^(pagination|pg):"),
                 MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message),
                 MessageHandler(filters.VOICE, handle_voice_message),
                 search_engine.get_handler(),
             ],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        name="main_conversation",
+        persistent=persistence is not None,
     )
 
     # اضافه کردن ConversationHandler به اپلیکیشن
     application.add_handler(conv_handler)
 
-    # مدیریت خطاها
-    async def error_handler(update, context):
-        logger.error(f"Update {update} caused error: {context.error}")
-        if update and update.effective_message:
-            error_text = {
-                'fa': "خطایی رخ داد. لطفاً دوباره امتحان کنید.",
-                'en': "An error occurred. Please try again.",
-                'it': "Si è verificato un errore. Riprova."
-            }
-            lang = context.user_data.get('language', 'fa') if context.user_data else 'fa'
-            await update.effective_message.reply_text(
-                sanitize_markdown(error_text.get(lang)),
-                parse_mode='MarkdownV2',
-            )
+    # دستورات ادمین برای عیب‌یابی عملکرد
+    application.add_handler(CommandHandler("profile_cpu", profile_cpu_command))
+    application.add_handler(CommandHandler("memdiff", memory_diff_command))
+    application.add_handler(CommandHandler("reload_kb", reload_knowledge_base_command))
+    application.add_handler(CommandHandler("isee_batch", isee_batch_command))
+    application.add_handler(CommandHandler("broadcast", broadcast_command))
+
+    # حذف دوره‌ای سشن‌های منقضی در دسته‌های کوچک، به‌روزرسانی بورسیه‌های شیت در ایندکس تطبیق، دیدن /reload_kb
+    # پردازه‌های دیگر و زمان‌بند یادآوری‌ها
+    if application.job_queue is not None:
+        application.job_queue.run_repeating(
+            purge_sessions_job, interval=SESSION_PURGE_INTERVAL, first=60, name="purge_sessions"
+        )
+        application.job_queue.run_repeating(
+            refresh_scholarship_sheet_job, interval=SCHOLARSHIP_SHEET_REFRESH_INTERVAL, first=5,
+            name="refresh_scholarship_sheet"
+        )
+        application.job_queue.run_repeating(
+            content_reload_job, interval=CONTENT_RELOAD_POLL_INTERVAL, first=CONTENT_RELOAD_POLL_INTERVAL,
+            name="content_reload"
+        )
+        reminder_scheduler.attach(application.job_queue)
+        broadcast_engine.attach(application.job_queue)
+    else:
+        logger.warning("JobQueue not available; expired sessions will not be purged, sheet scholarships "
+                       "will not be matched and reminders will not be sent and interrupted broadcasts will not resume.")
 
     application.add_error_handler(error_handler)
+    return application
+
+def connect():
+    """اتصال به Redis؛ ساخت جداول پایگاه داده جداگانه و در پس‌زمینه انجام می‌شود."""
+    redis_client = get_redis_client()
+    if redis_client is None:
+        logger.warning("Redis client not initialized. Pagination and session features may not work.")
+    return redis_client
 
-    # راه‌اندازی webhook
+def prepare_database(profiler: StartupProfiler) -> None:
+    """
+    اجرای DDL پایگاه داده در یک thread، هم‌زمان با بقیه مراحل راه‌اندازی.
+    خطای مهاجرت دوباره raise می‌شود تا await database_task راه‌اندازی را متوقف کند.
+    """
+    start_time = time.perf_counter()
+    try:
+        setup_database()
+    except Exception as e:
+        logger.critical(f"Failed to set up database tables: {e}")
+        raise
+    finally:
+        profiler.record("database_setup", start_time, time.perf_counter())
+
+def install_stop_signals() -> asyncio.Event:
+    """
+    رویداد توقف که با SIGTERM (استقرار جدید در Render یا terminate پردازه مادر) و SIGINT تنظیم می‌شود،
+    تا پردازه به‌جای قطع ناگهانی، مسیر خاموشی (flush پایداری و تخلیه write-behind) را طی کند.
+    """
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop_event.set)
+    return stop_event
+
+async def start_webhook_server(forwarder, profiler: StartupProfiler) -> WebhookServer:
+    """شروع سرور webhook در اولین فرصت؛ آپدیت‌های زودرس در صف منتظر می‌مانند."""
+    server = WebhookServer(WEBHOOK_SECRET, forwarder)
+    with profiler.phase("webhook_listen"):
+        await server.start("0.0.0.0", PORT)
+    return server
+
+async def register_webhook(bot: Bot, profiler: StartupProfiler) -> None:
+    """ثبت آدرس webhook در تلگرام."""
     webhook_url = f"{BASE_URL}/webhook"
     try:
-        await application.initialize()
-        await application.bot.set_webhook(
-            url=webhook_url,
-            secret_token=WEBHOOK_SECRET,
-            allowed_updates=["message", "callback_query"],
-        )
+        with profiler.phase("set_webhook"):
+            await bot.set_webhook(
+                url=webhook_url,
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=["message", "callback_query"],
+            )
         logger.info(f"Webhook set successfully at {webhook_url}")
-
-        await application.run_webhook(
-            listen="0.0.0.0",
-            port=PORT,
-            secret_token=WEBHOOK_SECRET,
-            webhook_url=webhook_url,
-        )
     except Exception as e:
         logger.critical(f"Failed to start webhook: {e}")
         raise
 
-# 🟡 بخش نهایی اصلاح‌شده برای سازگاری با Render یا محیط‌های async:
-if __name__ == "__main__":
-    import asyncio
+async def main(profile_startup: bool = False):
+    """راه‌اندازی ربات تلگرام با webhook در یک پردازه."""
+    stop_event = install_stop_signals()
+    profiler = StartupProfiler(enabled=profile_startup)
+    profiler.record("imports", profiler.origin, IMPORTS_DONE)
+    with profiler.phase("env_validation"):
+        check_environment()
+    # DDL با تلاش‌های مجدد طولانی نباید جلوی گوش دادن webhook را بگیرد
+    database_task = asyncio.create_task(asyncio.to_thread(prepare_database, profiler))
+    with profiler.phase("redis_connect"):
+        redis_client = await asyncio.to_thread(connect)
+    with profiler.phase("build_application"):
+        application = build_application(redis_client)
 
+    # webhook زود گوش می‌دهد ولی تا پایان مهاجرت‌ها با 503 پاسخ می‌دهد تا handlerها به جدول ناموجود نخورند
+    schema_ready = asyncio.Event()
+    server = await start_webhook_server(LocalForwarder(application, ready=schema_ready), profiler)
     try:
-        loop = asyncio.get_event_loop()
-    except RuntimeError:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        with profiler.phase("initialize"):
+            await application.initialize()
+        await register_webhook(application.bot, profiler)
+        with profiler.phase("application_start"):
+            await application.start()
+        await database_task
+        schema_ready.set()
+        # رکوردهای مانده در صف write-behind از اجرای قبلی نوشته می‌شوند
+        write_behind.start()
+        profiler.print_report()
+        await stop_event.wait()
+        logger.info("Shutdown signal received, stopping.")
+    finally:
+        await server.stop()
+        if application.running:
+            await application.stop()
+        await write_behind.drain()
+        await application.shutdown()
 
-    loop.create_task(main())
-    loop.run_forever()
+async def run_receiver(num_workers: int, profile_startup: bool = False) -> None:
+    """اجرای دریافت‌کننده سبک webhook که آپدیت‌ها را بین workerها پخش می‌کند."""
+    stop_event = install_stop_signals()
+    profiler = StartupProfiler(enabled=profile_startup)
+    profiler.record("imports", profiler.origin, IMPORTS_DONE)
+    with profiler.phase("env_validation"):
+        check_environment()
+    database_task = asyncio.create_task(asyncio.to_thread(prepare_database, profiler))
+    with profiler.phase("redis_connect"):
+        redis_client = await asyncio.to_thread(connect)
+    if redis_client is None:
+        raise RuntimeError("Worker mode requires Redis for the update queues.")
+    forwarder = ShardedForwarder(
+        redis_client,
+        num_workers=num_workers,
+        max_backlog=WORKER_MAX_BACKLOG,
+        namespace=PERSISTENCE_NAMESPACE,
+        deduplicator=UpdateDeduplicator(
+            redis_client=redis_client if DEDUP_BACKEND == "redis" else None,
+            ttl=DEDUP_TTL,
+            namespace=PERSISTENCE_NAMESPACE,
+        ),
+    )
+    server = await start_webhook_server(forwarder, profiler)
+    bot = Bot(TELEGRAM_BOT_TOKEN, **telegram_endpoints())
+    try:
+        async with bot:
+            await register_webhook(bot, profiler)
+            await database_task
+            profiler.print_report()
+            await stop_event.wait()
+    finally:
+        await server.stop()
+
+async def run_worker(shard: int) -> None:
+    """اجرای یک worker که آپدیت‌های shard خودش را از Redis پردازش می‌کند."""
+    stop_event = install_stop_signals()
+    check_environment()
+    redis_client = connect()
+    if redis_client is None:
+        raise RuntimeError("Worker mode requires Redis for the update queues.")
+    # مهاجرت‌ها زیر قفل advisory اجرا می‌شوند؛ worker تا به‌روز شدن طرح (توسط خودش یا receiver) صبر می‌کند
+    await asyncio.to_thread(setup_database)
+    application = build_application(redis_client)
+    # هر worker متریک‌های خودش را روی پورت WORKER_METRICS_PORT + شماره shard ارائه می‌دهد
+    metrics_runner = None
+    if WORKER_METRICS_PORT:
+        metrics_runner = await start_metrics_server("0.0.0.0", WORKER_METRICS_PORT + shard)
+    async with application:
+        await application.start()
+        write_behind.start()
+        try:
+            await consume_shard(
+                application, redis_client, shard, namespace=PERSISTENCE_NAMESPACE, stop_event=stop_event
+            )
+        finally:
+            await application.stop()
+            await write_behind.drain()
+            if metrics_runner:
+                await metrics_runner.cleanup()
+
+def run_worker_process(shard: int) -> None:
+    """نقطه ورود پردازه worker."""
+    asyncio.run(run_worker(shard))
+
+def run_cluster(num_workers: int, profile_startup: bool = False) -> None:
+    """اجرای دریافت‌کننده در پردازه اصلی و N پردازه worker."""
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(target=run_worker_process, args=(shard,), name=f"worker-{shard}", daemon=True)
+        for shard in range(num_workers)
+    ]
+    for process in workers:
+        process.start()
+    logger.info(f"Started {num_workers} worker processes.")
+    try:
+        asyncio.run(run_receiver(num_workers, profile_startup))
+    finally:
+        # SIGTERM هر worker را از مسیر خاموشی خودش عبور می‌دهد (اتمام آپدیت‌های در جریان و تخلیه write-behind)
+        for process in workers:
+            process.terminate()
+        for process in workers:
+            process.join(timeout=10)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Scholarino Telegram bot")
+    parser.add_argument(
+        "--mode",
+        choices=["single", "cluster", "receiver", "worker"],
+        default=BOT_MODE,
+        help="single: one process; cluster: receiver + N workers; receiver/worker: run one role only",
+    )
+    parser.add_argument("--workers", type=int, default=WORKER_COUNT, help="number of worker shards")
+    parser.add_argument("--shard", type=int, default=0, help="shard index for --mode worker")
+    parser.add_argument("--profile-startup", action="store_true", help="print a per-phase startup timing breakdown")
+    return parser.parse_args()
+
+# 🟡 بخش نهایی اصلاح‌شده برای سازگاری با Render یا محیط‌های async:
+if __name__ == "__main__":
+    args = parse_args()
+    if args.mode == "cluster":
+        run_cluster(args.workers, args.profile_startup)
+    elif args.mode == "receiver":
+        asyncio.run(run_receiver(args.workers, args.profile_startup))
+    elif args.mode == "worker":
+        run_worker_process(args.shard)
+    else:
+        # خطای راه‌اندازی (مثلاً شکست مهاجرت) پردازه را با کد غیرصفر متوقف می‌کند
+        asyncio.run(main(args.profile_startup))
@@ -0,0 +1,277 @@
+"""
+میکروبنچمارک مسیرهای داغ CPU که در هر آپدیت اجرا می‌شوند: اسکیپ MarkdownV2، جستجو و
+رندر knowledge base، ساخت کیبوردها، محاسبه ISEE و JSON صفحه‌بندی.
+
+اجرا از ریشه مخزن:
+    python -m perf.bench                                  # اجرای همه موارد
+    python -m perf.bench --save-baseline perf/bench_baseline.json
+    python -m perf.bench --compare perf/bench_baseline.json --tolerance 0.15
+    python -m perf.bench --filter search --scales 1,100
+"""
+import os
+
+os.environ.setdefault("TRACE_SAMPLE_RATE", "0")
+
+import argparse
+import copy
+import json
+import logging
+import platform
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+KNOWLEDGE_FILE = Path(__file__).resolve().parent.parent / "src" / "data" / "knowledge_base_v2.json"
+
+# هر مورد: (نام، تابع آماده‌سازی پیش از اندازه‌گیری یا None، تابع اندازه‌گیری‌شده)
+Case = Tuple[str, Optional[Callable[[], None]], Callable[[], Any]]
+
+# ---- داده‌های نمونه ----
+
+SAMPLE_TEXTS: Dict[str, str] = {
+    'fa': (
+        "🎓 *راهنمای بورسیه ADiSU* (2025/2026)\n"
+        "- شاخص ISEE زیر 27,948.60 یورو و ISPE زیر 60,757.87 یورو.\n"
+        "- حداقل واحدهای درسی (CFU): 20 واحد برای سال اول!\n"
+        "مهلت: 15 سپتامبر 2025 — جزئیات در adisu.umbria.it"
+    ),
+    'en': (
+        "🎓 *ADiSU Scholarship Guide* (2025/2026)\n"
+        "- ISEE below €27,948.60 and ISPE below €60,757.87.\n"
+        "- Minimum credits (CFU): 20 for first year!\n"
+        "Deadline: September 15, 2025 - see https://www.adisu.umbria.it/bandi [info]"
+    ),
+    'it': (
+        "🎓 *Guida Borsa ADiSU* (2025/2026)\n"
+        "- ISEE inferiore a €27.948,60 e ISPE inferiore a €60.757,87.\n"
+        "- Crediti minimi (CFU): 20 per il primo anno!\n"
+        "Scadenza: 15 settembre 2025 — vedi https://www.adisu.umbria.it/bandi [info]"
+    ),
+}
+
+def long_text(length: int = 4000) -> str:
+    """متن چندزبانه طولانی در حد سقف پیام تلگرام."""
+    block = "\n\n".join(SAMPLE_TEXTS.values())
+    return (block * (length // len(block) + 1))[:length]
+
+def load_raw_knowledge_base() -> Dict[str, List[Dict]]:
+    with open(KNOWLEDGE_FILE, encoding="utf-8") as f:
+        data = json.load(f)
+    return data.get("knowledge_base", data)
+
+def scaled_knowledge_base(factor: int, base: Optional[Dict[str, List[Dict]]] = None) -> Dict[str, List[Dict]]:
+    """تکرار آیتم‌های هر دسته factor بار با شناسه و عنوان متفاوت (×10 و ×100 اندازه فعلی)."""
+    base = base or load_raw_knowledge_base()
+    scaled: Dict[str, List[Dict]] = {}
+    for category, items in base.items():
+        scaled_items = []
+        for copy_index in range(factor):
+            for item in items:
+                clone = copy.deepcopy(item)
+                if copy_index:
+                    clone['id'] = f"{item['id']}_{copy_index}"
+                    clone['title'] = {lang: f"{title} #{copy_index}" for lang, title in item.get('title', {}).items()}
+                scaled_items.append(clone)
+        scaled[category] = scaled_items
+    return scaled
+
+def install_knowledge_base(kb: Dict[str, List[Dict]]) -> None:
+    import src.data.knowledge_base as kb_module
+    kb_module.knowledge_base = kb
+
+# ---- موارد بنچمارک ----
+
+_REFERENCE_SPECIAL = re.compile(r'([_*\[\]()~`>#+\-=|{}.!])')
+_REFERENCE_FILTER = re.compile(r'[^\x00-\x7F\u0600-\u06FF]')
+
+def reference_regex_sanitize(text: str) -> str:
+    """پیاده‌سازی قدیمی sanitize_markdown (دو re.sub و یک replace) فقط برای مقایسه سرعت."""
+    text = _REFERENCE_FILTER.sub('', text.replace('\r', ''))
+    return _REFERENCE_SPECIAL.sub(r'\\\1', text).replace('\n', '\n\n')
+
+def text_cases() -> List[Case]:
+    from src.utils import text_formatter
+    from src.utils.text_formatter import escape_markdown_v2, sanitize_markdown
+    from src.utils.message_splitter import split_message
+    cases: List[Case] = []
+    texts = dict(SAMPLE_TEXTS, long=long_text())
+    for name, text in texts.items():
+        cases.append((f"escape_markdown_v2[{name}]", None, lambda text=text: escape_markdown_v2(text)))
+        cases.append((f"sanitize_markdown[{name}]", None, lambda text=text: sanitize_markdown(text)))
+        # مسیر بدون memo (متن‌های پویا مثل پاسخ‌های AI) و پیاده‌سازی regex قبلی به‌عنوان مرجع
+        cases.append((f"sanitize_markdown_uncached[{name}]", None,
+                      lambda text=text: text_formatter._sanitize_markdown(text, 4096)))
+        cases.append((f"reference:regex_sanitize[{name}]", None, lambda text=text: reference_regex_sanitize(text)))
+    # شکستن پاسخ‌های طولانی AI (بدون cache) در هر ارسال اجرا می‌شود
+    very_long = long_text() * 4
+    cases.append(("split_message[long_x4]", None, lambda: split_message(very_long)))
+    return cases
+
+def knowledge_base_cases(scale: int) -> List[Case]:
+    from src.data.knowledge_base import get_content_by_path, search_knowledge_base
+    kb = scaled_knowledge_base(scale)
+    setup = lambda: install_knowledge_base(kb)
+    calendar_category = "راهنمای دانشجویی"
+    # آخرین آیتم دسته بدترین حالت جستجوی خطی است
+    last_item = kb[calendar_category][-1]['id']
+    return [
+        (f"search_knowledge_base[x{scale},hit,en]", setup, lambda: search_knowledge_base("scholarship", 'en')),
+        (f"search_knowledge_base[x{scale},hit,fa]", setup, lambda: search_knowledge_base("بورسیه", 'fa')),
+        (f"search_knowledge_base[x{scale},miss,it]", setup, lambda: search_knowledge_base("zzzz", 'it')),
+        (f"get_content_by_path[x{scale},last,en]", setup,
+         lambda: get_content_by_path([calendar_category, last_item], 'en')),
+        (f"get_content_by_path[x{scale},last,fa]", setup,
+         lambda: get_content_by_path([calendar_category, last_item], 'fa')),
+    ]
+
+def keyboard_cases() -> List[Case]:
+    from src.data.knowledge_base import SCHOLARSHIP_CATEGORY
+    from src.utils.keyboard_builder import get_category_keyboard, get_item_keyboard, get_main_menu_keyboard
+    items = [
+        {'title': f"{SAMPLE_TEXTS['fa'].splitlines()[0]} {index}", 'callback': f"menu:راهنمای دانشجویی:item_{index}"}
+        for index in range(10)
+    ]
+    cases: List[Case] = [
+        (f"get_main_menu_keyboard[{lang}]", None, lambda lang=lang: get_main_menu_keyboard(lang))
+        for lang in ('fa', 'en', 'it')
+    ]
+    cases.append(("get_item_keyboard[10 items]", None, lambda: get_item_keyboard(items, 'fa')))
+    # کیبورد دسته از registry خوانده می‌شود؛ فقط اولین فراخوانی آن را می‌سازد
+    cases.append(("get_category_keyboard[fa]", None, lambda: get_category_keyboard(SCHOLARSHIP_CATEGORY, 'fa')))
+    return cases
+
+def isee_cases() -> List[Case]:
+    from src.services.isee_service import ISEEService
+    service = ISEEService(load_raw_knowledge_base(), None)
+    return [
+        ("ISEEService.calculate[tenant]", None, lambda: service.calculate(3, 18500.0, "مستأجر")),
+        ("ISEEService.calculate[owner]", None, lambda: service.calculate(5, 32000.0, "مالک", 120.0)),
+    ]
+
+def paginator_cases() -> List[Case]:
+    from src.utils.paginator import Paginator
+    paginator = Paginator.__new__(Paginator)  # بدون اتصال Redis؛ فقط مسیر JSON اندازه‌گیری می‌شود
+    content = [
+        {"content": long_text(1500), "file_path": None, "callback": f"menu:راهنمای دانشجویی:item_{index}"}
+        for index in range(20)
+    ]
+    session = {'content': content, 'type': 'search', 'current_page': 3, 'total_pages': len(content),
+               'created_at': "2025-09-01T12:00:00"}
+    encoded = json.dumps(session)
+
+    def decode() -> Dict:
+        return paginator._prepare_page(json.loads(encoded))
+
+    return [
+        ("paginator.encode[20 pages]", None, lambda: json.dumps(session)),
+        ("paginator.decode[20 pages]", None, decode),
+    ]
+
+def build_cases(scales: List[int]) -> List[Case]:
+    cases = text_cases()
+    for scale in scales:
+        cases.extend(knowledge_base_cases(scale))
+    cases.extend(keyboard_cases())
+    cases.extend(isee_cases())
+    cases.extend(paginator_cases())
+    return cases
+
+# ---- اجرا و مقایسه ----
+
+def measure(func: Callable[[], Any], min_time: float, repeat: int) -> Dict[str, float]:
+    """تنظیم خودکار تعداد تکرار تا هر دور حداقل min_time طول بکشد؛ زمان‌ها به نانوثانیه برای هر فراخوانی."""
+    number = 1
+    while True:
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter_ns() - start
+        if elapsed >= min_time * 1e9:
+            break
+        number *= 10 if elapsed < min_time * 1e8 else 2
+    timings = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter_ns() - start) / number)
+    return {"min_ns": min(timings), "median_ns": statistics.median(timings), "loops": number}
+
+def run_cases(cases: List[Case], min_time: float, repeat: int, pattern: Optional[str]) -> Dict[str, Dict[str, float]]:
+    results: Dict[str, Dict[str, float]] = {}
+    for name, setup, func in cases:
+        if pattern and pattern not in name:
+            continue
+        if setup:
+            setup()
+        results[name] = measure(func, min_time, repeat)
+        print(f"{name:<48}{results[name]['min_ns'] / 1000:>12.2f} µs{results[name]['median_ns'] / 1000:>12.2f} µs")
+    return results
+
+def environment() -> Dict[str, str]:
+    return {"python": sys.version.split()[0], "implementation": platform.python_implementation(),
+            "machine": platform.machine(), "platform": platform.platform()}
+
+def save_baseline(path: str, results: Dict[str, Dict[str, float]]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"environment": environment(), "results": results}, f, ensure_ascii=False, indent=2)
+    print(f"Baseline with {len(results)} cases written to {path}")
+
+def compare(path: str, results: Dict[str, Dict[str, float]], tolerance: float) -> List[str]:
+    """مقایسه با خط پایه بر اساس کمترین زمان؛ بازگشت نام مواردی که بیش از tolerance کندتر شده‌اند."""
+    with open(path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("environment", {}).get("python") != environment()["python"]:
+        print(f"Warning: baseline was recorded with Python {baseline['environment'].get('python')}")
+    regressions = []
+    print(f"\n{'case':<48}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name, current in results.items():
+        previous = baseline["results"].get(name)
+        if not previous:
+            print(f"{name:<48}{'-':>12}{current['min_ns'] / 1000:>10.2f}µs{'new':>10}")
+            continue
+        change = current['min_ns'] / previous['min_ns'] - 1
+        flag = ""
+        if change > tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        elif change < -tolerance:
+            flag = "  faster"
+        print(f"{name:<48}{previous['min_ns'] / 1000:>10.2f}µs{current['min_ns'] / 1000:>10.2f}µs{change:>+10.1%}{flag}")
+    return regressions
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for Scholarino hot paths")
+    parser.add_argument("--scales", default="1,10,100", help="comma-separated knowledge base size multipliers")
+    parser.add_argument("--filter", help="only run cases whose name contains this string")
+    parser.add_argument("--min-time", type=float, default=0.2, help="minimum seconds per timing round")
+    parser.add_argument("--repeat", type=int, default=5, help="timing rounds per case")
+    parser.add_argument("--save-baseline", metavar="PATH", help="write results as the new baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare results against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="allowed slowdown before a case is flagged (0.10 = 10%%)")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    scales = [int(scale) for scale in args.scales.split(",") if scale.strip()]
+    cases = build_cases(scales)
+    # لاگ‌های INFO/WARNING داخل توابع نباید در زمان‌ها دیده شوند
+    logging.disable(logging.WARNING)
+    print(f"{'case':<48}{'min':>15}{'median':>15}")
+    results = run_cases(cases, args.min_time, args.repeat, args.filter)
+    logging.disable(logging.NOTSET)
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results)
+    if args.compare:
+        regressions = compare(args.compare, results, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} case(s) regressed by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,308 @@
+"""
+سرورهای محلی جایگزین OpenAI، Telegram Bot API و Google Sheets برای تست کارایی انتها به انتها
+روی یک ماشین ایزوله. ربات با متغیرهای OPENAI_BASE_URL، TELEGRAM_API_BASE_URL و SHEETS_API_URL
+به این سرورها وصل می‌شود و مسیرهای واقعی HTTP (pool اتصال، retry، timeout) اجرا می‌شوند.
+
+اجرا از ریشه مخزن:
+    python -m perf.fake_servers --openai-latency 800 --openai-error-rate 0.05 --telegram-latency 40
+    python -m perf.loadtest --external      # در ترمینال دیگر، با همان متغیرهای محیطی چاپ‌شده
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, Optional
+from urllib.parse import unquote
+
+from aiohttp import web
+
+from perf.fakes import SAMPLE_ANSWERS, VOICE_FILE_BYTES, BotAPIResponder, Latency
+
+def _json(data: Any, status: int = 200, headers: Optional[Dict[str, str]] = None) -> web.Response:
+    return web.Response(text=json.dumps(data, ensure_ascii=False), status=status,
+                        content_type="application/json", headers=headers)
+
+class FakeOpenAIServer:
+    """
+    endpoint سازگار با OpenAI برای chat/completions (عادی و stream) و audio/transcriptions،
+    با تأخیر، سرعت تولید توکن و تزریق خطای قابل تنظیم.
+    """
+
+    def __init__(self, latency: Latency, chunk_delay: float = 0.02,
+                 error_rate: float = 0.0, error_status: int = 429):
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.app = web.Application()
+        self.app.router.add_post("/v1/chat/completions", self.handle_chat)
+        self.app.router.add_post("/v1/audio/transcriptions", self.handle_transcription)
+        self.app.router.add_get("/_stats", self.handle_stats)
+
+    def _injected_error(self) -> Optional[web.Response]:
+        if not self.error_rate or random.random() >= self.error_rate:
+            return None
+        self.calls["errors"] += 1
+        if self.error_status == 429:
+            return _json({"error": {"message": "Rate limit reached (injected)", "type": "requests",
+                                    "code": "rate_limit_exceeded"}},
+                         status=429, headers={"retry-after": "1"})
+        return _json({"error": {"message": "Injected server error", "type": "server_error", "code": None}},
+                     status=self.error_status)
+
+    @staticmethod
+    def _answer(messages: List[Dict[str, str]]) -> str:
+        system = messages[0].get("content", "") if messages else ""
+        lang = 'fa' if "Persian" in system else 'it' if "Italian" in system else 'en'
+        return SAMPLE_ANSWERS[lang]
+
+    async def handle_chat(self, request: web.Request) -> web.StreamResponse:
+        self.calls["chat"] += 1
+        body = await request.json()
+        await self.latency.async_sleep()
+        error = self._injected_error()
+        if error is not None:
+            return error
+        answer = self._answer(body.get("messages", []))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        model = body.get("model", "gpt-4o")
+        if not body.get("stream"):
+            return _json({
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 120, "completion_tokens": len(answer.split()),
+                          "total_tokens": 120 + len(answer.split())},
+            })
+
+        # stream: هر کلمه یک chunk از نوع Server-Sent Events
+        self.calls["chat_stream"] += 1
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        words = answer.split(" ")
+        for index, word in enumerate(words):
+            delta = {"content": word + (" " if index < len(words) - 1 else "")}
+            if index == 0:
+                delta["role"] = "assistant"
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            if self.chunk_delay:
+                await asyncio.sleep(self.chunk_delay)
+        final = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                 "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        await response.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+        await response.write_eof()
+        return response
+
+    async def handle_transcription(self, request: web.Request) -> web.Response:
+        self.calls["transcription"] += 1
+        # خواندن کامل فایل آپلودشده تا هزینه انتقال هم اندازه‌گیری شود
+        await request.post()
+        await self.latency.async_sleep()
+        error = self._injected_error()
+        if error is not None:
+            return error
+        return _json({"text": "How do I apply for the DSU scholarship?"})
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return _json(dict(self.calls))
+
+class FakeBotAPIServer:
+    """
+    stub سازگار با Bot API تلگرام که همه متدها را پاسخ می‌دهد و فراخوانی‌های ارسال پیام
+    (sendMessage، editMessageText، sendDocument و ...) را برای بررسی بعدی ثبت می‌کند.
+    """
+
+    RECORDED_METHODS = frozenset({"sendMessage", "editMessageText", "sendDocument", "sendPhoto",
+                                  "forwardMessage", "answerCallbackQuery"})
+
+    def __init__(self, latency: Latency, error_rate: float = 0.0, history: int = 1000):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.responder = BotAPIResponder()
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.recorded: Deque[Dict[str, Any]] = deque(maxlen=history)
+        self.app = web.Application(client_max_size=50 * 1024 * 1024)
+        self.app.router.add_route("*", "/bot{token}/{method}", self.handle_method)
+        self.app.router.add_get("/file/bot{token}/{path:.*}", self.handle_file)
+        self.app.router.add_get("/_stats", self.handle_stats)
+
+    @staticmethod
+    async def _parameters(request: web.Request) -> Dict[str, Any]:
+        parameters: Dict[str, Any] = dict(request.query)
+        if request.can_read_body:
+            if request.content_type == "application/json":
+                parameters.update(await request.json())
+            else:
+                for name, value in (await request.post()).items():
+                    # فایل‌ها فقط با اندازه‌شان ثبت می‌شوند
+                    parameters[name] = value if isinstance(value, str) else f"<file {len(value.file.read())} bytes>"
+        return parameters
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        parameters = await self._parameters(request)
+        self.calls[method] += 1
+        await self.latency.async_sleep()
+        if self.error_rate and random.random() < self.error_rate:
+            self.calls["429"] += 1
+            return _json({"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                          "parameters": {"retry_after": 1}}, status=429)
+        if method in self.RECORDED_METHODS:
+            self.recorded.append({
+                "method": method,
+                "chat_id": parameters.get("chat_id"),
+                "text_length": len(str(parameters.get("text", ""))),
+                "parse_mode": parameters.get("parse_mode"),
+                "at": time.time(),
+            })
+        return _json({"ok": True, "result": self.responder.result(method, parameters)})
+
+    async def handle_file(self, request: web.Request) -> web.Response:
+        self.calls["download"] += 1
+        await self.latency.async_sleep()
+        return web.Response(body=VOICE_FILE_BYTES, content_type="audio/ogg")
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        limit = int(request.query.get("limit", 50))
+        return _json({"calls": dict(self.calls), "recent": list(self.recorded)[-limit:]})
+
+class FakeSheetsServer:
+    """
+    زیرمجموعه‌ای از Google Sheets API v4 که gspread برای open_by_key، worksheet، append_row
+    و get_all_records استفاده می‌کند. برگه‌ها در حافظه نگه داشته می‌شوند.
+    """
+
+    def __init__(self, latency: Latency, sheet_titles: List[str]):
+        self.latency = latency
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.titles = list(sheet_titles)
+        # spreadsheet_id -> title -> rows
+        self.sheets: Dict[str, Dict[str, List[List[str]]]] = defaultdict(self._new_spreadsheet)
+        self.app = web.Application()
+        self.app.router.add_get("/v4/spreadsheets/{spreadsheet_id}", self.handle_metadata)
+        self.app.router.add_get("/v4/spreadsheets/{spreadsheet_id}/values/{range}", self.handle_values_get)
+        self.app.router.add_post("/v4/spreadsheets/{spreadsheet_id}/values/{range}", self.handle_values_post)
+        self.app.router.add_get("/_stats", self.handle_stats)
+
+    def _new_spreadsheet(self) -> Dict[str, List[List[str]]]:
+        # برگه پرسش‌ها با سطر عنوانی که get_user_history_from_sheet انتظار دارد
+        return {title: [["user_id", "timestamp", "question", "answer"]] for title in self.titles}
+
+    @staticmethod
+    def _sheet_title(range_label: str) -> str:
+        """استخراج نام برگه از A1 notation مثل 'Bazarino Orders'!A1."""
+        title = unquote(range_label).split("!")[0]
+        if title.startswith("'") and title.endswith("'"):
+            title = title[1:-1].replace("''", "'")
+        return title
+
+    async def handle_metadata(self, request: web.Request) -> web.Response:
+        self.calls["metadata"] += 1
+        await self.latency.async_sleep()
+        spreadsheet_id = request.match_info["spreadsheet_id"]
+        sheets = self.sheets[spreadsheet_id]
+        return _json({
+            "spreadsheetId": spreadsheet_id,
+            "properties": {"title": f"Local {spreadsheet_id}", "locale": "en_US", "timeZone": "Europe/Rome"},
+            "sheets": [
+                {"properties": {"sheetId": index, "title": title, "index": index, "sheetType": "GRID",
+                                "gridProperties": {"rowCount": max(1000, len(rows)), "columnCount": 26}}}
+                for index, (title, rows) in enumerate(sheets.items())
+            ],
+        })
+
+    async def handle_values_get(self, request: web.Request) -> web.Response:
+        self.calls["values_get"] += 1
+        await self.latency.async_sleep()
+        title = self._sheet_title(request.match_info["range"])
+        rows = self.sheets[request.match_info["spreadsheet_id"]].get(title)
+        if rows is None:
+            return _json({"error": {"code": 400, "message": f"Unable to parse range: {title}"}}, status=400)
+        return _json({"range": f"'{title}'!A1:Z{len(rows)}", "majorDimension": "ROWS", "values": rows})
+
+    async def handle_values_post(self, request: web.Request) -> web.Response:
+        range_label = request.match_info["range"]
+        if not range_label.endswith(":append"):
+            return _json({"error": {"code": 404, "message": "Only values:append is supported"}}, status=404)
+        self.calls["values_append"] += 1
+        body = await request.json()
+        await self.latency.async_sleep()
+        spreadsheet_id = request.match_info["spreadsheet_id"]
+        title = self._sheet_title(range_label[:-len(":append")])
+        rows = self.sheets[spreadsheet_id].setdefault(title, [])
+        new_rows = [[str(value) for value in row] for row in body.get("values", [])]
+        start = len(rows) + 1
+        rows.extend(new_rows)
+        return _json({
+            "spreadsheetId": spreadsheet_id,
+            "tableRange": f"'{title}'!A1:D{start - 1}",
+            "updates": {"spreadsheetId": spreadsheet_id, "updatedRange": f"'{title}'!A{start}:D{len(rows)}",
+                        "updatedRows": len(new_rows), "updatedColumns": max((len(r) for r in new_rows), default=0),
+                        "updatedCells": sum(len(r) for r in new_rows)},
+        })
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return _json({"calls": dict(self.calls),
+                      "rows": {sid: {title: len(rows) for title, rows in sheets.items()}
+                               for sid, sheets in self.sheets.items()}})
+
+async def serve(app: web.Application, host: str, port: int) -> web.AppRunner:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Local stand-ins for OpenAI, Telegram Bot API and Google Sheets")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--openai-port", type=int, default=8101)
+    parser.add_argument("--telegram-port", type=int, default=8102)
+    parser.add_argument("--sheets-port", type=int, default=8103)
+    parser.add_argument("--openai-latency", type=float, default=800, help="mean time to first token in ms")
+    parser.add_argument("--openai-chunk-delay", type=float, default=20, help="delay between streamed chunks in ms")
+    parser.add_argument("--openai-error-rate", type=float, default=0.0, help="fraction of OpenAI calls that fail")
+    parser.add_argument("--openai-error-status", type=int, default=429, help="HTTP status of injected OpenAI errors")
+    parser.add_argument("--telegram-latency", type=float, default=40, help="mean Bot API latency in ms")
+    parser.add_argument("--telegram-error-rate", type=float, default=0.0, help="fraction of Bot API calls answered with 429")
+    parser.add_argument("--sheets-latency", type=float, default=300, help="mean Sheets API latency in ms")
+    parser.add_argument("--sheet", action="append", dest="sheets",
+                        help="worksheet title to create (repeatable; default: the bot's configured sheet names)")
+    return parser.parse_args(argv)
+
+async def run(args: argparse.Namespace) -> None:
+    from src.config import QUESTIONS_SHEET_NAME, SCHOLARSHIPS_SHEET_NAME
+    openai_server = FakeOpenAIServer(Latency(args.openai_latency), args.openai_chunk_delay / 1000,
+                                     args.openai_error_rate, args.openai_error_status)
+    bot_server = FakeBotAPIServer(Latency(args.telegram_latency), args.telegram_error_rate)
+    sheets_server = FakeSheetsServer(Latency(args.sheets_latency),
+                                     args.sheets or [QUESTIONS_SHEET_NAME, SCHOLARSHIPS_SHEET_NAME])
+    runners = [
+        await serve(openai_server.app, args.host, args.openai_port),
+        await serve(bot_server.app, args.host, args.telegram_port),
+        await serve(sheets_server.app, args.host, args.sheets_port),
+    ]
+    print("Local stand-in servers are running. Point the bot at them with:")
+    print(f"  export OPENAI_BASE_URL=http://{args.host}:{args.openai_port}/v1")
+    print(f"  export TELEGRAM_API_BASE_URL=http://{args.host}:{args.telegram_port}")
+    print(f"  export SHEETS_API_URL=http://{args.host}:{args.sheets_port}")
+    print("Call statistics are available at /_stats on each server.")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+
+def main(argv: Optional[List[str]] = None) -> None:
+    try:
+        asyncio.run(run(parse_args(argv)))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,487 @@
+"""
+جایگزین‌های درون‌پردازه‌ای Redis، PostgreSQL، OpenAI، Google Sheets و Bot API برای
+اندازه‌گیری کارایی بدون حساب‌های واقعی. هر جایگزین می‌تواند تأخیر مصنوعی تزریق کند.
+"""
+import asyncio
+import fnmatch
+import json
+import random
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from telegram.request import BaseRequest, RequestData
+
+class Latency:
+    """تأخیر مصنوعی با میانگین ثابت و نوسان یکنواخت (±jitter)."""
+
+    def __init__(self, mean_ms: float = 0.0, jitter: float = 0.25):
+        self.mean = mean_ms / 1000
+        self.jitter = jitter
+
+    def sample(self) -> float:
+        if self.mean <= 0:
+            return 0.0
+        return self.mean * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def sleep(self) -> None:
+        """تأخیر مسدودکننده؛ برای کلاینت‌های sync مثل psycopg2 و gspread."""
+        delay = self.sample()
+        if delay:
+            time.sleep(delay)
+
+    async def async_sleep(self) -> None:
+        delay = self.sample()
+        if delay:
+            await asyncio.sleep(delay)
+
+# ---- Redis ----
+
+class FakeRedisPipeline:
+    """pipeline ساده: دستورات جمع و در execute پشت سر هم اجرا می‌شوند."""
+
+    def __init__(self, redis: "FakeRedis"):
+        self._redis = redis
+        self._commands: List[Tuple[str, tuple, dict]] = []
+
+    def __getattr__(self, name: str):
+        def queue(*args, **kwargs):
+            self._commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    def execute(self) -> List[Any]:
+        commands, self._commands = self._commands, []
+        return [getattr(self._redis, name)(*args, **kwargs) for name, args, kwargs in commands]
+
+class FakeRedis:
+    """زیرمجموعه‌ای از API همگام redis-py (با decode_responses=True) در حافظه."""
+
+    def __init__(self, latency: Optional[Latency] = None):
+        self.latency = latency or Latency()
+        self._data: Dict[str, Any] = {}
+        self._expires: Dict[str, float] = {}
+        self.calls: Dict[str, int] = defaultdict(int)
+
+    def _touch(self, command: str) -> None:
+        self.calls[command] += 1
+        self.latency.sleep()
+
+    def _alive(self, key: str) -> bool:
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return key in self._data
+
+    def _expire_in(self, key: str, seconds: Optional[float]) -> None:
+        if seconds:
+            self._expires[key] = time.monotonic() + seconds
+        else:
+            self._expires.pop(key, None)
+
+    def ping(self) -> bool:
+        self._touch("ping")
+        return True
+
+    def pipeline(self, transaction: bool = True) -> FakeRedisPipeline:
+        return FakeRedisPipeline(self)
+
+    # رشته‌ها
+    def get(self, key: str) -> Optional[str]:
+        self._touch("get")
+        return self._data.get(key) if self._alive(key) else None
+
+    def set(self, key: str, value: Any, ex: Optional[int] = None, nx: bool = False) -> Optional[bool]:
+        self._touch("set")
+        if nx and self._alive(key):
+            return None
+        self._data[key] = str(value)
+        self._expire_in(key, ex)
+        return True
+
+    def mget(self, *keys: str) -> List[Optional[str]]:
+        self._touch("mget")
+        return [self._data.get(key) if self._alive(key) else None for key in keys]
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        self._touch("incr")
+        value = int(self._data.get(key, 0) if self._alive(key) else 0) + amount
+        self._data[key] = str(value)
+        return value
+
+    def setex(self, key: str, seconds: int, value: Any) -> bool:
+        self._touch("setex")
+        self._data[key] = str(value)
+        self._expire_in(key, seconds)
+        return True
+
+    def delete(self, *keys: str) -> int:
+        self._touch("delete")
+        removed = 0
+        for key in keys:
+            if self._alive(key):
+                removed += 1
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return removed
+
+    def expire(self, key: str, seconds: int) -> bool:
+        self._touch("expire")
+        if not self._alive(key):
+            return False
+        self._expire_in(key, seconds)
+        return True
+
+    # هش‌ها
+    def _hash(self, key: str) -> Dict[str, str]:
+        if not self._alive(key):
+            self._data[key] = {}
+        return self._data[key]
+
+    def hget(self, key: str, field: Any) -> Optional[str]:
+        self._touch("hget")
+        return self._hash(key).get(str(field))
+
+    def hset(self, key: str, field: Any = None, value: Any = None, mapping: Optional[Dict] = None) -> int:
+        self._touch("hset")
+        values = dict(mapping or {})
+        if field is not None:
+            values[field] = value
+        target = self._hash(key)
+        added = sum(1 for name in values if str(name) not in target)
+        target.update({str(name): str(item) for name, item in values.items()})
+        return added
+
+    def hsetnx(self, key: str, field: Any, value: Any) -> int:
+        self._touch("hsetnx")
+        target = self._hash(key)
+        if str(field) in target:
+            return 0
+        target[str(field)] = str(value)
+        return 1
+
+    def hdel(self, key: str, *fields: Any) -> int:
+        self._touch("hdel")
+        target = self._hash(key)
+        return sum(1 for name in fields if target.pop(str(name), None) is not None)
+
+    def hgetall(self, key: str) -> Dict[str, str]:
+        self._touch("hgetall")
+        return dict(self._hash(key))
+
+    def hscan_iter(self, key: str, match: Optional[str] = None, count: Optional[int] = None) -> Iterator[Tuple[str, str]]:
+        self._touch("hscan")
+        for field, value in list(self._hash(key).items()):
+            if match is None or fnmatch.fnmatchcase(field, match):
+                yield field, value
+
+    # لیست‌ها (صف shardها در حالت cluster)
+    def _list(self, key: str) -> List[str]:
+        if not self._alive(key):
+            self._data[key] = []
+        return self._data[key]
+
+    def rpush(self, key: str, *values: Any) -> int:
+        self._touch("rpush")
+        target = self._list(key)
+        target.extend(str(value) for value in values)
+        return len(target)
+
+    def llen(self, key: str) -> int:
+        self._touch("llen")
+        return len(self._list(key))
+
+    def lpop(self, key: str) -> Optional[str]:
+        self._touch("lpop")
+        target = self._list(key)
+        return target.pop(0) if target else None
+
+    def lrange(self, key: str, start: int, end: int) -> List[str]:
+        self._touch("lrange")
+        target = self._list(key)
+        return target[start:len(target) if end == -1 else end + 1]
+
+    def ltrim(self, key: str, start: int, end: int) -> bool:
+        self._touch("ltrim")
+        target = self._list(key)
+        target[:] = target[start:len(target) if end == -1 else end + 1]
+        return True
+
+# ---- PostgreSQL ----
+
+class FakeCursor:
+    """cursor شبیه psycopg2 که چند پرس‌وجوی شناخته‌شده ربات را روی دیکشنری‌ها اجرا می‌کند."""
+
+    def __init__(self, database: "FakeDatabase"):
+        self.db = database
+        self._rows: List[tuple] = []
+        self.rowcount = 0
+
+    def execute(self, sql: str, params: tuple = ()) -> None:
+        self.db.latency.sleep()
+        statement = " ".join(sql.split())
+        self.db.statements[statement.split(" (")[0][:60]] += 1
+        self._rows = self.db.run(statement, tuple(params or ()))
+        self.rowcount = len(self._rows)
+
+    def fetchone(self) -> Optional[tuple]:
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self) -> List[tuple]:
+        return list(self._rows)
+
+    def fetchmany(self, size: int = 1) -> List[tuple]:
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def close(self) -> None:
+        pass
+
+class FakeDatabase:
+    """
+    پایگاه داده درون‌حافظه‌ای برای جداول users، isee_calculations و sessions.
+    دستورات ناشناخته فقط شمرده می‌شوند و نتیجه خالی برمی‌گردانند.
+    """
+
+    def __init__(self, latency: Optional[Latency] = None):
+        self.latency = latency or Latency()
+        self.users: Dict[int, Dict[str, Any]] = {}
+        self.isee_calculations: List[Tuple[int, float]] = []
+        self.isee_client_ids: Set[Optional[str]] = set()
+        self.sessions: Dict[str, Tuple[int, str]] = {}
+        self.statements: Dict[str, int] = defaultdict(int)
+
+    def add_user(self, telegram_id: int, language: str = 'en', **fields: Any) -> None:
+        self.users[telegram_id] = {
+            'first_name': fields.get('first_name', 'Load'),
+            'last_name': fields.get('last_name', 'Test'),
+            'age': fields.get('age', 25),
+            'email': fields.get('email', f"user{telegram_id}@example.com"),
+            'language': language,
+            'score': fields.get('score', 0),
+        }
+
+    def run(self, statement: str, params: tuple) -> List[tuple]:
+        upper = statement.upper()
+        if upper.startswith("SELECT") and "FROM USERS" in upper:
+            user = self.users.get(params[0]) if params else None
+            if user is None:
+                return []
+            columns = statement[len("SELECT "):upper.index(" FROM")].split(",")
+            return [tuple(user.get(column.strip()) for column in columns)]
+        if upper.startswith("INSERT INTO USERS"):
+            telegram_id, first_name, last_name, age, email, language = params[:6]
+            score = self.users.get(telegram_id, {}).get('score', 0)
+            self.add_user(telegram_id, language, first_name=first_name, last_name=last_name, age=age, email=email,
+                          score=score)
+            return [(score,)] if "RETURNING" in upper else []
+        if upper.startswith("UPDATE USERS SET LANGUAGE"):
+            language, telegram_id = params[:2]
+            if telegram_id in self.users:
+                self.users[telegram_id]['language'] = language
+            return []
+        if upper.startswith("INSERT INTO ISEE_CALCULATIONS"):
+            # INSERT چندسطری صف write-behind: تعداد ستون‌ها از فهرست ستون‌های دستور خوانده می‌شود
+            width = self._column_count(statement)
+            for start in range(0, len(params), width):
+                # ON CONFLICT (client_id) DO NOTHING
+                client_id = params[start + 3] if width > 3 else None
+                if client_id is not None and client_id in self.isee_client_ids:
+                    continue
+                self.isee_client_ids.add(client_id)
+                self.isee_calculations.append((params[start], params[start + 1]))
+            return []
+        if upper.startswith("INSERT INTO SESSIONS"):
+            width = self._column_count(statement)
+            for start in range(0, len(params), width):
+                self.sessions.setdefault(params[start], (params[start + 1], params[start + 2]))
+            return []
+        return []
+
+    @staticmethod
+    def _column_count(statement: str) -> int:
+        return statement[statement.index("(") + 1:statement.index(")")].count(",") + 1
+
+    @contextmanager
+    def cursor(self, commit: bool = True) -> Iterator[FakeCursor]:
+        """جایگزین get_db_cursor با همان امضا."""
+        self.latency.sleep()  # هزینه اتصال
+        yield FakeCursor(self)
+
+def install_fake_database(database: FakeDatabase) -> None:
+    """جایگزینی get_db_cursor در همه ماژول‌های src که آن را import کرده‌اند."""
+    import sys
+    import src.database
+    original = src.database.get_db_cursor
+    for name, module in list(sys.modules.items()):
+        if (name == "main" or name.startswith("src.")) and getattr(module, "get_db_cursor", None) is original:
+            module.get_db_cursor = database.cursor
+
+# ---- OpenAI ----
+
+SAMPLE_ANSWERS = {
+    'fa': (
+        "برای درخواست بورسیه DSU در پروجا باید ابتدا *ISEE* خود را محاسبه کنید. "
+        "مدارک لازم: گذرنامه، گواهی درآمد خانواده (ترجمه‌شده و تأیید‌شده) و اسناد ملکی. "
+        "مهلت ثبت‌نام معمولاً اوایل سپتامبر است؛ جزئیات را در سایت adisu.umbria.it ببینید (مبلغ تا €5,192)."
+    ),
+    'en': (
+        "To apply for the DSU scholarship in Perugia you first need your *ISEE* value. "
+        "Required documents: passport, family income certificate (translated & legalised) and property records. "
+        "The deadline is usually early September - check adisu.umbria.it for details (up to €5,192)."
+    ),
+    'it': (
+        "Per richiedere la borsa DSU a Perugia devi prima calcolare il tuo *ISEE*. "
+        "Documenti: passaporto, certificato di reddito familiare (tradotto e legalizzato) e atti di proprietà. "
+        "La scadenza è di solito a inizio settembre - vedi adisu.umbria.it (fino a €5.192)."
+    ),
+}
+
+class _FakeCompletions:
+    def __init__(self, owner: "FakeOpenAI"):
+        self._owner = owner
+
+    async def create(self, model: str, messages: List[Dict[str, str]], **kwargs: Any) -> SimpleNamespace:
+        await self._owner.before_call("chat")
+        system = messages[0]['content'] if messages else ""
+        lang = 'fa' if "Persian" in system else 'it' if "Italian" in system else 'en'
+        message = SimpleNamespace(content=SAMPLE_ANSWERS[lang], role="assistant")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="stop", index=0)])
+
+class _FakeTranscriptions:
+    def __init__(self, owner: "FakeOpenAI"):
+        self._owner = owner
+
+    async def create(self, model: str, file: Any, language: str = 'en', **kwargs: Any) -> SimpleNamespace:
+        await self._owner.before_call("transcription")
+        return SimpleNamespace(text="How do I apply for the DSU scholarship?")
+
+class FakeOpenAI:
+    """کلاینت شبیه openai.AsyncOpenAI با تأخیر و نرخ خطای قابل تنظیم."""
+
+    def __init__(self, latency: Optional[Latency] = None, error_rate: float = 0.0):
+        self.latency = latency or Latency()
+        self.error_rate = error_rate
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.chat = SimpleNamespace(completions=_FakeCompletions(self))
+        self.audio = SimpleNamespace(transcriptions=_FakeTranscriptions(self))
+
+    async def before_call(self, operation: str) -> None:
+        self.calls[operation] += 1
+        await self.latency.async_sleep()
+        if self.error_rate and random.random() < self.error_rate:
+            raise RuntimeError(f"Injected OpenAI {operation} failure")
+
+def install_fake_openai(client: FakeOpenAI) -> None:
+    import src.services.openai_service as openai_service
+    openai_service._client = client
+
+# ---- Google Sheets ----
+
+class FakeWorksheet:
+    def __init__(self, client: "FakeSheetsClient", title: str):
+        self.client = client
+        self.title = title
+        self.rows: List[List[str]] = []
+
+    def append_row(self, values: List[Any], value_input_option: str = 'RAW') -> None:
+        self.client.calls["append_row"] += 1
+        self.client.latency.sleep()
+        self.rows.append([str(value) for value in values])
+
+    def get_all_records(self) -> List[Dict[str, str]]:
+        self.client.calls["get_all_records"] += 1
+        self.client.latency.sleep()
+        header = ("user_id", "timestamp", "question", "answer")
+        return [dict(zip(header, row)) for row in self.rows]
+
+class FakeSheetsClient:
+    """جایگزین gspread.Client؛ فراخوانی‌ها مثل gspread مسدودکننده‌اند."""
+
+    def __init__(self, latency: Optional[Latency] = None):
+        self.latency = latency or Latency()
+        self.calls: Dict[str, int] = defaultdict(int)
+        self._sheets: Dict[str, FakeWorksheet] = {}
+
+    def open_by_key(self, key: str) -> "FakeSheetsClient":
+        return self
+
+    def worksheet(self, title: str) -> FakeWorksheet:
+        if title not in self._sheets:
+            self._sheets[title] = FakeWorksheet(self, title)
+        return self._sheets[title]
+
+def install_fake_sheets(client: FakeSheetsClient) -> None:
+    import src.services.google_sheets_service as sheets_service
+    sheets_service.get_gspread_client = lambda: client
+
+# ---- Telegram Bot API ----
+
+BOT_USER = {"id": 1000000, "is_bot": True, "first_name": "Scholarino", "username": "scholarino_loadtest_bot"}
+
+class BotAPIResponder:
+    """تولید نتیجه‌های مصنوعی متدهای Bot API؛ مشترک بین FakeBotRequest و سرور محلی Bot API."""
+
+    def __init__(self):
+        self._message_id = 0
+
+    def _message(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        self._message_id += 1
+        chat_id = parameters.get("chat_id", 1)
+        return {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id) if str(chat_id).lstrip('-').isdigit() else 1, "type": "private"},
+            "from": BOT_USER,
+            "text": parameters.get("text", ""),
+        }
+
+    def result(self, method: str, parameters: Dict[str, Any]) -> Any:
+        if method == "getMe":
+            return BOT_USER
+        if method == "getFile":
+            file_id = parameters.get("file_id", "file")
+            return {"file_id": file_id, "file_unique_id": file_id, "file_size": 2048, "file_path": f"voice/{file_id}.oga"}
+        if method.startswith(("send", "edit", "forward", "copy")):
+            return self._message(parameters)
+        return True
+
+# محتوای ساختگی فایل صوتی برای دانلود
+VOICE_FILE_BYTES = b"OggS" + b"\x00" * 2044
+
+class FakeBotRequest(BaseRequest):
+    """
+    BaseRequest که به جای شبکه، پاسخ JSON مصنوعی برمی‌گرداند و تعداد فراخوانی هر
+    متد Bot API را ثبت می‌کند.
+    """
+
+    def __init__(self, latency: Optional[Latency] = None):
+        self.latency = latency or Latency()
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.responder = BotAPIResponder()
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None,
+                         pool_timeout=None) -> Tuple[int, bytes]:
+        await self.latency.async_sleep()
+        if "/file/bot" in url:
+            self.calls["download"] += 1
+            return 200, VOICE_FILE_BYTES
+        endpoint = url.rsplit("/", 1)[-1]
+        self.calls[endpoint] += 1
+        parameters = request_data.parameters if request_data else {}
+        body = {"ok": True, "result": self.responder.result(endpoint, parameters)}
+        return 200, json.dumps(body).encode("utf-8")
@@ -0,0 +1,346 @@
+"""
+تست بار آفلاین: آپدیت‌های مصنوعی تلگرام را از مسیر واقعی زمان‌بند و
+Application.process_update عبور می‌دهد و برای هر سناریو updates/s و چندک‌های تأخیر را گزارش می‌کند.
+
+اجرا از ریشه مخزن:
+    python -m perf.loadtest --users 200 --concurrency 50 --openai-latency 800
+    python -m perf.loadtest --scenario menu --scenario search --redis-url redis://localhost:6379/0
+"""
+import os
+
+# مقادیر ساختگی پیش از import تنظیمات ربات؛ متغیرهای واقعی محیط اولویت دارند
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:LOADTEST")
+os.environ.setdefault("OPENAI_API_KEY", "loadtest")
+os.environ.setdefault("DATABASE_URL", "postgresql://loadtest@localhost/loadtest")
+os.environ.setdefault("SHEET_ID", "loadtest")
+os.environ.setdefault("TRACE_SAMPLE_RATE", "0")
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import statistics
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from telegram import Update
+
+from perf.fakes import (
+    FakeBotRequest,
+    FakeDatabase,
+    FakeOpenAI,
+    FakeRedis,
+    FakeSheetsClient,
+    Latency,
+    install_fake_database,
+    install_fake_openai,
+    install_fake_sheets,
+)
+
+# هر گام: (نوع، داده) — نوع یکی از command، text، callback یا voice است
+Step = Tuple[str, str]
+
+SCENARIOS: Dict[str, List[Step]] = {
+    # ثبت‌نام کامل کاربر جدید
+    "registration": [
+        ("command", "/start"),
+        ("callback", "lang:en"),
+        ("text", "Mario"),
+        ("text", "Rossi"),
+        ("text", "24"),
+        ("text", "mario.rossi@example.com"),
+    ],
+    # مرور منو توسط کاربر ثبت‌نام‌شده
+    "menu": [
+        ("command", "/start"),
+        ("callback", "menu:scholarships"),
+        ("callback", "menu:calendar"),
+        ("callback", "menu:i:1"),
+        ("callback", "menu:help"),
+        ("callback", "menu:main_menu"),
+        ("command", "/menu"),
+    ],
+    # جستجو در knowledge base و ورق زدن نتایج
+    "search": [
+        ("command", "/start"),
+        ("callback", "action:search"),
+        ("text", "isee"),
+        ("callback", "pg:1"),
+        ("callback", "pg:0"),
+    ],
+    # مکالمه محاسبه ISEE
+    "isee": [
+        ("command", "/start"),
+        ("callback", "menu:Calculate ISEE"),
+        ("text", "3"),
+        ("text", "18500"),
+        ("callback", "مستأجر"),
+    ],
+    # پرسش آزاد که به OpenAI و Sheets می‌رسد
+    "free_text": [
+        ("command", "/start"),
+        ("text", "How can I apply for the DSU scholarship in Perugia?"),
+    ],
+    # پیام صوتی: دانلود فایل، تبدیل به متن و پاسخ OpenAI
+    "voice": [
+        ("command", "/start"),
+        ("voice", "voice"),
+    ],
+}
+
+# سناریوهایی که کاربرشان از پیش در پایگاه داده ثبت شده است
+REGISTERED_SCENARIOS = frozenset(SCENARIOS) - {"registration"}
+
+class UpdateFactory:
+    """ساخت Update مصنوعی با update_id و message_id یکتا."""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    @staticmethod
+    def _user(user_id: int) -> Dict[str, Any]:
+        return {"id": user_id, "is_bot": False, "first_name": "Load", "language_code": "en"}
+
+    def _message(self, user_id: int, **fields: Any) -> Dict[str, Any]:
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._user(user_id),
+        }
+        message.update(fields)
+        return message
+
+    def build(self, user_id: int, kind: str, data: str) -> Update:
+        payload: Dict[str, Any] = {"update_id": next(self._update_ids)}
+        if kind == "command":
+            command = data.split()[0]
+            payload["message"] = self._message(
+                user_id, text=data, entities=[{"type": "bot_command", "offset": 0, "length": len(command)}]
+            )
+        elif kind == "text":
+            payload["message"] = self._message(user_id, text=data)
+        elif kind == "voice":
+            file_id = f"voice-{user_id}-{payload['update_id']}"
+            payload["message"] = self._message(
+                user_id, voice={"file_id": file_id, "file_unique_id": file_id, "duration": 4, "mime_type": "audio/ogg"}
+            )
+        elif kind == "callback":
+            bot_message = self._message(user_id, text="menu")
+            bot_message["from"] = {"id": self.bot.id, "is_bot": True, "first_name": self.bot.first_name}
+            payload["callback_query"] = {
+                "id": str(payload["update_id"]),
+                "from": self._user(user_id),
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": bot_message,
+            }
+        else:
+            raise ValueError(f"Unknown step kind: {kind}")
+        return Update.de_json(payload, self.bot)
+
+class ScenarioResult:
+    """تأخیرهای خام یک سناریو؛ چندک‌ها دقیق و نه از روی باکت محاسبه می‌شوند."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.rejected = 0
+        self.elapsed = 0.0
+        self.api_calls: Dict[str, int] = {}
+
+    def percentile(self, q: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def summary(self) -> Dict[str, Any]:
+        count = len(self.latencies)
+        return {
+            "scenario": self.name,
+            "updates": count,
+            "elapsed_s": round(self.elapsed, 3),
+            "updates_per_s": round(count / self.elapsed, 1) if self.elapsed else 0.0,
+            "mean_ms": round(statistics.fmean(self.latencies) * 1000, 2) if count else 0.0,
+            "p50_ms": round(self.percentile(0.50) * 1000, 2),
+            "p95_ms": round(self.percentile(0.95) * 1000, 2),
+            "p99_ms": round(self.percentile(0.99) * 1000, 2),
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "api_calls": self.api_calls,
+        }
+
+class ErrorLogCounter(logging.Handler):
+    """
+    شمارش رکوردهای لاگ در سطح ERROR و بالاتر. handlerهای ربات بیشتر خطاها را خودشان می‌گیرند،
+    لاگ می‌کنند و پیام خطا به کاربر می‌دهند؛ این خطاها هرگز به error handler برنامه نمی‌رسند.
+    """
+
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.count = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.count += 1
+
+class LoadTest:
+    """اجرای سناریوها روی یک Application ساخته‌شده با build_application و وابستگی‌های جایگزین."""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.bot_request = FakeBotRequest(Latency(args.telegram_latency))
+        self.database = FakeDatabase(Latency(args.db_latency)) if not args.database_url else None
+        self.openai = FakeOpenAI(Latency(args.openai_latency), error_rate=args.openai_error_rate)
+        self.sheets = FakeSheetsClient(Latency(args.sheets_latency))
+        self.application = None
+        self.factory: Optional[UpdateFactory] = None
+        self.error_log = ErrorLogCounter()
+        self._user_ids = itertools.count(10_000_000)
+
+    def _connect_redis(self):
+        import src.database
+        if self.args.redis_url:
+            import redis
+            client = redis.from_url(self.args.redis_url, decode_responses=True)
+            client.ping()
+        else:
+            client = FakeRedis(Latency(self.args.redis_latency))
+        # کلاینت مشترک ماژول database تا Paginator و بقیه همین نمونه را بگیرند
+        src.database.redis_client = client
+        return client
+
+    async def setup(self) -> None:
+        import main
+        # تنظیمات ربات هنگام import سطح لاگ را INFO می‌کند؛ لاگ زیاد خودش گلوگاه می‌شود
+        logging.getLogger().setLevel(self.args.log_level.upper())
+        redis_client = self._connect_redis()
+        if self.database is not None:
+            install_fake_database(self.database)
+        if self.args.external:
+            # کلاینت‌های واقعی HTTP به سرورهای perf/fake_servers.py وصل می‌شوند
+            request = None
+        else:
+            install_fake_openai(self.openai)
+            install_fake_sheets(self.sheets)
+            request = self.bot_request
+        self.application = main.build_application(redis_client, request=request)
+        # خطاهای بدون handler هم از error_handler برنامه لاگ می‌شوند، پس شمارش لاگ همه را پوشش می‌دهد
+        logging.getLogger().addHandler(self.error_log)
+        await self.application.initialize()
+        await self.application.start()
+        self.factory = UpdateFactory(self.application.bot)
+
+    async def teardown(self) -> None:
+        logging.getLogger().removeHandler(self.error_log)
+        if self.application is not None:
+            await self.application.stop()
+            from src.services.write_behind import write_behind
+            await write_behind.drain()
+            await self.application.shutdown()
+
+    async def _send(self, update: Update) -> Optional[float]:
+        """عبور یک آپدیت از زمان‌بند و ConversationHandler، همان مسیری که webhook طی می‌کند."""
+        start = time.perf_counter()
+        processor = self.application.update_processor
+        # مانند LocalForwarder: آپدیتی که جای خالی در مسیر ندارد رد می‌شود (503 در webhook)
+        if not processor.try_admit(update):
+            return None
+        await processor.process_update(update, self.application.process_update(update))
+        return time.perf_counter() - start
+
+    def _rejected(self) -> int:
+        processor = self.application.update_processor
+        return sum(lane.rejected.value for lane in getattr(processor, 'lanes', {}).values())
+
+    async def run_scenario(self, name: str) -> ScenarioResult:
+        steps = SCENARIOS[name]
+        result = ScenarioResult(name)
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+        calls_before = dict(self.bot_request.calls)
+        errors_before, rejected_before = self.error_log.count, self._rejected()
+
+        async def virtual_user() -> None:
+            user_id = next(self._user_ids)
+            if name in REGISTERED_SCENARIOS and self.database is not None:
+                self.database.add_user(user_id, language='en')
+            async with semaphore:
+                # گام‌های هر کاربر پشت سر هم اجرا می‌شوند تا ترتیب مکالمه حفظ شود
+                for kind, data in steps:
+                    latency = await self._send(self.factory.build(user_id, kind, data))
+                    if latency is not None:
+                        result.latencies.append(latency)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(virtual_user() for _ in range(self.args.users)))
+        result.elapsed = time.perf_counter() - start
+        result.errors = self.error_log.count - errors_before
+        result.rejected = self._rejected() - rejected_before
+        result.api_calls = {
+            method: count - calls_before.get(method, 0)
+            for method, count in self.bot_request.calls.items()
+            if count - calls_before.get(method, 0)
+        }
+        return result
+
+def print_report(results: List[ScenarioResult]) -> None:
+    header = f"{'scenario':<14}{'updates':>9}{'upd/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}{'rejected':>10}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        row = result.summary()
+        print(
+            f"{row['scenario']:<14}{row['updates']:>9}{row['updates_per_s']:>10}{row['p50_ms']:>10}"
+            f"{row['p95_ms']:>10}{row['p99_ms']:>10}{row['errors']:>8}{row['rejected']:>10}"
+        )
+    from src.services.user_cache import user_cache
+    stats = user_cache.stats()
+    print(f"\nuser profile cache: hit rate {stats['hit_rate']:.1%} "
+          f"(local {stats['local_hit']}, redis {stats['redis_hit']}, miss {stats['miss']}, stale {stats['stale']})")
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline load test for the Scholarino handler stack")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="scenario to run (repeatable; default: all)")
+    parser.add_argument("--users", type=int, default=200, help="virtual users per scenario")
+    parser.add_argument("--concurrency", type=int, default=50, help="virtual users running at the same time")
+    parser.add_argument("--openai-latency", type=float, default=800, help="mean OpenAI latency in ms")
+    parser.add_argument("--openai-error-rate", type=float, default=0.0, help="fraction of OpenAI calls that fail")
+    parser.add_argument("--sheets-latency", type=float, default=300, help="mean Google Sheets latency in ms")
+    parser.add_argument("--telegram-latency", type=float, default=40, help="mean Bot API latency in ms")
+    parser.add_argument("--db-latency", type=float, default=2, help="mean fake PostgreSQL latency in ms")
+    parser.add_argument("--redis-latency", type=float, default=0.3, help="mean fake Redis latency in ms")
+    parser.add_argument("--external", action="store_true",
+                        help="use OPENAI_BASE_URL, TELEGRAM_API_BASE_URL and SHEETS_API_URL (e.g. perf.fake_servers) "
+                             "instead of the in-process OpenAI, Sheets and Bot API fakes")
+    parser.add_argument("--database-url", help="use a real PostgreSQL instead of the in-process fake")
+    parser.add_argument("--redis-url", help="use a real Redis instead of the in-process fake")
+    parser.add_argument("--json", dest="json_path", help="also write the results as JSON to this file")
+    parser.add_argument("--log-level", default="WARNING", help="log level for the bot while the test runs")
+    return parser.parse_args(argv)
+
+async def run(args: argparse.Namespace) -> List[ScenarioResult]:
+    test = LoadTest(args)
+    await test.setup()
+    try:
+        return [await test.run_scenario(name) for name in args.scenario or list(SCENARIOS)]
+    finally:
+        await test.teardown()
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    if args.database_url:
+        # باید پیش از import تنظیمات ربات باشد تا get_db_cursor واقعی به این پایگاه وصل شود
+        os.environ["DATABASE_URL"] = args.database_url
+    results = asyncio.run(run(args))
+    print_report(results)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump([result.summary() for result in results], f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -45,5 +45,79 @@ PORT = int(os.getenv("PORT", 8080))
 WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "scholarino-secret")
 ADMIN_CHAT_ID = os.getenv("ADMIN_CHAT_ID")
 
-# بررسی متغیرهای محیطی
-validate_env_vars()
+# زمان‌بندی آپدیت‌ها: مسیر سریع (callback و دستورات) و مسیر کند (OpenAI و صوت)
+FAST_LANE_CONCURRENCY = int(os.getenv("FAST_LANE_CONCURRENCY", 32))
+FAST_LANE_QUEUE_SIZE = int(os.getenv("FAST_LANE_QUEUE_SIZE", 512))
+SLOW_LANE_CONCURRENCY = int(os.getenv("SLOW_LANE_CONCURRENCY", 8))
+SLOW_LANE_QUEUE_SIZE = int(os.getenv("SLOW_LANE_QUEUE_SIZE", 64))
+
+# ذخیره user_data و وضعیت مکالمه‌ها در Redis
+PERSISTENCE_NAMESPACE = os.getenv("PERSISTENCE_NAMESPACE", "scholarino")
+PERSISTENCE_FLUSH_INTERVAL = float(os.getenv("PERSISTENCE_FLUSH_INTERVAL", 5))
+
+# حذف آپدیت‌های تکراری webhook (redis برای چند replica، local برای تک replica)
+DEDUP_BACKEND = os.getenv("DEDUP_BACKEND", "redis")
+DEDUP_TTL = int(os.getenv("DEDUP_TTL", 3600))
+
+# حالت اجرا: single (یک پردازه) یا cluster (دریافت‌کننده + workerهای shard شده بر اساس کاربر)
+BOT_MODE = os.getenv("BOT_MODE", "single")
+WORKER_COUNT = int(os.getenv("WORKER_COUNT", os.cpu_count() or 1))
+WORKER_MAX_BACKLOG = int(os.getenv("WORKER_MAX_BACKLOG", 1000))
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", 0))
+
+# tracing: نمونه‌برداری، خروجی (file یا otlp) و آستانه لاگ درخواست‌های کند (ثانیه)
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "true").lower() == "true"
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 0.01))
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none")
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT")
+TRACE_SLOW_THRESHOLD = float(os.getenv("TRACE_SLOW_THRESHOLD", 5))
+
+# آدرس‌های جایگزین سرویس‌های خارجی (مثلاً سرورهای محلی perf/fake_servers.py برای تست کارایی)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL")
+SHEETS_API_URL = os.getenv("SHEETS_API_URL")
+
+# کش پروفایل کاربران: LRU درون‌پردازه‌ای (TTL کوتاه) با پشتوانه Redis مشترک بین replicaها (ثانیه)
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 30))
+USER_CACHE_REDIS_TTL = int(os.getenv("USER_CACHE_REDIS_TTL", 86400))
+
+# صف نوشتن با تأخیر (write-behind) برای محاسبات ISEE و سشن‌ها: اندازه دسته، فاصله flush و سقف backoff (ثانیه)
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", 200))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", 2))
+WRITE_BEHIND_MAX_BACKOFF = float(os.getenv("WRITE_BEHIND_MAX_BACKOFF", 60))
+
+# نگهداری جدول sessions: سشن‌های قدیمی‌تر از SESSION_RETENTION_DAYS روز هر SESSION_PURGE_INTERVAL ثانیه در دسته‌های کوچک حذف می‌شوند
+SESSION_RETENTION_DAYS = int(os.getenv("SESSION_RETENTION_DAYS", 180))
+SESSION_PURGE_INTERVAL = float(os.getenv("SESSION_PURGE_INTERVAL", 3600))
+SESSION_PURGE_BATCH_SIZE = int(os.getenv("SESSION_PURGE_BATCH_SIZE", 1000))
+
+# فاصله به‌روزرسانی ردیف‌های شیت بورسیه‌ها در ایندکس تطبیق بورسیه (ثانیه)
+SCHOLARSHIP_SHEET_REFRESH_INTERVAL = float(os.getenv("SCHOLARSHIP_SHEET_REFRESH_INTERVAL", 3600))
+
+# فاصله بررسی اعلام /reload_kb از پردازه‌های دیگر (ثانیه)
+CONTENT_RELOAD_POLL_INTERVAL = float(os.getenv("CONTENT_RELOAD_POLL_INTERVAL", 10))
+
+# بازه پیش‌فرض خلاصه منوی تقویم (روز)
+CALENDAR_UPCOMING_DAYS = int(os.getenv("CALENDAR_UPCOMING_DAYS", 14))
+
+# محدودیت ارسال تلگرام برای ارسال‌های گروهی: پیام در ثانیه برای کل ربات و حداقل فاصله پیام‌های یک چت (ثانیه)
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", 30))
+TELEGRAM_PER_CHAT_INTERVAL = float(os.getenv("TELEGRAM_PER_CHAT_INTERVAL", 1.0))
+
+# یادآوری رویدادها و مهلت‌ها: چند روز قبل (با کاما)، ساعت ارسال به وقت REMINDER_TIMEZONE، اندازه هر دسته ارسال
+# و حداکثر خواب زمان‌بند تا دیدن اشتراک‌های ثبت‌شده روی replicaهای دیگر (ثانیه)
+REMINDER_OFFSET_DAYS = tuple(int(days) for days in os.getenv("REMINDER_OFFSET_DAYS", "7,1").split(",") if days.strip())
+REMINDER_HOUR = int(os.getenv("REMINDER_HOUR", 9))
+REMINDER_TIMEZONE = os.getenv("REMINDER_TIMEZONE", "Europe/Rome")
+REMINDER_BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", 100))
+REMINDER_MAX_SLEEP = float(os.getenv("REMINDER_MAX_SLEEP", 3600))
+
+# پیام همگانی ادمین: سقف سرعت خود broadcast (پیام در ثانیه، کمتر از سقف کلی تا پاسخ‌های عادی جا داشته باشند)،
+# تعداد کاربران هر دور خواندن از cursor، فاصله به‌روزرسانی پیام پیشرفت (ثانیه)، تلاش‌ها پس از 429 و نگهداری وضعیت (ثانیه)
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", 25))
+BROADCAST_FETCH_SIZE = int(os.getenv("BROADCAST_FETCH_SIZE", 500))
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", 5))
+BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", 3))
+BROADCAST_STATE_TTL = int(os.getenv("BROADCAST_STATE_TTL", 7 * 86400))
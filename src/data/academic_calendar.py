@@ -0,0 +1,264 @@
+import calendar
+import hashlib
+import re
+from bisect import bisect_left
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from src.config import logger
+from src.data.knowledge_base import CALENDAR_CATEGORY, get_knowledge_base, get_knowledge_base_version
+
+LANGUAGES = ('fa', 'en', 'it')
+# دامنه شناسه رویدادها در فایل ics (UIDها باید پایدار باشند تا تقویم کاربر رویدادها را تکراری نکند)
+ICS_UID_DOMAIN = "scholarino"
+DEADLINE_PREFIX = {'fa': "⏰ مهلت: ", 'en': "⏰ Deadline: ", 'it': "⏰ Scadenza: "}
+CALENDAR_NAME = {
+    'fa': "تقویم دانشگاه پروجا",
+    'en': "University of Perugia calendar",
+    'it': "Calendario Università di Perugia"
+}
+
+class CalendarEvent(NamedTuple):
+    uid: str
+    start: date
+    # روز پایانی (شامل)
+    end: date
+    title: Dict[str, str]
+    description: Dict[str, str]
+    # "event" یا "deadline"
+    kind: str
+
+# ---- تجزیه تاریخ‌های متن انگلیسی پایگاه دانش ----
+
+_MONTHS = {name.lower(): number for number, name in enumerate(calendar.month_name) if name}
+_MONTH = r"(January|February|March|April|May|June|July|August|September|October|November|December)"
+# الگوها به ترتیب از خاص به عام؛ هر کدام (تابع ساخت بازه، regex)
+_DATE_PATTERNS = [
+    # December 20, 2025 - January 6, 2026
+    (lambda m: (_date(m[3], m[1], m[2]), _date(m[6], m[4], m[5])),
+     re.compile(rf"{_MONTH} (\d{{1,2}}), (\d{{4}})\s*[-–]\s*{_MONTH} (\d{{1,2}}), (\d{{4}})")),
+    # October 1-15, 2025
+    (lambda m: (_date(m[4], m[1], m[2]), _date(m[4], m[1], m[3])),
+     re.compile(rf"{_MONTH} (\d{{1,2}})\s*[-–]\s*(\d{{1,2}}), (\d{{4}})")),
+    # January-February 2026
+    (lambda m: (_date(m[3], m[1], 1), _month_end(m[3], m[2])),
+     re.compile(rf"{_MONTH}\s*[-–]\s*{_MONTH} (\d{{4}})")),
+    # March 1, 2026
+    (lambda m: (_date(m[3], m[1], m[2]),) * 2,
+     re.compile(rf"{_MONTH} (\d{{1,2}}), (\d{{4}})")),
+    # May 2026
+    (lambda m: (_date(m[2], m[1], 1), _month_end(m[2], m[1])),
+     re.compile(rf"{_MONTH} (\d{{4}})")),
+]
+_TITLE = re.compile(r"\*\*(.+?)\*\*:?\s*")
+
+def _date(year: str, month: str, day) -> date:
+    return date(int(year), _MONTHS[month.lower()], int(day))
+
+def _month_end(year: str, month: str) -> date:
+    number = _MONTHS[month.lower()]
+    return date(int(year), number, calendar.monthrange(int(year), number)[1])
+
+def parse_date_range(text: str) -> Optional[Tuple[date, date]]:
+    """بازه تاریخ در ابتدای متن (مثلاً «October 1-15, 2025 - ...»)، یا None."""
+    for build, pattern in _DATE_PATTERNS:
+        match = pattern.match(text)
+        if match:
+            try:
+                start, end = build(match)
+            except ValueError:
+                return None
+            return (start, end) if start <= end else (end, start)
+    return None
+
+def _split_line(line: str) -> Tuple[str, str]:
+    """(عنوان داخل **...**، بقیه خط) برای یک خط محتوای تقویم."""
+    match = _TITLE.search(line)
+    if not match:
+        return "", line.strip()
+    return match.group(1).strip(), line[match.end():].strip()
+
+def _calendar_lines(item: Dict) -> Iterator[Tuple[int, Dict[str, List[str]]]]:
+    sections = item.get('subsections') or [item]
+    for index, section in enumerate(sections):
+        content = section.get('content')
+        if isinstance(content, dict):
+            yield index, content
+
+def event_uid(item_id: str, title_en: str, start: date) -> str:
+    """
+    شناسه پایدار رویداد از محتوای آن (عنوان انگلیسی و تاریخ شروع)، نه از جایگاه خط؛ افزودن یا جابه‌جایی
+    خطوط دیگر شناسه را عوض نمی‌کند و اشتراک‌های یادآوری و UIDهای ics معتبر می‌مانند.
+    """
+    digest = hashlib.sha1(f"{title_en.strip().casefold()}|{start.isoformat()}".encode('utf-8')).hexdigest()[:12]
+    return f"{item_id}-{digest}"
+
+def events_from_knowledge_base(knowledge_base: Dict) -> List[CalendarEvent]:
+    """
+    رویدادهای تاریخ‌دار: خطوط دسته تقویم (تاریخ از متن انگلیسی و عنوان هر زبان از همان خط در آن زبان)
+    و ددلاین بورسیه‌هایی که criteria.deadline دارند.
+    """
+    events = []
+    seen_uids: Dict[str, int] = {}
+    for item in knowledge_base.get(CALENDAR_CATEGORY, []):
+        item_id = item.get('id', 'calendar')
+        for _, content in _calendar_lines(item):
+            english = content.get('en', [])
+            for line_index, line in enumerate(english):
+                title_en, rest = _split_line(line)
+                dates = parse_date_range(rest)
+                if not title_en or dates is None:
+                    continue
+                titles, descriptions = {}, {}
+                for lang in LANGUAGES:
+                    lines = content.get(lang, [])
+                    localized = lines[line_index] if line_index < len(lines) else line
+                    title, description = _split_line(localized)
+                    titles[lang] = title or title_en
+                    descriptions[lang] = description
+                uid = event_uid(item_id, title_en, dates[0])
+                occurrences = seen_uids[uid] = seen_uids.get(uid, 0) + 1
+                if occurrences > 1:
+                    uid = f"{uid}-{occurrences}"
+                events.append(CalendarEvent(uid, dates[0], dates[1], titles, descriptions, "event"))
+
+    for category, items in knowledge_base.items():
+        if not isinstance(items, list):
+            continue
+        for item in items:
+            criteria = item.get('criteria') if isinstance(item, dict) else None
+            if not isinstance(criteria, dict) or not criteria.get('deadline'):
+                continue
+            try:
+                deadline = date.fromisoformat(str(criteria['deadline']))
+            except ValueError:
+                logger.warning(f"Invalid deadline for knowledge base item {item.get('id')}: {criteria['deadline']}")
+                continue
+            item_title = item.get('title', {})
+            titles = {
+                lang: DEADLINE_PREFIX[lang] + (item_title.get(lang) or item_title.get('en', ''))
+                for lang in LANGUAGES
+            }
+            descriptions = {lang: (item.get('description') or {}).get(lang, '') for lang in LANGUAGES}
+            events.append(CalendarEvent(
+                f"deadline-{item.get('id')}", deadline, deadline, titles, descriptions, "deadline"
+            ))
+    return events
+
+def event_key(uid: str) -> str:
+    """شناسه کوتاه و پایدار رویداد برای callback_data (محدودیت 64 بایتی تلگرام)."""
+    return hashlib.sha1(uid.encode('utf-8')).hexdigest()[:10]
+
+class CalendarIndex:
+    """
+    رویدادها مرتب بر اساس روز پایان؛ پرس‌وجوی بازه با bisect از اولین رویدادی شروع می‌شود که هنوز تمام نشده
+    و با رسیدن به رویدادهایی که بعد از بازه شروع می‌شوند فیلتر می‌شود. ددلاین‌ها جداگانه مرتب‌اند.
+    """
+
+    def __init__(self, events: List[CalendarEvent]):
+        self.events = sorted(events, key=lambda event: (event.start, event.end))
+        self._by_end = sorted(self.events, key=lambda event: event.end)
+        self._ends = [event.end for event in self._by_end]
+        self._deadlines = [event for event in self.events if event.kind == "deadline"]
+        self._deadline_dates = [event.start for event in self._deadlines]
+        self._by_uid = {event.uid: event for event in self.events}
+        self._by_key = {event_key(event.uid): event for event in self.events}
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def get(self, uid: str) -> Optional[CalendarEvent]:
+        return self._by_uid.get(uid)
+
+    def get_by_key(self, key: str) -> Optional[CalendarEvent]:
+        return self._by_key.get(key)
+
+    def between(self, start: date, end: date) -> List[CalendarEvent]:
+        """رویدادهایی که با بازه [start, end] هم‌پوشانی دارند، به ترتیب شروع."""
+        first = bisect_left(self._ends, start)
+        matches = [event for event in self._by_end[first:] if event.start <= end]
+        matches.sort(key=lambda event: (event.start, event.end))
+        return matches
+
+    def upcoming(self, today: date, days: int) -> List[CalendarEvent]:
+        return self.between(today, today + timedelta(days=days - 1))
+
+    def this_week(self, today: date) -> List[CalendarEvent]:
+        """رویدادهای هفته جاری (دوشنبه تا یکشنبه)."""
+        monday = today - timedelta(days=today.weekday())
+        return self.between(max(today, monday), monday + timedelta(days=6))
+
+    def next_deadlines(self, today: date, count: int = 1) -> List[CalendarEvent]:
+        first = bisect_left(self._deadline_dates, today)
+        return self._deadlines[first:first + count]
+
+@lru_cache(maxsize=2)
+def _calendar_index(version: str) -> CalendarIndex:
+    index = CalendarIndex(events_from_knowledge_base(get_knowledge_base()))
+    logger.info(f"Academic calendar indexed: {len(index)} dated events (knowledge base {version}).")
+    return index
+
+def get_calendar_index() -> CalendarIndex:
+    """ایندکس تقویم برای نسخه فعلی پایگاه دانش؛ فقط با تغییر پایگاه دانش دوباره ساخته می‌شود."""
+    return _calendar_index(get_knowledge_base_version())
+
+# ---- خروجی iCalendar ----
+
+def _ics_escape(text: str) -> str:
+    return (text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+def _ics_fold(line: str) -> str:
+    """شکستن خط به قطعه‌های حداکثر 75 بایتی (RFC 5545) بدون شکستن کاراکترهای چندبایتی."""
+    parts, current, size = [], [], 0
+    for char in line:
+        char_size = len(char.encode('utf-8'))
+        if size + char_size > 75:
+            parts.append("".join(current))
+            # خطوط ادامه با یک فاصله شروع می‌شوند که جزو طول است
+            current, size = [" "], 1
+        current.append(char)
+        size += char_size
+    parts.append("".join(current))
+    return "\r\n".join(parts)
+
+def build_ics(events: List[CalendarEvent], lang: str, stamp: Optional[datetime] = None) -> bytes:
+    stamp = (stamp or datetime.now(timezone.utc)).strftime("%Y%m%dT%H%M%SZ")
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:-//{ICS_UID_DOMAIN}//Academic calendar//{lang.upper()}",
+        "CALSCALE:GREGORIAN",
+        f"X-WR-CALNAME:{_ics_escape(CALENDAR_NAME.get(lang, CALENDAR_NAME['en']))}",
+    ]
+    for event in events:
+        lines += [
+            "BEGIN:VEVENT",
+            f"UID:{event.uid}@{ICS_UID_DOMAIN}",
+            f"DTSTAMP:{stamp}",
+            f"DTSTART;VALUE=DATE:{event.start.strftime('%Y%m%d')}",
+            # DTEND در رویدادهای تمام‌روز انحصاری است
+            f"DTEND;VALUE=DATE:{(event.end + timedelta(days=1)).strftime('%Y%m%d')}",
+            f"SUMMARY:{_ics_escape(event.title.get(lang) or event.title.get('en', ''))}",
+            f"DESCRIPTION:{_ics_escape(event.description.get(lang) or event.description.get('en', ''))}",
+            "END:VEVENT",
+        ]
+    lines.append("END:VCALENDAR")
+    return ("\r\n".join(_ics_fold(line) for line in lines) + "\r\n").encode('utf-8')
+
+@lru_cache(maxsize=8)
+def _calendar_ics(lang: str, version: str) -> bytes:
+    return build_ics(_calendar_index(version).events, lang)
+
+def get_calendar_ics(lang: str) -> bytes:
+    """فایل ics تقویم به زبان lang؛ برای هر زبان و نسخه پایگاه دانش یک بار ساخته می‌شود."""
+    return _calendar_ics(lang if lang in LANGUAGES else 'en', get_knowledge_base_version())
+
+def format_events(events: List[CalendarEvent], lang: str) -> str:
+    """فهرست متنی رویدادها (متن ساده، پیش از اسکیپ MarkdownV2)."""
+    lines = []
+    for event in events:
+        when = event.start.isoformat() if event.start == event.end else f"{event.start.isoformat()} → {event.end.isoformat()}"
+        lines.append(f"• {when}: {event.title.get(lang) or event.title.get('en', '')}")
+    return "\n".join(lines)
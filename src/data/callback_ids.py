@@ -0,0 +1,186 @@
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+from src.config import logger, PERSISTENCE_NAMESPACE
+from src.database import get_redis_client
+
+if TYPE_CHECKING:
+    import redis
+
+# نگاشت پایدار (دسته، آیتم) ← شناسه کوتاه base36؛ شناسه‌ها هرگز دوباره استفاده نمی‌شوند.
+# جدول اولیه commit شده؛ در زمان اجرا فقط خوانده می‌شود (توضیح CallbackIdRegistry)
+CALLBACK_IDS_FILE = Path(__file__).parent / 'callback_ids.json'
+# پیشوند callback آیتم‌های پایگاه دانش: «menu:i:<شناسه>»
+ITEM_CALLBACK_PREFIX = "menu:i:"
+# سقف طول callback_data در تلگرام (بایت UTF-8)
+CALLBACK_DATA_LIMIT = 64
+
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+_MISSING = object()
+
+def to_base36(number: int) -> str:
+    """تبدیل عدد نامنفی به رشته base36."""
+    if number == 0:
+        return "0"
+    digits = []
+    while number:
+        number, remainder = divmod(number, 36)
+        digits.append(_DIGITS[remainder])
+    return "".join(reversed(digits))
+
+def from_base36(code: str) -> int:
+    return int(code, 36)
+
+class CallbackIdRegistry:
+    """
+    جدول دوطرفه بین (دسته، آیتم) و شناسه کوتاه. شناسه‌ها هنگام بارگذاری پایگاه دانش به آیتم‌های جدید داده
+    می‌شوند و در Redis (مشترک بین workerها و replicaها و ماندگار پس از استقرار) نگه داشته می‌شوند تا پس از
+    reload و ری‌استارت، دکمه‌های پیام‌های قدیمی هم کار کنند:
+    - «{namespace}:callback_ids:next» شمارنده INCR برای شناسه بعدی؛
+    - «{namespace}:callback_ids:items» (دسته، آیتم) ← شناسه با HSETNX، تا از دو پردازه هم‌زمان فقط یکی برنده شود؛
+    - «{namespace}:callback_ids:codes» شناسه ← (دسته، آیتم)، پیش از HSETNX نوشته می‌شود تا هر شناسه‌ای که
+      منتشر می‌شود قابل decode باشد.
+    فایل JSON کنار کد فقط خوانده می‌شود: جدول اولیه‌ای است که در Redis خالی کپی می‌شود، و در نبود Redis
+    (اجرای محلی تک‌پردازه) شناسه‌های جدید فقط در حافظه می‌مانند.
+    """
+
+    def __init__(self, path: Path = CALLBACK_IDS_FILE, redis_client: Any = _MISSING,
+                 namespace: str = PERSISTENCE_NAMESPACE):
+        self.path = path
+        self._redis = redis_client
+        self._next_key = f"{namespace}:callback_ids:next"
+        self._items_key = f"{namespace}:callback_ids:items"
+        self._codes_key = f"{namespace}:callback_ids:codes"
+        self._by_code: Dict[str, Tuple[str, str]] = {}
+        self._by_item: Dict[Tuple[str, str], str] = {}
+        self._next_id = 1
+        self._loaded = False
+
+    @property
+    def redis(self) -> Optional["redis.Redis"]:
+        # اتصال Redis تا اولین استفاده ساخته نمی‌شود
+        if self._redis is _MISSING:
+            self._redis = get_redis_client()
+        return self._redis
+
+    @staticmethod
+    def _field(key: Tuple[str, str]) -> str:
+        return json.dumps(list(key), ensure_ascii=False, separators=(',', ':'))
+
+    def _remember(self, code: str, key: Tuple[str, str]) -> None:
+        self._by_code[code] = key
+        self._by_item.setdefault(key, code)
+
+    def _load(self) -> None:
+        self._loaded = True
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = {}
+        except (json.JSONDecodeError, OSError) as e:
+            logger.error(f"Error reading callback id table '{self.path.name}': {e}")
+            data = {}
+        for code, category, item_id in data.get('items', []):
+            self._remember(code, (category, item_id))
+        self._next_id = max(data.get('next_id', 1), 1)
+        if self.redis is None:
+            return
+        try:
+            self._seed_redis()
+            self._load_redis()
+        except Exception as e:
+            logger.error(f"Error loading callback id table from Redis, using '{self.path.name}': {e}")
+
+    def _seed_redis(self) -> None:
+        """کپی جدول فایل در Redis خالی (اولین استقرار) تا شناسه‌های منتشرشده قبلی معتبر بمانند."""
+        pipe = self.redis.pipeline(transaction=True)
+        for code, key in self._by_code.items():
+            pipe.hsetnx(self._codes_key, code, self._field(key))
+            pipe.hsetnx(self._items_key, self._field(key), code)
+        pipe.set(self._next_key, self._next_id - 1, nx=True)
+        pipe.execute()
+
+    def _load_redis(self) -> None:
+        for code, field in self.redis.hgetall(self._codes_key).items():
+            self._by_code[code] = tuple(json.loads(field))
+        # نگاشت آیتم ← شناسه از جدول items خوانده می‌شود تا همه پردازه‌ها شناسه برنده را به کار ببرند
+        for field, code in self.redis.hgetall(self._items_key).items():
+            self._by_item[tuple(json.loads(field))] = code
+
+    def _allocate(self, key: Tuple[str, str]) -> str:
+        if self.redis is None:
+            code = to_base36(self._next_id)
+            self._next_id += 1
+            return code
+        code = to_base36(self.redis.incr(self._next_key))
+        field = self._field(key)
+        self.redis.hset(self._codes_key, code, field)
+        if not self.redis.hsetnx(self._items_key, field, code):
+            # پردازه دیگری زودتر شناسه داده است؛ شناسه ما فقط در codes می‌ماند و همان آیتم را decode می‌کند
+            self._by_code[code] = key
+            code = self.redis.hget(self._items_key, field) or code
+        return code
+
+    def sync(self, knowledge_base: Dict) -> int:
+        """تخصیص شناسه به آیتم‌های جدید پایگاه دانش. خروجی: تعداد شناسه‌های جدید"""
+        if not self._loaded:
+            self._load()
+        elif self.redis is not None:
+            # شناسه‌هایی که پردازه‌های دیگر از بارگذاری قبلی داده‌اند
+            try:
+                self._load_redis()
+            except Exception as e:
+                logger.error(f"Error refreshing callback id table from Redis: {e}")
+        new_items: List[Tuple[str, str]] = sorted(
+            (category, str(item.get('id')))
+            for category, items in knowledge_base.items() if isinstance(items, list)
+            for item in items if isinstance(item, dict) and item.get('id')
+            if (category, str(item.get('id'))) not in self._by_item
+        )
+        assigned = 0
+        for key in new_items:
+            try:
+                code = self._allocate(key)
+            except Exception as e:
+                # آیتم بدون شناسه با شکل قدیمی callback کار می‌کند و در بارگذاری بعدی دوباره تلاش می‌شود
+                logger.error(f"Error assigning callback id to {key[0]}:{key[1]}: {e}")
+                continue
+            self._by_code[code] = key
+            self._by_item[key] = code
+            assigned += 1
+        if assigned:
+            logger.info(f"Assigned {assigned} new callback ids.")
+        return assigned
+
+    def encode(self, category: str, item_id: str) -> str:
+        """callback_data کوتاه برای یک آیتم؛ اگر شناسه‌ای نداشته باشد شکل قدیمی برگردانده می‌شود."""
+        if not self._loaded:
+            self._load()
+        code = self._by_item.get((category, item_id))
+        if code is None:
+            callback = f"menu:{category}:{item_id}"
+            if len(callback.encode('utf-8')) > CALLBACK_DATA_LIMIT:
+                logger.warning(f"Callback data for {category}:{item_id} exceeds {CALLBACK_DATA_LIMIT} bytes.")
+            return callback
+        return f"{ITEM_CALLBACK_PREFIX}{code}"
+
+    def decode(self, code: str) -> Optional[Tuple[str, str]]:
+        """(دسته، آیتم) متناظر با شناسه کوتاه، یا None."""
+        if not self._loaded:
+            self._load()
+        key = self._by_code.get(code)
+        if key is None and self.redis is not None:
+            # شناسه‌ای که پردازه دیگری پس از آخرین sync این پردازه داده است (نادر؛ فقط یک HGET)
+            try:
+                field = self.redis.hget(self._codes_key, code)
+            except Exception as e:
+                logger.error(f"Error looking up callback id '{code}' in Redis: {e}")
+                return None
+            if field is not None:
+                key = self._by_code[code] = tuple(json.loads(field))
+        return key
+
+callback_ids = CallbackIdRegistry()
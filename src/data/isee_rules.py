@@ -0,0 +1,153 @@
+import json
+from bisect import bisect_left
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from src.config import logger
+
+# قوانین ISEE به تفکیک سال تحصیلی؛ قوانین سال جدید با effective_from آینده از قبل اضافه می‌شوند
+ISEE_RULES_FILE = Path(__file__).parent / 'isee_rules.json'
+LANGUAGES = ('fa', 'en', 'it')
+
+class Tier(NamedTuple):
+    key: str
+    amount: int
+    status: Dict[str, str]
+    suggestion: Dict[str, str]
+
+class ISEERuleset:
+    """
+    قوانین یک سال تحصیلی، اعتبارسنجی‌شده و پیش‌پردازش‌شده: آستانه‌های ISEE هر سطح یک بار به آرایه مرتب
+    تبدیل می‌شوند و پیدا کردن سطح با جستجوی دودویی انجام می‌شود. داده نامعتبر با ValueError رد می‌شود.
+    """
+
+    def __init__(self, data: Dict):
+        try:
+            self.academic_year = str(data['academic_year'])
+            self.effective_from = date.fromisoformat(data['effective_from'])
+            self.limit = float(data['isee_limit'])
+            scales = {int(members): float(scale) for members, scale in data['family_scales'].items()}
+            self.extra_member_scale = float(data['extra_member_scale'])
+            self.value_per_sqm = float(data['property']['value_per_sqm'])
+            self.property_weight = float(data['property']['weight'])
+            tiers = data['tiers']
+            fractions = [float(tier['limit_fraction']) for tier in tiers]
+            self.tiers: Tuple[Tier, ...] = tuple(self._tier(tier) for tier in tiers)
+            self.not_eligible = self._tier(data['not_eligible'])
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid ISEE ruleset {data.get('academic_year', '?')!r}: {e!r}") from e
+
+        if self.limit <= 0:
+            raise ValueError(f"{self.academic_year}: isee_limit must be positive")
+        if sorted(scales) != list(range(1, len(scales) + 1)):
+            raise ValueError(f"{self.academic_year}: family_scales must cover 1..N without gaps")
+        # family_scales[i] مقیاس خانواده i نفره است (اندیس 0 استفاده نمی‌شود)
+        self.family_scales = (0.0,) + tuple(scales[members] for members in range(1, len(scales) + 1))
+        if any(b <= a for a, b in zip(self.family_scales[1:], self.family_scales[2:])) or self.family_scales[1] <= 0:
+            raise ValueError(f"{self.academic_year}: family_scales must be positive and increasing")
+        if not self.tiers:
+            raise ValueError(f"{self.academic_year}: at least one tier is required")
+        if any(b <= a for a, b in zip(fractions, fractions[1:])) or fractions[0] <= 0:
+            raise ValueError(f"{self.academic_year}: tier limit_fraction values must be positive and increasing")
+        # همان ضرب limit * fraction که مقایسه «ISEE <= آستانه» روی آن تعریف شده است
+        self.thresholds: List[float] = [self.limit * fraction for fraction in fractions]
+        self.fractions = tuple(fractions)
+
+    @staticmethod
+    def _tier(data: Dict) -> Tier:
+        missing = [lang for lang in LANGUAGES if lang not in data['status'] or lang not in data['suggestion']]
+        if missing:
+            raise ValueError(f"tier {data.get('key')!r} is missing translations for {missing}")
+        amount = int(data['amount'])
+        if amount < 0:
+            raise ValueError(f"tier {data.get('key')!r} has a negative amount")
+        return Tier(str(data['key']), amount, dict(data['status']), dict(data['suggestion']))
+
+    @property
+    def tier_keys(self) -> Tuple[str, ...]:
+        return tuple(tier.key for tier in self.tiers) + (self.not_eligible.key,)
+
+    def scale(self, family_members: int) -> float:
+        """مقیاس معادل خانواده؛ برای خانواده‌های بزرگ‌تر از جدول هر نفر extra_member_scale اضافه می‌شود."""
+        if family_members < 1:
+            raise ValueError("Number of family members must be at least 1")
+        largest = len(self.family_scales) - 1
+        if family_members <= largest:
+            return self.family_scales[family_members]
+        return self.family_scales[largest] + self.extra_member_scale * (family_members - largest)
+
+    def property_value(self, owner: bool, property_size: float) -> float:
+        return property_size * self.value_per_sqm * self.property_weight if owner else 0
+
+    def tier_index(self, isee_value: float) -> int:
+        """اندیس اولین سطحی که ISEE از آستانه آن بیشتر نیست؛ len(tiers) یعنی واجد شرایط نیست."""
+        return bisect_left(self.thresholds, isee_value)
+
+    def tier(self, isee_value: float) -> Tier:
+        index = self.tier_index(isee_value)
+        return self.tiers[index] if index < len(self.tiers) else self.not_eligible
+
+class ISEERules:
+    """
+    مجموعه قوانین همه سال‌ها. قانون فعال آخرین قانونی است که effective_from آن گذشته است، پس قوانین سال
+    جدید در روز شروعشان بدون ری‌استارت فعال می‌شوند. reload فایل را دوباره می‌خواند و اگر نامعتبر باشد
+    قوانین قبلی را نگه می‌دارد.
+    """
+
+    def __init__(self, path: Path = ISEE_RULES_FILE):
+        self.path = path
+        self._rulesets: List[ISEERuleset] = []
+        self._by_year: Dict[str, ISEERuleset] = {}
+        # (تاریخ محاسبه, قانون فعال در آن تاریخ)
+        self._active: Optional[Tuple[date, ISEERuleset]] = None
+
+    def _read(self) -> List[ISEERuleset]:
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        rulesets = sorted((ISEERuleset(item) for item in data.get('rulesets', [])), key=lambda r: r.effective_from)
+        if not rulesets:
+            raise ValueError(f"No ISEE rulesets in '{self.path.name}'")
+        years = [ruleset.academic_year for ruleset in rulesets]
+        if len(set(years)) != len(years):
+            raise ValueError(f"Duplicate academic years in '{self.path.name}'")
+        return rulesets
+
+    def reload(self) -> str:
+        """بارگذاری (مجدد) فایل قوانین. خروجی: سال تحصیلی قانون فعال. خطای فایل منتشر می‌شود."""
+        rulesets = self._read()
+        self._rulesets = rulesets
+        self._by_year = {ruleset.academic_year: ruleset for ruleset in rulesets}
+        self._active = None
+        active = self.current()
+        logger.info(f"ISEE rules loaded: {', '.join(self._by_year)} (active {active.academic_year}).")
+        return active.academic_year
+
+    def _ensure_loaded(self) -> None:
+        if not self._rulesets:
+            self.reload()
+
+    def current(self, today: Optional[date] = None) -> ISEERuleset:
+        """قانون فعال در تاریخ today (پیش‌فرض امروز)."""
+        self._ensure_loaded()
+        today = today or date.today()
+        if self._active is not None and self._active[0] == today:
+            return self._active[1]
+        eligible = [ruleset for ruleset in self._rulesets if ruleset.effective_from <= today]
+        # پیش از اولین effective_from قدیمی‌ترین قانون استفاده می‌شود
+        active = eligible[-1] if eligible else self._rulesets[0]
+        if self._active is not None and self._active[1] is not active:
+            logger.info(f"ISEE rules switched to academic year {active.academic_year}.")
+        self._active = (today, active)
+        return active
+
+    def for_year(self, academic_year: Optional[str]) -> Optional[ISEERuleset]:
+        self._ensure_loaded()
+        return self._by_year.get(academic_year) if academic_year else None
+
+    @property
+    def academic_years(self) -> Tuple[str, ...]:
+        self._ensure_loaded()
+        return tuple(self._by_year)
+
+isee_rules = ISEERules()
@@ -1,27 +1,42 @@
+import hashlib
 import json
 import logging
 import re
+from functools import lru_cache
 from pathlib import Path
 from typing import Tuple, List, Dict
 
 from src.config import logger
+from src.data.callback_ids import callback_ids
+from src.utils.message_splitter import PAGE_FOOTER_RESERVE, split_message
+from src.utils.tracing import span
 
 # مسیر فایل JSON پایگاه دانش
 BASE_DIR = Path(__file__).parent.parent
 KNOWLEDGE_FILE = BASE_DIR / 'data' / 'knowledge_base_v2.json'
 knowledge_base: Dict = {}
+# نام دسته‌های منو در فایل پایگاه دانش
+SCHOLARSHIP_CATEGORY = 'بورسیه و تقویم آموزشی'
+CALENDAR_CATEGORY = 'راهنمای دانشجویی'
+# نسخه محتوا (هش فایل JSON)؛ کلید cache صفحه‌بندی محتوا
+knowledge_base_version: str = ""
 
 def load_knowledge_base() -> None:
     """بارگذاری پایگاه دانش از فایل JSON."""
-    global knowledge_base
+    global knowledge_base, knowledge_base_version
     try:
-        with open(KNOWLEDGE_FILE, 'r', encoding='utf-8') as f:
-            knowledge_base = json.load(f)
+        raw = KNOWLEDGE_FILE.read_bytes()
+        data = json.loads(raw.decode('utf-8'))
+        # فایل دسته‌ها را زیر کلید «knowledge_base» نگه می‌دارد
+        knowledge_base = data.get('knowledge_base', data) if isinstance(data, dict) else {}
+        knowledge_base_version = hashlib.sha1(raw).hexdigest()[:12]
+        callback_ids.sync(knowledge_base)
         logger.info(f"Knowledge base '{KNOWLEDGE_FILE.name}' loaded successfully.")
     except FileNotFoundError:
         logger.error(f"Knowledge base file '{KNOWLEDGE_FILE.name}' not found.")
         # ایجاد فایل JSON خالی به‌عنوان پیش‌فرض
         knowledge_base = {"categories": []}
+        knowledge_base_version = "empty"
         with open(KNOWLEDGE_FILE, 'w', encoding='utf-8') as f:
             json.dump(knowledge_base, f, ensure_ascii=False, indent=2)
         logger.info(f"Created an empty knowledge base at '{KNOWLEDGE_FILE.name}'.")
@@ -35,11 +50,45 @@ def get_knowledge_base() -> Dict:
         load_knowledge_base()
     return knowledge_base
 
+def reload_knowledge_base() -> str:
+    """
+    بارگذاری مجدد فایل پایگاه دانش بدون ری‌استارت. cacheهای وابسته (صفحه‌بندی محتوا، کیبوردها)
+    به نسخه محتوا کلید خورده‌اند و با تغییر نسخه دوباره ساخته می‌شوند. خروجی: نسخه جدید
+    """
+    previous_version = knowledge_base_version
+    load_knowledge_base()
+    if knowledge_base_version != previous_version:
+        _content_pages.cache_clear()
+        logger.info(f"Knowledge base reloaded: {previous_version or '-'} -> {knowledge_base_version}")
+    return knowledge_base_version
+
+def get_knowledge_base_version() -> str:
+    """نسخه فعلی محتوای پایگاه دانش."""
+    get_knowledge_base()
+    return knowledge_base_version
+
+def get_content_pages(path_parts: List[str], lang: str = 'fa') -> Tuple[Tuple[str, ...], str | None]:
+    """
+    محتوای یک آیتم، شکسته‌شده به صفحه‌هایی که هر کدام پس از اسکیپ در یک پیام تلگرام جا می‌شوند.
+    تقسیم‌بندی برای هر نسخه محتوا فقط یک بار محاسبه می‌شود.
+    """
+    return _content_pages(tuple(path_parts), lang, get_knowledge_base_version())
+
+@lru_cache(maxsize=512)
+def _content_pages(path_parts: Tuple[str, ...], lang: str, version: str) -> Tuple[Tuple[str, ...], str | None]:
+    # version فقط بخشی از کلید cache است تا پس از بارگذاری مجدد صفحه‌بندی قدیمی برنگردد
+    content, file_path = get_content_by_path(list(path_parts), lang)
+    return tuple(split_message(content, reserve=PAGE_FOOTER_RESERVE)), file_path
+
 def get_content_by_path(path_parts: List[str], lang: str = 'fa') -> Tuple[str, str | None]:
     """
     بازیابی و فرمت‌بندی محتوا از پایگاه دانش بر اساس مسیر.
     خروجی: (محتوای فرمت‌شده, مسیر فایل برای ارسال)
     """
+    with span("render_content", path=":".join(path_parts or [])):
+        return _render_content(path_parts, lang)
+
+def _render_content(path_parts: List[str], lang: str) -> Tuple[str, str | None]:
     kb = get_knowledge_base()
     if not path_parts or len(path_parts) < 2:
         return "No content found.", None
@@ -112,16 +161,21 @@ def search_knowledge_base(query: str, lang: str = 'fa') -> List[Dict]:
             if query in title or query in description:
                 results.append({
                     "title": item.get('title', {}).get(lang, item.get('title', {}).get('en', 'No Title')),
-                    "callback": f"menu:{category_name}:{item.get('id', '')}"
+                    "path": [category_name, item.get('id', '')],
+                    "callback": callback_ids.encode(category_name, item.get('id', ''))
                 })
             # جستجو در زیربخش‌ها
             for subsection in subsections:
                 sub_title = subsection.get('title', {}).get(lang, subsection.get('title', {}).get('en', '')).lower()
-                sub_content = subsection.get('content', {}).get(lang, subsection.get('content', {}).get('en', [])).lower()
-                if query in sub_title or (isinstance(sub_content, str) and query in sub_content):
+                sub_content = subsection.get('content', {}).get(lang, subsection.get('content', {}).get('en', []))
+                if isinstance(sub_content, list):
+                    sub_content = "\n".join(sub_content)
+                sub_content = sub_content.lower()
+                if query in sub_title or query in sub_content:
                     results.append({
                         "title": item.get('title', {}).get(lang, item.get('title', {}).get('en', 'No Title')),
-                        "callback": f"menu:{category_name}:{item.get('id', '')}"
+                        "path": [category_name, item.get('id', '')],
+                        "callback": callback_ids.encode(category_name, item.get('id', ''))
                     })
                     break
 
@@ -134,6 +188,3 @@ def search_knowledge_base(query: str, lang: str = 'fa') -> List[Dict]:
             unique_results.append(result)
 
     return unique_results
-
-# بارگذاری اولیه پایگاه دانش
-load_knowledge_base()
@@ -1,21 +1,32 @@
 import logging
 from contextlib import contextmanager
-from typing import Optional
-import psycopg2
-import redis
+from typing import Optional, TYPE_CHECKING
 from tenacity import retry, stop_after_attempt, wait_exponential
 
 from src.config import logger, DATABASE_URL, REDIS_URL
+from src.utils.metrics import track_dependency
+from src.utils.tracing import traced_sleep
 
-def get_redis_client() -> Optional[redis.Redis]:
-    """ایجاد یا بازگشت کلاینت Redis با مدیریت خطا."""
+if TYPE_CHECKING:
+    import redis
+
+# psycopg2 و redis تا اولین استفاده import نمی‌شوند تا راه‌اندازی سرد سریع‌تر باشد
+redis_client = None
+
+def get_redis_client() -> Optional["redis.Redis"]:
+    """بازگشت کلاینت مشترک Redis؛ اتصال در اولین فراخوانی ساخته و بررسی می‌شود."""
+    global redis_client
+    if redis_client is not None:
+        return redis_client
     if not REDIS_URL:
         logger.warning("REDIS_URL is not set. Redis features will be disabled.")
         return None
+    import redis
     try:
         client = redis.from_url(REDIS_URL, decode_responses=True, ssl_cert_reqs=None)
         client.ping()
         logger.info("Successfully connected to Redis.")
+        redis_client = client
         return client
     except redis.exceptions.ConnectionError as e:
         logger.error(f"Could not connect to Redis: {e}")
@@ -24,8 +35,6 @@ def get_redis_client() -> Optional[redis.Redis]:
         logger.error(f"Unexpected error while connecting to Redis: {e}")
         return None
 
-redis_client = None
-
 @contextmanager
 def get_db_cursor(commit: bool = True):
     """Context manager برای مدیریت اتصال و تراکنش‌های PostgreSQL."""
@@ -33,15 +42,20 @@ def get_db_cursor(commit: bool = True):
         logger.critical("DATABASE_URL is not set. Cannot connect to PostgreSQL.")
         raise ValueError("DATABASE_URL is missing.")
 
+    import psycopg2
+
     conn = None
     cursor = None
     try:
-        conn = psycopg2.connect(DATABASE_URL)
+        with track_dependency("postgres", "connect"):
+            conn = psycopg2.connect(DATABASE_URL)
         cursor = conn.cursor()
         logger.debug("Database connection established.")
         yield cursor
         if commit:
-            conn.commit()
+            # فقط commit زمان‌گیری می‌شود؛ کار و خطاهای فراخواننده (که خودشان track می‌کنند) شمرده نمی‌شوند
+            with track_dependency("postgres", "commit"):
+                conn.commit()
             logger.debug("Database transaction committed.")
     except psycopg2.DatabaseError as e:
         logger.error(f"Database error: {e}")
@@ -59,58 +73,54 @@ def get_db_cursor(commit: bool = True):
             conn.close()
         logger.debug("Database connection closed.")
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-def setup_database():
-    """ایجاد جداول موردنیاز در پایگاه داده اگر وجود نداشته باشند."""
-    users_table_sql = """
-    CREATE TABLE IF NOT EXISTS users (
-        telegram_id BIGINT PRIMARY KEY,
-        first_name VARCHAR(255) NOT NULL,
-        last_name VARCHAR(255) NOT NULL,
-        age INTEGER CHECK (age >= 10 AND age <= 90),
-        email VARCHAR(255) NOT NULL,
-        language VARCHAR(5) DEFAULT 'en',
-        score INTEGER DEFAULT 0,
-        registration_date TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-    );
-    CREATE INDEX IF NOT EXISTS idx_users_telegram_id ON users(telegram_id);
+@contextmanager
+def get_server_cursor(name: str, itersize: int = 1000):
     """
-    isee_table_sql = """
-    CREATE TABLE IF NOT EXISTS isee_calculations (
-        id SERIAL PRIMARY KEY,
-        user_id BIGINT REFERENCES users(telegram_id) ON DELETE CASCADE,
-        isee_value FLOAT NOT NULL,
-        calculation_date TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-    );
-    CREATE INDEX IF NOT EXISTS idx_isee_user_id ON isee_calculations(user_id);
+    cursor سمت سرور (named cursor) برای خواندن جریانی جدول‌های بزرگ؛ ردیف‌ها دسته‌ای با fetchmany از سرور
+    خوانده می‌شوند و کل نتیجه در حافظه بارگذاری نمی‌شود. تراکنش فقط‌خواندنی است و commit نمی‌شود.
     """
-    sessions_table_sql = """
-    CREATE TABLE IF NOT EXISTS sessions (
-        id SERIAL PRIMARY KEY,
-        session_id VARCHAR(255) UNIQUE,
-        user_id BIGINT REFERENCES users(telegram_id) ON DELETE CASCADE,
-        data JSONB NOT NULL,
-        created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-    );
-    CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions(user_id);
+    if not DATABASE_URL:
+        logger.critical("DATABASE_URL is not set. Cannot connect to PostgreSQL.")
+        raise ValueError("DATABASE_URL is missing.")
+
+    import psycopg2
+
+    conn = None
+    cursor = None
+    try:
+        with track_dependency("postgres", "connect"):
+            conn = psycopg2.connect(DATABASE_URL)
+        cursor = conn.cursor(name=name)
+        cursor.itersize = itersize
+        yield cursor
+    finally:
+        if cursor:
+            try:
+                cursor.close()
+            except Exception as e:
+                logger.debug(f"Error closing server-side cursor {name}: {e}")
+        if conn:
+            conn.rollback()
+            conn.close()
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10), sleep=traced_sleep)
+def setup_database():
+    """
+    به‌روزرسانی طرح پایگاه داده با مهاجرت‌های نسخه‌دار (src/migrations.py).
+    اگر طرح به‌روز باشد فقط نسخه آن خوانده می‌شود و هیچ DDLای اجرا نمی‌شود.
     """
+    from src.migrations import migrate
     try:
-        with get_db_cursor() as cursor:
-            cursor.execute(users_table_sql)
-            cursor.execute(isee_table_sql)
-            cursor.execute(sessions_table_sql)
-        logger.info("Database tables and indexes checked/created successfully.")
+        migrate()
     except Exception as e:
-        logger.error(f"Failed to set up database tables: {e}")
+        logger.error(f"Failed to migrate database schema: {e}")
         raise
 
 def initialize_connections():
     """مقداردهی اولیه اتصال‌های پایگاه داده و Redis."""
-    global redis_client
     try:
         setup_database()
-        redis_client = get_redis_client()
-        if redis_client is None:
+        if get_redis_client() is None:
             logger.warning("Redis client not initialized. Some features may not work.")
     except Exception as e:
         logger.critical(f"Failed to initialize connections: {e}")
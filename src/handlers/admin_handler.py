@@ -0,0 +1,231 @@
+import asyncio
+import io
+import time
+from telegram import Update
+from telegram.ext import ContextTypes
+from src.config import logger, ADMIN_CHAT_ID, CONTENT_RELOAD_POLL_INTERVAL
+from src.services.profiler_service import profile_event_loop, memory_tracker
+from src.data.knowledge_base import get_knowledge_base_version, reload_knowledge_base
+from src.data.isee_rules import isee_rules
+from src.services.content_reload import content_reload
+
+MAX_PROFILE_SECONDS = 300
+# زیردستورهای /broadcast؛ اولین آرگومان همیشه با این‌ها مقایسه می‌شود، هر تعداد آرگومان که باشد
+BROADCAST_SUBCOMMANDS = frozenset({"status", "cancel", "resume", "confirm"})
+# broadcast آماده‌شده تا این مدت (ثانیه) منتظر /broadcast confirm می‌ماند
+PENDING_BROADCAST_TTL = 600
+
+def is_admin(update: Update) -> bool:
+    """بررسی اینکه پیام از چت ادمین (ADMIN_CHAT_ID) آمده باشد."""
+    if not ADMIN_CHAT_ID or not update.effective_chat:
+        return False
+    allowed = str(ADMIN_CHAT_ID)
+    return str(update.effective_chat.id) == allowed or (
+        update.effective_user is not None and str(update.effective_user.id) == allowed
+    )
+
+async def _reject(update: Update) -> None:
+    logger.warning(f"Unauthorized admin command from user {update.effective_user.id if update.effective_user else None}")
+
+async def profile_cpu_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """دستور /profile_cpu [ثانیه]: پروفایل آماری حلقه رویداد و ارسال نتیجه."""
+    if not is_admin(update):
+        return await _reject(update)
+    try:
+        seconds = float(context.args[0]) if context.args else 30.0
+    except ValueError:
+        await update.message.reply_text("Usage: /profile_cpu [seconds]")
+        return
+    seconds = max(1.0, min(seconds, MAX_PROFILE_SECONDS))
+    await update.message.reply_text(f"⏱ Profiling the event loop for {seconds:.0f}s...")
+
+    async def run_profile() -> None:
+        try:
+            profiler = await profile_event_loop(seconds)
+            collapsed = io.BytesIO(profiler.collapsed().encode("utf-8"))
+            collapsed.name = "profile.collapsed.txt"
+            await update.message.reply_document(document=collapsed, caption="Collapsed stacks (flamegraph.pl / speedscope)")
+            await update.message.reply_text(profiler.summary())
+        except Exception as e:
+            logger.error(f"Error running CPU profile: {e}")
+            await update.message.reply_text(f"❌ Profiling failed: {e}")
+
+    # اجرای پروفایل در پس‌زمینه تا handler ظرفیت مسیر سریع را در این مدت اشغال نکند
+    context.application.create_task(run_profile(), update=update)
+
+async def memory_diff_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """دستور /memdiff [stop]: شروع tracemalloc یا گزارش رشد حافظه از snapshot قبلی."""
+    if not is_admin(update):
+        return await _reject(update)
+    if context.args and context.args[0] == "stop":
+        memory_tracker.stop()
+        await update.message.reply_text("tracemalloc stopped.")
+        return
+    if not memory_tracker.active:
+        memory_tracker.start()
+        await update.message.reply_text("📸 tracemalloc started and baseline snapshot taken. Run /memdiff again later to see growth.")
+        return
+    await update.message.reply_text(memory_tracker.diff())
+
+async def reload_knowledge_base_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """دستور /reload_kb: بارگذاری مجدد پایگاه دانش و قوانین ISEE؛ کیبوردها و صفحه‌بندی‌ها با نسخه جدید دوباره ساخته می‌شوند."""
+    if not is_admin(update):
+        return await _reject(update)
+    previous_version = get_knowledge_base_version()
+    try:
+        version = reload_knowledge_base()
+    except Exception as e:
+        logger.error(f"Error reloading knowledge base: {e}")
+        await update.message.reply_text(f"❌ Reload failed, keeping version {previous_version}: {e}")
+        return
+    if version == previous_version:
+        await update.message.reply_text(f"Knowledge base unchanged (version {version}).")
+    else:
+        await update.message.reply_text(f"✅ Knowledge base reloaded: {previous_version} → {version}")
+    # قوانین ISEE سال جدید با همین دستور منتشر می‌شوند؛ فایل نامعتبر قوانین فعلی را تغییر نمی‌دهد
+    try:
+        academic_year = isee_rules.reload()
+        await update.message.reply_text(
+            f"✅ ISEE rules reloaded: {', '.join(isee_rules.academic_years)} (active {academic_year})"
+        )
+    except Exception as e:
+        logger.error(f"Error reloading ISEE rules: {e}")
+        await update.message.reply_text(f"❌ ISEE rules reload failed, keeping current rules: {e}")
+    # پردازه‌های دیگر (workerهای cluster) در دور بعدی content_reload_job همین فایل‌ها را بارگذاری می‌کنند
+    if await content_reload.announce():
+        await update.message.reply_text(
+            f"📣 Reload announced to other processes (within {CONTENT_RELOAD_POLL_INTERVAL:g}s)."
+        )
+
+# سقف اندازه فایل CSV دستور /isee_batch (بایت)
+MAX_BATCH_CSV_BYTES = 2 * 1024 * 1024
+
+async def isee_batch_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    دستور /isee_batch: محاسبه ISEE برای یک cohort. در پاسخ به پیامی که فایل CSV دارد ارسال شود و فایل نتایج
+    برگردانده می‌شود. «/isee_batch thresholds <اعضای خانواده> [متراژ ملک]» مرز درآمد هر سطح بورسیه را گزارش می‌کند.
+    """
+    if not is_admin(update):
+        return await _reject(update)
+    # numpy فقط برای این دستور لازم است و در راه‌اندازی ربات import نمی‌شود
+    from src.services.isee_batch import calculate_csv, format_thresholds, income_thresholds, CSV_COLUMNS
+    rules = isee_rules.current()
+
+    if context.args and context.args[0] == "thresholds":
+        try:
+            family_members = int(context.args[1])
+            property_size = float(context.args[2]) if len(context.args) > 2 else 0
+        except (IndexError, ValueError):
+            await update.message.reply_text("Usage: /isee_batch thresholds <family_members> [owned_sqm]")
+            return
+        thresholds = income_thresholds(family_members, property_size > 0, property_size, rules)
+        await update.message.reply_text(
+            f"Income boundaries ({rules.academic_year}) for {family_members} family members"
+            f"{f' owning {property_size:g} sqm' if property_size > 0 else ''}:\n{format_thresholds(thresholds)}"
+        )
+        return
+
+    replied = update.message.reply_to_message
+    document = replied.document if replied else None
+    if document is None:
+        await update.message.reply_text(
+            f"Reply to a CSV file with /isee_batch. Columns: {', '.join(CSV_COLUMNS)}"
+        )
+        return
+    if document.file_size and document.file_size > MAX_BATCH_CSV_BYTES:
+        await update.message.reply_text(f"❌ File too large (max {MAX_BATCH_CSV_BYTES // 1024} KB).")
+        return
+    try:
+        telegram_file = await context.bot.get_file(document.file_id)
+        content = bytes(await telegram_file.download_as_bytearray()).decode("utf-8-sig")
+        output, counts = calculate_csv(content, rules)
+    except (ValueError, UnicodeDecodeError) as e:
+        await update.message.reply_text(f"❌ Invalid CSV: {e}")
+        return
+    except Exception as e:
+        logger.error(f"Error running ISEE batch: {e}")
+        await update.message.reply_text(f"❌ Batch calculation failed: {e}")
+        return
+    results = io.BytesIO(output.encode("utf-8"))
+    results.name = "isee_results.csv"
+    summary = ", ".join(f"{key}: {count}" for key, count in counts.items())
+    await update.message.reply_document(document=results, caption=f"✅ {sum(counts.values())} families ({rules.academic_year}) — {summary}")
+
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    دستور /broadcast <متن>: آماده‌سازی پیام برای همه کاربران؛ در پاسخ به یک پیام، همان پیام (با رسانه) کپی
+    می‌شود. ارسال فقط پس از «/broadcast confirm» شروع می‌شود. «/broadcast status»، «/broadcast cancel» و
+    «/broadcast resume» وضعیت broadcast فعال را مدیریت می‌کنند.
+    """
+    if not is_admin(update):
+        return await _reject(update)
+    from src.services.broadcast import broadcast_engine, count_remaining, format_progress
+    if broadcast_engine.redis is None:
+        await update.message.reply_text("❌ Broadcast requires Redis for progress tracking.")
+        return
+    subcommand = context.args[0].lower() if context.args and context.args[0].lower() in BROADCAST_SUBCOMMANDS else None
+
+    if subcommand == "status":
+        broadcast_id = await asyncio.to_thread(broadcast_engine.active_id)
+        state = await asyncio.to_thread(broadcast_engine.load, broadcast_id) if broadcast_id else None
+        await update.message.reply_text(format_progress(state) if state else "No active broadcast.")
+        return
+    if subcommand == "cancel":
+        if context.user_data.pop('pending_broadcast', None) is not None:
+            await update.message.reply_text("🗑 Pending broadcast discarded.")
+            return
+        broadcast_id = await asyncio.to_thread(broadcast_engine.cancel)
+        await update.message.reply_text(f"🛑 Broadcast {broadcast_id} cancelled." if broadcast_id else "No active broadcast.")
+        return
+    if subcommand == "resume":
+        broadcast_id = await asyncio.to_thread(broadcast_engine.active_id)
+        if not broadcast_id:
+            await update.message.reply_text("No active broadcast.")
+        elif broadcast_engine.running:
+            await update.message.reply_text(f"Broadcast {broadcast_id} is already running.")
+        else:
+            broadcast_engine.start(context.application, broadcast_id)
+            await update.message.reply_text(f"▶️ Resuming broadcast {broadcast_id}.")
+        return
+    if subcommand == "confirm":
+        pending = context.user_data.pop('pending_broadcast', None)
+        if not pending or time.time() - pending.get('prepared_at', 0) > PENDING_BROADCAST_TTL:
+            await update.message.reply_text("Nothing to confirm. Prepare a broadcast with /broadcast <text> first.")
+            return
+        try:
+            broadcast_id = await asyncio.to_thread(
+                broadcast_engine.create, update.effective_chat.id, text=pending.get('text'),
+                from_chat_id=pending.get('from_chat_id'), message_id=pending.get('message_id'),
+            )
+        except RuntimeError as e:
+            await update.message.reply_text(f"❌ {e} Use /broadcast status or /broadcast cancel.")
+            return
+        broadcast_engine.start(context.application, broadcast_id)
+        await update.message.reply_text(f"📣 Broadcast {broadcast_id} started.")
+        return
+
+    replied = update.message.reply_to_message
+    parts = (update.message.text or "").split(maxsplit=1)
+    text = parts[1].strip() if len(parts) > 1 else ""
+    if not text and replied is None:
+        await update.message.reply_text(
+            "Usage: /broadcast <text>, reply to a message with /broadcast, or /broadcast status|cancel|resume|confirm"
+        )
+        return
+    if text:
+        pending = {'text': text}
+        preview = f"Text:\n{text}"
+    else:
+        pending = {'from_chat_id': replied.chat_id, 'message_id': replied.message_id}
+        preview = f"A copy of message {replied.message_id}."
+    try:
+        recipients = await asyncio.to_thread(count_remaining, 0)
+    except Exception as e:
+        logger.error(f"Error counting broadcast recipients: {e}")
+        await update.message.reply_text(f"❌ Could not count recipients: {e}")
+        return
+    context.user_data['pending_broadcast'] = {**pending, 'prepared_at': time.time()}
+    await update.message.reply_text(
+        f"📣 Broadcast prepared for {recipients} users.\n\n{preview}\n\n"
+        f"Send /broadcast confirm within {PENDING_BROADCAST_TTL // 60} minutes to start, or /broadcast cancel to discard."
+    )
@@ -1,13 +1,42 @@
+import asyncio
 import logging
+from datetime import date
 from telegram import Update
 from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler
-from src.config import logger
-from src.utils.keyboard_builder import get_main_menu_keyboard, get_item_keyboard
+from src.config import logger, CALENDAR_UPCOMING_DAYS
+from src.utils.keyboard_builder import (
+    get_main_menu_keyboard,
+    get_language_keyboard,
+    get_category_keyboard,
+    get_calendar_keyboard,
+    get_reminder_keyboard,
+    get_back_keyboard,
+)
 from src.utils.text_formatter import sanitize_markdown
 from src.services.openai_service import get_ai_response
 from src.services.google_sheets_service import append_qa_to_sheet
-from src.data.knowledge_base import get_knowledge_base, get_content_by_path
+from src.services.reminders import reminder_scheduler
+from src.services.user_cache import user_cache
+from src.data.academic_calendar import format_events, get_calendar_ics, get_calendar_index
+from src.data.callback_ids import callback_ids
+from src.data.knowledge_base import get_knowledge_base, get_content_pages, SCHOLARSHIP_CATEGORY, CALENDAR_CATEGORY
+from src.utils.message_splitter import send_text_chunks
+from src.utils.paginator import Paginator
+from src.utils.metrics import instrument_handler
 
+def _menu_branch(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
+    """نام شاخه منو برای متریک‌ها؛ همه آیتم‌های محتوا زیر یک برچسب «item» جمع می‌شوند."""
+    branch = update.callback_query.data.replace("menu:", "", 1)
+    if branch.startswith("r:"):
+        return "reminder_toggle"
+    return branch if branch in MENU_ROUTES else "item"
+
+def _action_branch(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
+    """نام اکشن برای متریک‌ها؛ callback_data ناشناخته از کاربر زیر «other» جمع می‌شود."""
+    action = update.callback_query.data.replace("action:", "", 1)
+    return action if action in ACTION_ROUTES else "other"
+
+@instrument_handler("main_menu_command")
 async def main_menu_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """نمایش منوی اصلی."""
     from src.handlers.user_manager import MAIN_MENU
@@ -33,6 +62,7 @@ async def main_menu_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         )
     return MAIN_MENU
 
+@instrument_handler("help_command")
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """نمایش راهنما."""
     from src.handlers.user_manager import MAIN_MENU
@@ -94,144 +124,328 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
         )
     return MAIN_MENU
 
+@instrument_handler("handle_menu_callback", branch=_menu_branch)
 async def handle_menu_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """مدیریت انتخاب منو."""
-    from src.handlers.user_manager import SELECTING_LANG, MAIN_MENU
+    """مدیریت انتخاب منو؛ مسیریابی با یک جستجوی دیکشنری روی بخش بعد از «menu:»."""
+    from src.handlers.user_manager import MAIN_MENU
     query = update.callback_query
     await query.answer()
     lang = context.user_data.get('language', 'fa')
 
-    if query.data == "menu:main_menu":
-        return await main_menu_command(update, context)
-    elif query.data == "menu:change_language":
-        messages = {
-            'fa': "لطفاً زبان موردنظر خود را انتخاب کنید:",
-            'en': "Please select your preferred language:",
-            'it': "Seleziona la lingua preferita:"
-        }
-        buttons = [
-            [InlineKeyboardButton("فارسی 🇮🇷", callback_data="lang:fa"),
-             InlineKeyboardButton("English 🇬🇧", callback_data="lang:en"),
-             InlineKeyboardButton("Italiano 🇮🇹", callback_data="lang:it")]
-        ]
-        try:
-            await query.message.edit_text(
-                sanitize_markdown(messages.get(lang, messages['fa'])),
-                parse_mode='MarkdownV2',
-                reply_markup=InlineKeyboardMarkup(buttons)
-            )
-        except Exception as e:
-            logger.error(f"Error handling menu callback: {e}")
-            await query.message.edit_text(
-                sanitize_markdown("خطایی رخ داد. لطفاً دوباره امتحان کنید." if lang == 'fa' else
-                                "An error occurred. Please try again." if lang == 'en' else
-                                "Si è verificato un errore. Riprova."),
-                parse_mode='MarkdownV2'
-            )
-        return SELECTING_LANG
-    elif query.data == "menu:scholarships":
-        kb = get_knowledge_base()
-        scholarships = kb.get('بورسیه و تقویم آموزشی', [])
-        if not scholarships:
-            messages = {
-                'fa': "❌ اطلاعاتی درباره بورسیه‌ها یافت نشد.",
-                'en': "❌ No scholarship information found.",
-                'it': "❌ Nessuna informazione sulle borse di studio trovata."
-            }
-            await query.message.edit_text(
-                sanitize_markdown(messages.get(lang, messages['fa'])),
-                parse_mode='MarkdownV2',
-                reply_markup=get_main_menu_keyboard(lang)
-            )
-            return MAIN_MENU
-        items = [{'title': item.get('title', {}).get(lang, item.get('title', {}).get('en', '')), 'callback': f"menu:بورسیه و تقویم آموزشی:{item.get('id', '')}"} for item in scholarships]
+    route = query.data[len("menu:"):]
+    handler = MENU_ROUTES.get(route)
+    if handler is not None:
+        return await handler(update, context, lang)
+
+    prefix, separator, rest = route.partition(":")
+    if prefix == "r":
+        return await _toggle_reminder(update, context, lang, rest)
+    # «menu:i:<شناسه>» از جدول شناسه‌ها خوانده می‌شود؛ شکل قدیمی «menu:<دسته>:<آیتم>» هم برای پیام‌های قبلی پذیرفته می‌شود
+    path = callback_ids.decode(rest) if prefix == "i" else (prefix, rest) if separator else None
+    if not path or path[0] not in get_knowledge_base():
+        logger.warning(f"Unknown menu callback from user {query.from_user.id}: {query.data}")
+        return MAIN_MENU
+    return await _show_content_item(update, context, lang, list(path))
+
+async def _show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, lang: str) -> int:
+    return await main_menu_command(update, context)
+
+async def _show_change_language(update: Update, context: ContextTypes.DEFAULT_TYPE, lang: str) -> int:
+    from src.handlers.user_manager import SELECTING_LANG
+    query = update.callback_query
+    messages = {
+        'fa': "لطفاً زبان موردنظر خود را انتخاب کنید:",
+        'en': "Please select your preferred language:",
+        'it': "Seleziona la lingua preferita:"
+    }
+    try:
         await query.message.edit_text(
-            sanitize_markdown("لطفاً یک بورسیه را انتخاب کنید:" if lang == 'fa' else
-                            "Please select a scholarship:" if lang == 'en' else
-                            "Seleziona una borsa di studio:"),
+            sanitize_markdown(messages.get(lang, messages['fa'])),
+            parse_mode='MarkdownV2',
+            reply_markup=get_language_keyboard()
+        )
+    except Exception as e:
+        logger.error(f"Error handling menu callback: {e}")
+        await query.message.edit_text(
+            sanitize_markdown("خطایی رخ داد. لطفاً دوباره امتحان کنید." if lang == 'fa' else
+                            "An error occurred. Please try again." if lang == 'en' else
+                            "Si è verificato un errore. Riprova."),
+            parse_mode='MarkdownV2'
+        )
+    return SELECTING_LANG
+
+async def _show_category(update: Update, lang: str, category: str, prompts: dict, empty_messages: dict) -> int:
+    """نمایش فهرست آیتم‌های یک دسته از knowledge base با کیبورد از پیش ساخته‌شده."""
+    from src.handlers.user_manager import MAIN_MENU
+    query = update.callback_query
+    if not get_knowledge_base().get(category):
+        await query.message.edit_text(
+            sanitize_markdown(empty_messages.get(lang, empty_messages['fa'])),
             parse_mode='MarkdownV2',
-            reply_markup=get_item_keyboard(items, lang)
+            reply_markup=get_main_menu_keyboard(lang)
         )
         return MAIN_MENU
-    elif query.data == "menu:calendar":
-        kb = get_knowledge_base()
-        calendar = kb.get('تقویم تحصیلی', [])
-        if not calendar:
-            messages = {
+    await query.message.edit_text(
+        sanitize_markdown(prompts.get(lang, prompts['fa'])),
+        parse_mode='MarkdownV2',
+        reply_markup=get_category_keyboard(category, lang)
+    )
+    return MAIN_MENU
+
+async def _show_scholarships(update: Update, context: ContextTypes.DEFAULT_TYPE, lang: str) -> int:
+    return await _show_category(
+        update, lang, SCHOLARSHIP_CATEGORY,
+        prompts={
+            'fa': "لطفاً یک بورسیه را انتخاب کنید:",
+            'en': "Please select a scholarship:",
+            'it': "Seleziona una borsa di studio:"
+        },
+        empty_messages={
+            'fa': "❌ اطلاعاتی درباره بورسیه‌ها یافت نشد.",
+            'en': "❌ No scholarship information found.",
+            'it': "❌ Nessuna informazione sulle borse di studio trovata."
+        }
+    )
+
+async def _show_calendar(update: Update, context: ContextTypes.DEFAULT_TYPE, lang: str) -> int:
+    """خلاصه تقویم: رویدادهای CALENDAR_UPCOMING_DAYS روز آینده و نزدیک‌ترین مهلت، با دکمه‌های پرس‌وجو."""
+    from src.handlers.user_manager import MAIN_MENU
+    query = update.callback_query
+    index = get_calendar_index()
+    if not len(index):
+        return await _show_category(
+            update, lang, CALENDAR_CATEGORY,
+            prompts={
+                'fa': "لطفاً یک تقویم را انتخاب کنید:",
+                'en': "Please select a calendar:",
+                'it': "Seleziona un calendario:"
+            },
+            empty_messages={
                 'fa': "❌ اطلاعاتی درباره تقویم تحصیلی یافت نشد.",
                 'en': "❌ No academic calendar information found.",
                 'it': "❌ Nessuna informazione sul calendario accademico trovata."
             }
-            await query.message.edit_text(
-                sanitize_markdown(messages.get(lang, messages['fa'])),
-                parse_mode='MarkdownV2',
-                reply_markup=get_main_menu_keyboard(lang)
-            )
-            return MAIN_MENU
-        items = [{'title': item.get('title', {}).get(lang, item.get('title', {}).get('en', '')), 'callback': f"menu:تقویم تحصیلی:{item.get('id', '')}"} for item in calendar]
+        )
+    today = date.today()
+    headers = {
+        'fa': f"📅 رویدادهای {CALENDAR_UPCOMING_DAYS} روز آینده:",
+        'en': f"📅 Events in the next {CALENDAR_UPCOMING_DAYS} days:",
+        'it': f"📅 Eventi nei prossimi {CALENDAR_UPCOMING_DAYS} giorni:"
+    }
+    text = _calendar_text(index.upcoming(today, CALENDAR_UPCOMING_DAYS), lang, headers)
+    deadlines = index.next_deadlines(today)
+    if deadlines:
+        text += "\n\n" + _calendar_text(deadlines, lang, NEXT_DEADLINE_HEADERS)
+    await query.message.edit_text(
+        sanitize_markdown(text),
+        parse_mode='MarkdownV2',
+        reply_markup=get_calendar_keyboard(CALENDAR_CATEGORY, lang)
+    )
+    return MAIN_MENU
+
+NEXT_DEADLINE_HEADERS = {
+    'fa': "⏰ نزدیک‌ترین مهلت:",
+    'en': "⏰ Next deadline:",
+    'it': "⏰ Prossima scadenza:"
+}
+
+def _calendar_text(events: list, lang: str, headers: dict) -> str:
+    empty = {
+        'fa': "رویدادی در این بازه نیست.",
+        'en': "No events in this period.",
+        'it': "Nessun evento in questo periodo."
+    }
+    body = format_events(events, lang) if events else empty.get(lang, empty['fa'])
+    return f"{headers.get(lang, headers['fa'])}\n{body}"
+
+async def _show_calendar_events(update: Update, lang: str, events: list, headers: dict) -> int:
+    from src.handlers.user_manager import MAIN_MENU
+    await update.callback_query.message.edit_text(
+        sanitize_markdown(_calendar_text(events, lang, headers)),
+        parse_mode='MarkdownV2',
+        reply_markup=get_back_keyboard(lang, "menu:calendar")
+    )
+    return MAIN_MENU
+
+async def _show_calendar_week(update: Update, context: ContextTypes.DEFAULT_TYPE, lang: str) -> int:
+    return await _show_calendar_events(update, lang, get_calendar_index().this_week(date.today()), {
+        'fa': "🗓 رویدادهای این هفته:",
+        'en': "🗓 This week:",
+        'it': "🗓 Questa settimana:"
+    })
+
+async def _show_calendar_month(update: Update, context: ContextTypes.DEFAULT_TYPE, lang: str) -> int:
+    return await _show_calendar_events(update, lang, get_calendar_index().upcoming(date.today(), 30), {
+        'fa': "📆 رویدادهای ۳۰ روز آینده:",
+        'en': "📆 Next 30 days:",
+        'it': "📆 Prossimi 30 giorni:"
+    })
+
+async def _show_next_deadline(update: Update, context: ContextTypes.DEFAULT_TYPE, lang: str) -> int:
+    return await _show_calendar_events(update, lang, get_calendar_index().next_deadlines(date.today()),
+                                       NEXT_DEADLINE_HEADERS)
+
+async def _send_calendar_ics(update: Update, context: ContextTypes.DEFAULT_TYPE, lang: str) -> int:
+    """ارسال فایل ics تقویم؛ فایل برای هر زبان فقط با تغییر پایگاه دانش دوباره ساخته می‌شود."""
+    from src.handlers.user_manager import MAIN_MENU
+    query = update.callback_query
+    try:
+        await query.message.reply_document(document=get_calendar_ics(lang), filename=f"perugia_calendar_{lang}.ics")
+    except Exception as e:
+        logger.error(f"Error sending calendar file for user {query.from_user.id}: {e}")
+    return MAIN_MENU
+
+async def _show_weather(update: Update, context: ContextTypes.DEFAULT_TYPE, lang: str) -> int:
+    from src.handlers.user_manager import MAIN_MENU
+    query = update.callback_query
+    messages = {
+        'fa': "در حال دریافت وضعیت آب‌وهوا...",
+        'en': "Fetching weather information...",
+        'it': "Recupero delle informazioni meteo..."
+    }
+    await query.message.edit_text(
+        sanitize_markdown(messages.get(lang, messages['fa'])),
+        parse_mode='MarkdownV2'
+    )
+    try:
+        weather_response = await get_ai_response("Current weather in Perugia, Italy", lang)
+        await send_text_chunks(query.message, weather_response, reply_markup=get_main_menu_keyboard(lang), edit=True)
+    except Exception as e:
+        logger.error(f"Error fetching weather for user {query.from_user.id}: {e}")
+        messages = {
+            'fa': "❌ خطایی در دریافت آب‌وهوا رخ داد.",
+            'en': "❌ An error occurred while fetching weather.",
+            'it': "❌ Si è verificato un errore durante il recupero del meteo."
+        }
         await query.message.edit_text(
-            sanitize_markdown("لطفاً یک تقویم را انتخاب کنید:" if lang == 'fa' else
-                            "Please select a calendar:" if lang == 'en' else
-                            "Seleziona un calendario:"),
+            sanitize_markdown(messages.get(lang, messages['fa'])),
             parse_mode='MarkdownV2',
-            reply_markup=get_item_keyboard(items, lang)
+            reply_markup=get_main_menu_keyboard(lang)
         )
-        return MAIN_MENU
-    elif query.data == "menu:weather":
+    return MAIN_MENU
+
+async def _show_profile(update: Update, context: ContextTypes.DEFAULT_TYPE, lang: str) -> int:
+    from src.handlers.user_manager import show_profile_command
+    return await show_profile_command(update, context)
+
+async def _show_help(update: Update, context: ContextTypes.DEFAULT_TYPE, lang: str) -> int:
+    return await help_command(update, context)
+
+REMINDER_MENU_LIMIT = 8
+
+async def _show_reminders(update: Update, context: ContextTypes.DEFAULT_TYPE, lang: str,
+                          notice: str = "") -> int:
+    """فهرست رویدادهای آینده با دکمه فعال/غیرفعال کردن یادآوری هر کدام."""
+    from src.handlers.user_manager import MAIN_MENU
+    query = update.callback_query
+    user_id = query.from_user.id
+    if not user_cache.get_profile(user_id):
         messages = {
-            'fa': "در حال دریافت وضعیت آب‌وهوا...",
-            'en': "Fetching weather information...",
-            'it': "Recupero delle informazioni meteo..."
+            'fa': "❌ برای دریافت یادآوری ابتدا با /start ثبت‌نام کنید.",
+            'en': "❌ Please register with /start to receive reminders.",
+            'it': "❌ Registrati con /start per ricevere promemoria."
         }
         await query.message.edit_text(
             sanitize_markdown(messages.get(lang, messages['fa'])),
-            parse_mode='MarkdownV2'
+            parse_mode='MarkdownV2',
+            reply_markup=get_back_keyboard(lang, "menu:calendar")
         )
-        try:
-            weather_response = await get_ai_response("Current weather in Perugia, Italy", lang)
-            await query.message.edit_text(
-                sanitize_markdown(weather_response),
-                parse_mode='MarkdownV2',
-                reply_markup=get_main_menu_keyboard(lang)
-            )
-        except Exception as e:
-            logger.error(f"Error fetching weather for user {query.from_user.id}: {e}")
-            messages = {
-                'fa': "❌ خطایی در دریافت آب‌وهوا رخ داد.",
-                'en': "❌ An error occurred while fetching weather.",
-                'it': "❌ Si è verificato un errore durante il recupero del meteo."
-            }
-            await query.message.edit_text(
-                sanitize_markdown(messages.get(lang, messages['fa'])),
-                parse_mode='MarkdownV2',
-                reply_markup=get_main_menu_keyboard(lang)
-            )
         return MAIN_MENU
-    elif query.data == "menu:profile":
-        from src.handlers.user_manager import show_profile_command
-        return await show_profile_command(update, context)
-    elif query.data == "menu:help":
-        return await help_command(update, context)
-    elif query.data.startswith("menu:بورسیه و تقویم آموزشی:") or query.data.startswith("menu:تقویم تحصیلی:"):
-        path_parts = query.data.replace("menu:", "").split(":")
-        content, file_path = get_content_by_path(path_parts, lang)
+    events = get_calendar_index().between(date.today(), date.max)[:REMINDER_MENU_LIMIT]
+    messages = {
+        'fa': "🔔 برای دریافت یادآوری پیش از هر رویداد یا مهلت، آن را انتخاب کنید:",
+        'en': "🔔 Choose the events and deadlines you want to be reminded about:",
+        'it': "🔔 Scegli gli eventi e le scadenze di cui vuoi un promemoria:"
+    }
+    empty = {
+        'fa': "رویداد آینده‌ای برای یادآوری وجود ندارد.",
+        'en': "There are no upcoming events to be reminded about.",
+        'it': "Non ci sono eventi futuri per cui ricevere promemoria."
+    }
+    texts = messages if events else empty
+    text = texts.get(lang, texts['fa'])
+    subscribed = await asyncio.to_thread(reminder_scheduler.subscribed_uids, user_id)
+    await query.message.edit_text(
+        sanitize_markdown(f"{notice}\n\n{text}" if notice else text),
+        parse_mode='MarkdownV2',
+        reply_markup=get_reminder_keyboard(events, subscribed, lang)
+    )
+    return MAIN_MENU
+
+async def _toggle_reminder(update: Update, context: ContextTypes.DEFAULT_TYPE, lang: str, key: str) -> int:
+    from src.handlers.user_manager import MAIN_MENU
+    query = update.callback_query
+    event = get_calendar_index().get_by_key(key)
+    if event is None:
+        logger.warning(f"Unknown reminder callback from user {query.from_user.id}: {query.data}")
+        return await _show_reminders(update, context, lang)
+    try:
+        subscribed = await reminder_scheduler.toggle(query.from_user.id, event)
+    except Exception as e:
+        logger.error(f"Error toggling reminder {event.uid} for user {query.from_user.id}: {e}")
+        return MAIN_MENU
+    notices = {
+        'fa': ("✅ یادآوری فعال شد.", "🔕 یادآوری غیرفعال شد."),
+        'en': ("✅ Reminder enabled.", "🔕 Reminder disabled."),
+        'it': ("✅ Promemoria attivato.", "🔕 Promemoria disattivato.")
+    }
+    return await _show_reminders(update, context, lang, notices.get(lang, notices['fa'])[0 if subscribed else 1])
+
+async def _show_content_item(update: Update, context: ContextTypes.DEFAULT_TYPE, lang: str, path_parts: list) -> int:
+    from src.handlers.user_manager import MAIN_MENU
+    query = update.callback_query
+    pages, file_path = get_content_pages(path_parts, lang)
+    if len(pages) > 1:
+        # محتوای طولانی به‌جای کوتاه شدن، به‌صورت سشن صفحه‌بندی ثبت می‌شود
+        paginator = Paginator()
+        session_pages = paginator.content_pages(pages, file_path, query.data)
+        paginator.create_session(query.from_user.id, session_pages, 'content')
+        page_data = paginator._prepare_page({
+            'content': session_pages,
+            'type': 'content',
+            'current_page': 0,
+            'total_pages': len(session_pages)
+        })
+        await query.message.edit_text(
+            sanitize_markdown(paginator.format_page(page_data, lang)),
+            parse_mode='MarkdownV2',
+            reply_markup=paginator.get_pagination_markup(page_data, lang)
+        )
+    else:
         await query.message.edit_text(
-            sanitize_markdown(content),
+            sanitize_markdown(pages[0] if pages else ""),
             parse_mode='MarkdownV2',
             reply_markup=get_main_menu_keyboard(lang)
         )
-        if file_path:
-            try:
-                with open(file_path, 'rb') as f:
-                    if file_path.endswith(('.jpg', '.jpeg', '.png')):
-                        await query.message.reply_photo(photo=f)
-                    elif file_path.endswith('.pdf'):
-                        await query.message.reply_document(document=f)
-            except Exception as e:
-                logger.error(f"Error sending file {file_path} for user {query.from_user.id}: {e}")
-        return MAIN_MENU
+    if file_path:
+        try:
+            with open(file_path, 'rb') as f:
+                if file_path.endswith(('.jpg', '.jpeg', '.png')):
+                    await query.message.reply_photo(photo=f)
+                elif file_path.endswith('.pdf'):
+                    await query.message.reply_document(document=f)
+        except Exception as e:
+            logger.error(f"Error sending file {file_path} for user {query.from_user.id}: {e}")
     return MAIN_MENU
 
+# جدول مسیریابی «menu:<route>»؛ callbackهای آیتم («menu:i:<شناسه>») به _show_content_item و تغییر یادآوری
+# («menu:r:<کلید رویداد>») به _toggle_reminder می‌رسند
+MENU_ROUTES = {
+    "main_menu": _show_main_menu,
+    "change_language": _show_change_language,
+    "scholarships": _show_scholarships,
+    "calendar": _show_calendar,
+    "cal_week": _show_calendar_week,
+    "cal_month": _show_calendar_month,
+    "cal_next": _show_next_deadline,
+    "cal_ics": _send_calendar_ics,
+    "cal_remind": _show_reminders,
+    "weather": _show_weather,
+    "profile": _show_profile,
+    "help": _show_help,
+}
+
+@instrument_handler("handle_action_callback", branch=_action_branch)
 async def handle_action_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """مدیریت اقدامات انتخاب‌شده توسط کاربر."""
     from src.handlers.user_manager import MAIN_MENU
@@ -239,62 +453,54 @@ async def handle_action_callback(update: Update, context: ContextTypes.DEFAULT_T
     await query.answer()
     lang = context.user_data.get('language', 'fa')
 
-    action = query.data.replace("action:", "")
-    if action == "isee":
-        from src.services.isee_service import start_isee_calculation
-        return await start_isee_calculation(update, context)
-    elif action == "search":
-        messages = {
-            'fa': "لطفاً عبارت موردنظر برای جستجو را وارد کنید:",
-            'en': "Please enter the search query:",
-            'it': "Inserisci la query di ricerca:"
-        }
-        context.user_data['awaiting_search_query'] = True
-        try:
-            await query.message.edit_text(
-                sanitize_markdown(messages.get(lang, messages['fa'])),
-                parse_mode='MarkdownV2',
-                reply_markup=InlineKeyboardMarkup([[
-                    InlineKeyboardButton(
-                        "🔙 بازگشت" if lang == 'fa' else "🔙 Back" if lang == 'en' else "🔙 Indietro",
-                        callback_data="menu:main_menu"
-                    )
-                ]])
-            )
-        except Exception as e:
-            logger.error(f"Error prompting for search query: {e}")
-            await query.message.edit_text(
-                sanitize_markdown("خطایی رخ داد. لطفاً دوباره امتحان کنید." if lang == 'fa' else
-                                "An error occurred. Please try again." if lang == 'en' else
-                                "Si è verificato un errore. Riprova."),
-                parse_mode='MarkdownV2'
-            )
-        return MAIN_MENU
-    elif action == "contact_admin":
-        messages = {
-            'fa': "لطفاً پیام خود را برای ادمین بنویسید:",
-            'en': "Please write your message for the admin:",
-            'it': "Scrivi il tuo messaggio per l'admin:"
-        }
-        context.user_data['next_message_is_admin_contact'] = True
-        try:
-            await query.message.edit_text(
-                sanitize_markdown(messages.get(lang, messages['fa'])),
-                parse_mode='MarkdownV2',
-                reply_markup=InlineKeyboardMarkup([[
-                    InlineKeyboardButton(
-                        "🔙 بازگشت" if lang == 'fa' else "🔙 Back" if lang == 'en' else "🔙 Indietro",
-                        callback_data="menu:main_menu"
-                    )
-                ]])
-            )
-        except Exception as e:
-            logger.error(f"Error prompting for admin contact: {e}")
-            await query.message.edit_text(
-                sanitize_markdown("خطایی رخ داد. لطفاً دوباره امتحان کنید." if lang == 'fa' else
-                                "An error occurred. Please try again." if lang == 'en' else
-                                "Si è verificato un errore. Riprova."),
-                parse_mode='MarkdownV2'
-            )
+    handler = ACTION_ROUTES.get(query.data[len("action:"):])
+    if handler is None:
+        logger.warning(f"Unknown action callback from user {query.from_user.id}: {query.data}")
         return MAIN_MENU
+    return await handler(update, context, lang)
+
+async def _start_isee(update: Update, context: ContextTypes.DEFAULT_TYPE, lang: str) -> int:
+    from src.services.isee_service import start_isee_calculation
+    return await start_isee_calculation(update, context)
+
+async def _prompt_with_back(update: Update, lang: str, messages: dict, error_context: str) -> int:
+    """نمایش یک درخواست ورودی با دکمه بازگشت به منوی اصلی."""
+    from src.handlers.user_manager import MAIN_MENU
+    query = update.callback_query
+    try:
+        await query.message.edit_text(
+            sanitize_markdown(messages.get(lang, messages['fa'])),
+            parse_mode='MarkdownV2',
+            reply_markup=get_back_keyboard(lang)
+        )
+    except Exception as e:
+        logger.error(f"Error prompting for {error_context}: {e}")
+        await query.message.edit_text(
+            sanitize_markdown("خطایی رخ داد. لطفاً دوباره امتحان کنید." if lang == 'fa' else
+                            "An error occurred. Please try again." if lang == 'en' else
+                            "Si è verificato un errore. Riprova."),
+            parse_mode='MarkdownV2'
+        )
     return MAIN_MENU
+
+async def _start_search(update: Update, context: ContextTypes.DEFAULT_TYPE, lang: str) -> int:
+    context.user_data['awaiting_search_query'] = True
+    return await _prompt_with_back(update, lang, {
+        'fa': "لطفاً عبارت موردنظر برای جستجو را وارد کنید:",
+        'en': "Please enter the search query:",
+        'it': "Inserisci la query di ricerca:"
+    }, "search query")
+
+async def _start_contact_admin(update: Update, context: ContextTypes.DEFAULT_TYPE, lang: str) -> int:
+    context.user_data['next_message_is_admin_contact'] = True
+    return await _prompt_with_back(update, lang, {
+        'fa': "لطفاً پیام خود را برای ادمین بنویسید:",
+        'en': "Please write your message for the admin:",
+        'it': "Scrivi il tuo messaggio per l'admin:"
+    }, "admin contact")
+
+ACTION_ROUTES = {
+    "isee": _start_isee,
+    "search": _start_search,
+    "contact_admin": _start_contact_admin,
+}
@@ -1,5 +1,6 @@
 import logging
 from pathlib import Path
+from typing import Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from src.config import logger, ADMIN_CHAT_ID
@@ -7,11 +8,14 @@ from src.services.openai_service import get_ai_response, process_voice_message
 from src.services.google_sheets_service import append_qa_to_sheet
 from src.utils.keyboard_builder import get_main_menu_keyboard, get_item_keyboard
 from src.utils.text_formatter import sanitize_markdown
+from src.utils.message_splitter import send_text_chunks
 from src.utils.paginator import Paginator
 from src.services.search_engine import SearchEngine
+from src.utils.metrics import instrument_handler
 
-async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """مدیریت پیام‌های متنی کاربر."""
+@instrument_handler("handle_text_message")
+async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE, text: Optional[str] = None) -> int:
+    """مدیریت پیام‌های متنی کاربر؛ text برای متن رونویسی‌شده پیام صوتی است (Message تغییرناپذیر است)."""
     from src.handlers.user_manager import MAIN_MENU
     if 'language' not in context.user_data:
         await update.message.reply_text(
@@ -23,7 +27,7 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     user_id = update.effective_user.id
     lang = context.user_data.get('language', 'fa')
-    user_message = update.message.text.strip()
+    user_message = (text if text is not None else update.message.text).strip()
 
     # بررسی پیام برای تماس با ادمین
     if context.user_data.get('next_message_is_admin_contact', False):
@@ -75,12 +79,8 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
     try:
         ai_response = await get_ai_response(user_message, lang)
         if ai_response:
-            sanitized_response = sanitize_markdown(ai_response)
-            await update.message.reply_text(
-                sanitized_response,
-                parse_mode='MarkdownV2',
-                reply_markup=get_main_menu_keyboard(lang)
-            )
+            # پاسخ‌های طولانی به‌جای کوتاه شدن، در چند پیام پشت سر هم ارسال می‌شوند
+            await send_text_chunks(update.message, ai_response, reply_markup=get_main_menu_keyboard(lang))
             await append_qa_to_sheet(user_id, user_message, ai_response)
         else:
             error_text = {
@@ -108,6 +108,7 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     return MAIN_MENU
 
+@instrument_handler("handle_voice_message")
 async def handle_voice_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """مدیریت پیام‌های صوتی."""
     from src.handlers.user_manager import MAIN_MENU
@@ -122,6 +123,7 @@ async def handle_voice_message(update: Update, context: ContextTypes.DEFAULT_TYP
         )
         return MAIN_MENU
 
+    temp_voice_path = None
     try:
         voice_file = await context.bot.get_file(update.message.voice.file_id)
         temp_dir = Path("./temp_audio")
@@ -144,8 +146,7 @@ async def handle_voice_message(update: Update, context: ContextTypes.DEFAULT_TYP
                 parse_mode='MarkdownV2'
             )
 
-            update.message.text = transcribed_text
-            return await handle_text_message(update, context)
+            return await handle_text_message(update, context, text=transcribed_text)
         else:
             error_text = {
                 'fa': "متأسفم، نتوانستم پیام صوتی شما را پردازش کنم.",
@@ -4,27 +4,28 @@ from telegram import Update
 from telegram.ext import ContextTypes, ConversationHandler
 
 from src.database import get_db_cursor
+from src.services.user_cache import user_cache
 from src.utils.keyboard_builder import get_language_keyboard, get_main_menu_keyboard
 from src.config import logger
+from src.utils.metrics import instrument_handler
 
 # حالات مکالمه
 SELECTING_LANG, ASKING_FIRST_NAME, ASKING_LAST_NAME, ASKING_AGE, ASKING_EMAIL, MAIN_MENU = range(6)
 
+@instrument_handler("start")
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """شروع مکالمه و درخواست انتخاب زبان."""
     user_id = update.effective_user.id
 
-    # بررسی وجود کاربر در پایگاه داده
+    # بررسی وجود کاربر (از cache پروفایل، در صورت نبود از پایگاه داده)
     try:
-        with get_db_cursor() as cursor:
-            cursor.execute("SELECT language FROM users WHERE telegram_id = %s", (user_id,))
-            user_record = cursor.fetchone()
+        profile = user_cache.get_profile(user_id)
     except Exception as e:
         logger.error(f"Error checking user {user_id} in database: {e}")
-        user_record = None
+        profile = None
 
-    if user_record:
-        lang = user_record[0]
+    if profile:
+        lang = profile['language'] or 'fa'
         context.user_data['language'] = lang
         welcome_back_text = {
             'fa': "سلام مجدد! به منوی اصلی خوش آمدید.",
@@ -56,6 +57,24 @@ async def select_language(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     lang = query.data.split(":")[1]
     context.user_data['language'] = lang
+    user_id = update.effective_user.id
+
+    # کاربر ثبت‌نام‌شده (تغییر زبان از منو): فقط زبان ذخیره می‌شود و ثبت‌نام تکرار نمی‌شود
+    try:
+        profile = user_cache.get_profile(user_id)
+        if profile:
+            user_cache.update_language(user_id, lang)
+    except Exception as e:
+        logger.error(f"Error updating language for user {user_id}: {e}")
+        profile = None
+    if profile:
+        changed_text = {
+            'fa': "✅ زبان به فارسی تغییر کرد.",
+            'en': "✅ Language changed to English.",
+            'it': "✅ Lingua cambiata in italiano."
+        }
+        await query.edit_message_text(text=changed_text.get(lang), reply_markup=get_main_menu_keyboard(lang))
+        return MAIN_MENU
 
     prompt_text = {
         'fa': "عالی! برای شروع، لطفاً نام خود را وارد کنید:",
@@ -166,11 +185,22 @@ async def ask_email(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
                         last_name = EXCLUDED.last_name,
                         age = EXCLUDED.age,
                         email = EXCLUDED.email,
-                        language = EXCLUDED.language;
+                        language = EXCLUDED.language
+                    RETURNING score;
                     """,
                     (user_id, context.user_data['first_name'], context.user_data['last_name'],
                      context.user_data['age'], email, lang)
                 )
+                row = cursor.fetchone()
+            # پروفایل تازه در cache نوشته می‌شود تا /start و /profile بعدی به پایگاه داده نروند
+            user_cache.store_profile(user_id, {
+                'first_name': context.user_data['first_name'],
+                'last_name': context.user_data['last_name'],
+                'age': context.user_data['age'],
+                'email': email,
+                'language': lang,
+                'score': row[0] if row else 0
+            })
             logger.info(f"User {user_id} registered/updated successfully.")
             break
         except Exception as e:
@@ -201,18 +231,19 @@ async def show_profile_command(update: Update, context: ContextTypes.DEFAULT_TYP
     """مدیریت دستور /profile."""
     return await show_profile(update, context, is_command=True)
 
+@instrument_handler("show_profile")
 async def show_profile(update: Update, context: ContextTypes.DEFAULT_TYPE, is_command: bool = False) -> int:
     """نمایش اطلاعات پروفایل کاربر."""
     user_id = update.effective_user.id
     lang = context.user_data.get('language', 'fa')
 
     try:
-        with get_db_cursor() as cursor:
-            cursor.execute("SELECT first_name, last_name, age, email, score FROM users WHERE telegram_id = %s", (user_id,))
-            user_data = cursor.fetchone()
+        profile = user_cache.get_profile(user_id)
 
-        if user_data:
-            first_name, last_name, age, email, score = user_data
+        if profile:
+            first_name, last_name, age, email, score = (
+                profile['first_name'], profile['last_name'], profile['age'], profile['email'], profile['score']
+            )
             profile_text_map = {
                 'fa': f"👤 *پروفایل شما*\n\n*نام:* {first_name}\n*نام خانوادگی:* {last_name}\n*سن:* {age}\n*ایمیل:* {email}\n*امتیاز:* {score or 0} ✨",
                 'en': f"👤 *Your Profile*\n\n*First Name:* {first_name}\n*Last Name:* {last_name}\n*Age:* {age}\n*Email:* {email}\n*Score:* {score or 0} ✨",
@@ -0,0 +1,119 @@
+from typing import List, NamedTuple
+
+from src.config import logger
+from src.database import get_db_cursor
+
+# کلید قفل advisory پایگاه داده برای اجرای مهاجرت‌ها؛ فقط یک replica در هر لحظه مهاجرت‌ها را اجرا می‌کند
+MIGRATION_LOCK_KEY = 7_311_042_043
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    sql: str
+
+# مهاجرت‌ها به ترتیب نسخه؛ مهاجرت اعمال‌شده هرگز ویرایش نمی‌شود و تغییر بعدی یک نسخه جدید است
+MIGRATIONS: List[Migration] = [
+    Migration(1, "baseline: users, isee_calculations, sessions", """
+    CREATE TABLE IF NOT EXISTS users (
+        telegram_id BIGINT PRIMARY KEY,
+        first_name VARCHAR(255) NOT NULL,
+        last_name VARCHAR(255) NOT NULL,
+        age INTEGER CHECK (age >= 10 AND age <= 90),
+        email VARCHAR(255) NOT NULL,
+        language VARCHAR(5) DEFAULT 'en',
+        score INTEGER DEFAULT 0,
+        registration_date TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS isee_calculations (
+        id SERIAL PRIMARY KEY,
+        user_id BIGINT REFERENCES users(telegram_id) ON DELETE CASCADE,
+        isee_value FLOAT NOT NULL,
+        calculation_date TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_isee_user_id ON isee_calculations(user_id);
+    CREATE TABLE IF NOT EXISTS sessions (
+        id SERIAL PRIMARY KEY,
+        session_id VARCHAR(255) UNIQUE,
+        user_id BIGINT REFERENCES users(telegram_id) ON DELETE CASCADE,
+        data JSONB NOT NULL,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions(user_id);
+    """),
+    # telegram_id کلید اصلی است و ایندکس یکتای خودش را دارد؛ این ایندکس فقط هزینه نوشتن را دو برابر می‌کرد
+    Migration(2, "drop redundant idx_users_telegram_id", """
+    DROP INDEX IF EXISTS idx_users_telegram_id;
+    """),
+    # created_at تقریباً به ترتیب درج است؛ BRIN با چند صفحه کوچک بازه‌های قدیمی را برای purge پیدا می‌کند
+    Migration(3, "BRIN index on sessions.created_at for retention purges", """
+    CREATE INDEX IF NOT EXISTS idx_sessions_created_at ON sessions USING BRIN (created_at);
+    """),
+    # آخرین محاسبه هر کاربر (تطبیق بورسیه) بدون مرتب‌سازی؛ ایندکس تک‌ستونی قبلی پیشوند همین ایندکس است
+    Migration(4, "index isee_calculations by user and date", """
+    CREATE INDEX IF NOT EXISTS idx_isee_user_date ON isee_calculations(user_id, calculation_date DESC);
+    DROP INDEX IF EXISTS idx_isee_user_id;
+    """),
+    # اشتراک یادآوری رویدادهای تقویم؛ زمان‌بندی خود یادآوری‌ها در Redis است و از این جدول بازسازی می‌شود
+    Migration(5, "reminder subscriptions", """
+    CREATE TABLE IF NOT EXISTS reminder_subscriptions (
+        user_id BIGINT REFERENCES users(telegram_id) ON DELETE CASCADE,
+        event_uid VARCHAR(255) NOT NULL,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, event_uid)
+    );
+    """),
+    # کلید یکتای سمت کلاینت (session_id محاسبه) تا تکرار یک دسته write-behind (تحویل دست‌کم یک‌بار) سطر تکراری نسازد؛
+    # سطرهای قدیمی NULL می‌مانند و ایندکس یکتا چند NULL را مجاز می‌داند
+    Migration(6, "unique client key on isee_calculations", """
+    ALTER TABLE isee_calculations ADD COLUMN IF NOT EXISTS client_id VARCHAR(255);
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_isee_client_id ON isee_calculations(client_id);
+    """),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+SCHEMA_VERSION_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    description TEXT NOT NULL,
+    applied_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+def _read_version(cursor) -> int:
+    """نسخه فعلی طرح پایگاه داده؛ 0 اگر جدول schema_version هنوز ساخته نشده باشد."""
+    cursor.execute("SELECT to_regclass('schema_version') IS NOT NULL")
+    if not cursor.fetchone()[0]:
+        return 0
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return cursor.fetchone()[0]
+
+def get_schema_version() -> int:
+    with get_db_cursor(commit=False) as cursor:
+        return _read_version(cursor)
+
+def migrate() -> int:
+    """
+    اعمال مهاجرت‌های معوق. مسیر معمول (طرح به‌روز) فقط یک اتصال و یک یا دو SELECT است. در غیر این صورت
+    همه مهاجرت‌های معوق در یک تراکنش و زیر pg_advisory_xact_lock اجرا می‌شوند؛ replicaای که پشت قفل منتظر
+    مانده نسخه را دوباره می‌خواند و کار تکراری نمی‌کند. خروجی: تعداد مهاجرت‌های اعمال‌شده
+    """
+    if get_schema_version() >= LATEST_VERSION:
+        logger.info(f"Database schema is up to date (version {LATEST_VERSION}).")
+        return 0
+
+    with get_db_cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_KEY,))
+        cursor.execute(SCHEMA_VERSION_TABLE_SQL)
+        current = _read_version(cursor)
+        pending = [migration for migration in MIGRATIONS if migration.version > current]
+        for migration in pending:
+            logger.info(f"Applying database migration {migration.version}: {migration.description}")
+            cursor.execute(migration.sql)
+            cursor.execute(
+                "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                (migration.version, migration.description)
+            )
+    if pending:
+        logger.info(f"Database schema migrated from version {current} to {LATEST_VERSION}.")
+    return len(pending)
@@ -0,0 +1,350 @@
+import asyncio
+import time
+import uuid
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, TYPE_CHECKING
+
+from src.config import (
+    logger,
+    PERSISTENCE_NAMESPACE,
+    BROADCAST_FETCH_SIZE,
+    BROADCAST_MAX_RETRIES,
+    BROADCAST_PROGRESS_INTERVAL,
+    BROADCAST_RATE,
+    BROADCAST_STATE_TTL,
+)
+from src.database import get_db_cursor, get_redis_client, get_server_cursor
+from src.utils.metrics import Counter, track_dependency
+from src.utils.rate_limiter import SendRateLimiter, TokenBucket, retry_after_seconds, telegram_rate_limiter
+
+if TYPE_CHECKING:
+    import redis
+    from telegram import Bot
+    from telegram.ext import ContextTypes, JobQueue
+
+BROADCAST_MESSAGES = Counter("broadcast_messages_total", "Broadcast deliveries by outcome", labelnames=("outcome",))
+BROADCAST_MESSAGES.prealloc([("sent",), ("blocked",), ("failed",), ("retried",)])
+
+OUTCOMES = ("sent", "blocked", "failed")
+# قفل اجرای broadcast بین replicaها؛ پس از هر دسته تمدید می‌شود و پس از کرش منقضی می‌شود (ثانیه)
+LOCK_TTL = 300
+# تمدید و آزاد کردن قفل فقط توسط صاحب آن، به‌صورت اتمی (GET و سپس EXPIRE/DEL ممکن است قفل پردازه دیگری را بگیرد)
+EXTEND_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('expire', KEYS[1], ARGV[2]) end
+return 0
+"""
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end
+return 0
+"""
+
+_MISSING = object()
+
+RECIPIENTS_SQL = "SELECT telegram_id FROM users WHERE telegram_id > %s ORDER BY telegram_id"
+REMAINING_SQL = "SELECT COUNT(*) FROM users WHERE telegram_id > %s"
+
+class RecipientStream:
+    """شناسه کاربران به ترتیب telegram_id و بعد از after_id، با cursor سمت سرور. متدها blocking هستند."""
+
+    def __init__(self, after_id: int, fetch_size: int = BROADCAST_FETCH_SIZE):
+        self.after_id = after_id
+        self.fetch_size = fetch_size
+        self._stack = ExitStack()
+        self._cursor = None
+
+    def open(self) -> None:
+        self._cursor = self._stack.enter_context(get_server_cursor("broadcast_recipients", self.fetch_size))
+        with track_dependency("postgres", "broadcast"):
+            self._cursor.execute(RECIPIENTS_SQL, (self.after_id,))
+
+    def fetch(self) -> List[int]:
+        with track_dependency("postgres", "broadcast"):
+            return [row[0] for row in self._cursor.fetchmany(self.fetch_size)]
+
+    def close(self) -> None:
+        self._stack.close()
+
+def count_remaining(after_id: int) -> int:
+    with track_dependency("postgres", "broadcast"):
+        with get_db_cursor(commit=False) as cursor:
+            cursor.execute(REMAINING_SQL, (after_id,))
+            return cursor.fetchone()[0]
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    return f"{hours}:{rest // 60:02d}:{rest % 60:02d}" if hours else f"{rest // 60}:{rest % 60:02d}"
+
+def format_progress(state: Dict[str, Any], rate: Optional[float] = None) -> str:
+    """متن پیام پیشرفت (متن ساده) با توان عملیاتی و زمان باقی‌مانده تخمینی."""
+    done = sum(int(state.get(outcome, 0)) for outcome in OUTCOMES)
+    total = int(state.get('total', 0)) or done
+    percent = 100 * done / total if total else 100
+    lines = [
+        f"📣 Broadcast {state.get('id')} — {state.get('status')}",
+        f"{done}/{total} ({percent:.1f}%) · sent {state.get('sent', 0)} · blocked {state.get('blocked', 0)} "
+        f"· failed {state.get('failed', 0)}",
+    ]
+    if rate:
+        eta = max(0, total - done) / rate
+        lines.append(f"⚡ {rate:.1f} msg/s · ETA {_format_duration(eta)}")
+    return "\n".join(lines)
+
+class BroadcastEngine:
+    """
+    ارسال پیام ادمین به همه کاربران جدول users.
+
+    - گیرندگان با cursor سمت سرور و به ترتیب telegram_id خوانده می‌شوند (بدون بارگذاری کل جدول).
+    - هر ارسال از سطل توکن خود broadcast (BROADCAST_RATE) و محدودکننده مشترک ارسال (سقف کلی و فاصله هر چت)
+      می‌گذرد؛ پاسخ 429 همه ارسال‌ها را به مدت retry_after متوقف و همان گیرنده را دوباره امتحان می‌کند.
+    - وضعیت در Redis است: hash شمارنده‌ها و آخرین telegram_id دسته کامل‌شده، و set گیرندگان انجام‌شده که پس از
+      هر ارسال به‌روز می‌شود. broadcast قطع‌شده (کرش یا ری‌استارت) از آخرین دسته ادامه می‌یابد و گیرندگان
+      انجام‌شده همان دسته دوباره پیام نمی‌گیرند. یک قفل با TTL کوتاه اجرای هم‌زمان روی دو replica را مانع می‌شود.
+    - پیام پیشرفت در چت ادمین هر BROADCAST_PROGRESS_INTERVAL ثانیه با سرعت و زمان باقی‌مانده ویرایش می‌شود.
+    متدهای وضعیت blocking هستند؛ run و handlerها آن‌ها را با asyncio.to_thread صدا می‌زنند.
+    """
+
+    def __init__(self, redis_client: Any = _MISSING, limiter: SendRateLimiter = telegram_rate_limiter,
+                 rate: float = BROADCAST_RATE, fetch_size: int = BROADCAST_FETCH_SIZE,
+                 progress_interval: float = BROADCAST_PROGRESS_INTERVAL, max_retries: int = BROADCAST_MAX_RETRIES,
+                 state_ttl: int = BROADCAST_STATE_TTL, namespace: str = PERSISTENCE_NAMESPACE):
+        self._redis = redis_client
+        self.limiter = limiter
+        self.bucket = TokenBucket(rate)
+        self.fetch_size = fetch_size
+        self.progress_interval = progress_interval
+        self.max_retries = max_retries
+        self.state_ttl = state_ttl
+        self.namespace = namespace
+        self.active_key = f"{namespace}:broadcast:active"
+        self._lock_token = uuid.uuid4().hex
+        self._task: Optional[asyncio.Task] = None
+        self._outcomes = {outcome: BROADCAST_MESSAGES.labels(outcome) for outcome in OUTCOMES + ("retried",)}
+
+    @property
+    def redis(self) -> Optional["redis.Redis"]:
+        # اتصال Redis تا اولین استفاده ساخته نمی‌شود
+        if self._redis is _MISSING:
+            self._redis = get_redis_client()
+        return self._redis
+
+    def _key(self, broadcast_id: str) -> str:
+        return f"{self.namespace}:broadcast:{broadcast_id}"
+
+    def _done_key(self, broadcast_id: str) -> str:
+        return f"{self.namespace}:broadcast:{broadcast_id}:done"
+
+    def _lock_key(self, broadcast_id: str) -> str:
+        return f"{self.namespace}:broadcast:{broadcast_id}:lock"
+
+    # ---- وضعیت ----
+
+    def _client(self) -> "redis.Redis":
+        client = self.redis
+        if client is None:
+            raise RuntimeError("Broadcast requires Redis for progress tracking.")
+        return client
+
+    def active_id(self) -> Optional[str]:
+        return self._client().get(self.active_key)
+
+    def load(self, broadcast_id: str) -> Dict[str, Any]:
+        state = self._client().hgetall(self._key(broadcast_id))
+        return {**state, 'id': broadcast_id} if state else {}
+
+    def _update(self, broadcast_id: str, **fields) -> None:
+        self._client().hset(self._key(broadcast_id), mapping={key: str(value) for key, value in fields.items()})
+
+    def create(self, admin_chat_id: int, text: Optional[str] = None, from_chat_id: Optional[int] = None,
+               message_id: Optional[int] = None) -> str:
+        """ثبت broadcast جدید (متن یا کپی یک پیام). اگر broadcast دیگری فعال باشد RuntimeError."""
+        client = self._client()
+        broadcast_id = uuid.uuid4().hex[:8]
+        if not client.set(self.active_key, broadcast_id, nx=True):
+            raise RuntimeError(f"Broadcast {self.active_id()} is still active.")
+        fields = {
+            'status': "running", 'admin_chat_id': admin_chat_id, 'last_user_id': 0, 'total': 0,
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            **{outcome: 0 for outcome in OUTCOMES},
+        }
+        if text is not None:
+            fields['text'] = text
+        else:
+            fields.update(from_chat_id=from_chat_id, message_id=message_id)
+        self._update(broadcast_id, **fields)
+        return broadcast_id
+
+    def cancel(self) -> Optional[str]:
+        """لغو broadcast فعال؛ اجراکننده (روی هر replica) در دسته بعدی متوقف می‌شود."""
+        broadcast_id = self.active_id()
+        if broadcast_id:
+            self._update(broadcast_id, status="cancelled")
+            self._finish(broadcast_id)
+        return broadcast_id
+
+    def _finish(self, broadcast_id: str) -> None:
+        client = self._client()
+        pipe = client.pipeline(transaction=True)
+        pipe.expire(self._key(broadcast_id), self.state_ttl)
+        pipe.expire(self._done_key(broadcast_id), self.state_ttl)
+        pipe.delete(self.active_key)
+        pipe.execute()
+
+    def _acquire_lock(self, broadcast_id: str) -> bool:
+        client = self._client()
+        key = self._lock_key(broadcast_id)
+        if client.set(key, self._lock_token, nx=True, ex=LOCK_TTL):
+            return True
+        # تمدید قفلی که همین پردازه قبلاً گرفته است
+        return bool(client.eval(EXTEND_LOCK_SCRIPT, 1, key, self._lock_token, LOCK_TTL))
+
+    def _release_lock(self, broadcast_id: str) -> None:
+        self._client().eval(RELEASE_LOCK_SCRIPT, 1, self._lock_key(broadcast_id), self._lock_token)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, application, broadcast_id: str) -> None:
+        """اجرای broadcast در پس‌زمینه تا handler ظرفیت مسیر سریع را اشغال نکند."""
+        self._task = application.create_task(self.run(application.bot, broadcast_id))
+
+    # ---- ارسال ----
+
+    async def _deliver(self, bot: "Bot", broadcast_id: str, state: Dict[str, Any], user_id: int) -> str:
+        from telegram.error import Forbidden, RetryAfter
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            await self.limiter.acquire(user_id)
+            try:
+                if 'text' in state:
+                    await bot.send_message(chat_id=user_id, text=state['text'])
+                else:
+                    await bot.copy_message(chat_id=user_id, from_chat_id=int(state['from_chat_id']),
+                                           message_id=int(state['message_id']))
+                outcome = "sent"
+            except RetryAfter as e:
+                await self.limiter.pause(retry_after_seconds(e))
+                self._outcomes["retried"].inc()
+                outcome = "failed"
+                continue
+            except Forbidden:
+                outcome = "blocked"
+            except Exception as e:
+                logger.warning(f"Broadcast {broadcast_id} to {user_id} failed: {e}")
+                outcome = "failed"
+            break
+        self._outcomes[outcome].inc()
+        # ثبت گیرنده همراه شمارنده در یک رفت‌وبرگشت؛ ادامه پس از کرش این گیرنده را رد می‌کند
+        pipe = self._client().pipeline(transaction=True)
+        pipe.sadd(self._done_key(broadcast_id), user_id)
+        pipe.hincrby(self._key(broadcast_id), outcome, 1)
+        await asyncio.to_thread(pipe.execute)
+        return outcome
+
+    def _pending_recipients(self, broadcast_id: str, chunk: List[int]) -> List[int]:
+        pipe = self._client().pipeline(transaction=False)
+        for user_id in chunk:
+            pipe.sismember(self._done_key(broadcast_id), user_id)
+        return [user_id for user_id, done in zip(chunk, pipe.execute()) if not done]
+
+    async def _report(self, bot: "Bot", state: Dict[str, Any], progress_message, rate: Optional[float]):
+        text = format_progress(state, rate)
+        try:
+            if progress_message is None:
+                return await bot.send_message(chat_id=int(state['admin_chat_id']), text=text)
+            await progress_message.edit_text(text)
+        except Exception as e:
+            logger.debug(f"Could not update broadcast progress message: {e}")
+        return progress_message
+
+    async def run(self, bot: "Bot", broadcast_id: str) -> Dict[str, Any]:
+        """اجرا یا ادامه یک broadcast تا پایان، لغو یا خطا. خروجی: وضعیت نهایی."""
+        state = await asyncio.to_thread(self.load, broadcast_id)
+        if state.get('status') != "running":
+            return state
+        if not await asyncio.to_thread(self._acquire_lock, broadcast_id):
+            logger.info(f"Broadcast {broadcast_id} is already running on another replica.")
+            return state
+        stream = RecipientStream(int(state['last_user_id']), self.fetch_size)
+        progress_message = None
+        started = time.monotonic()
+        handled = 0
+        try:
+            await asyncio.to_thread(stream.open)
+            already_done = sum(int(state.get(outcome, 0)) for outcome in OUTCOMES)
+            remaining = await asyncio.to_thread(count_remaining, int(state['last_user_id']))
+            await asyncio.to_thread(self._update, broadcast_id, total=already_done + remaining)
+            state = await asyncio.to_thread(self.load, broadcast_id)
+            logger.info(f"Broadcast {broadcast_id} starting after user {state['last_user_id']}: "
+                        f"{remaining} recipients left.")
+            progress_message = await self._report(bot, state, None, None)
+            last_report = time.monotonic()
+
+            while True:
+                chunk = await asyncio.to_thread(stream.fetch)
+                if not chunk:
+                    await asyncio.to_thread(self._update, broadcast_id, status="done")
+                    break
+                pending = await asyncio.to_thread(self._pending_recipients, broadcast_id, chunk)
+                if len(pending) < len(chunk):
+                    # گیرندگان انجام‌شده دسته نیمه‌کاره هم در remaining و هم در already_done شمرده شده بودند
+                    await asyncio.to_thread(
+                        self._client().hincrby, self._key(broadcast_id), 'total', len(pending) - len(chunk)
+                    )
+                await asyncio.gather(*(self._deliver(bot, broadcast_id, state, user_id) for user_id in pending))
+                handled += len(pending)
+                # نقطه ادامه فقط پس از کامل شدن کل دسته جلو می‌رود
+                await asyncio.to_thread(self._update, broadcast_id, last_user_id=chunk[-1])
+                state = await asyncio.to_thread(self.load, broadcast_id)
+                if state.get('status') != "running":
+                    logger.info(f"Broadcast {broadcast_id} stopped: {state.get('status')}.")
+                    break
+                if not await asyncio.to_thread(self._acquire_lock, broadcast_id):
+                    logger.warning(f"Broadcast {broadcast_id} lock lost; stopping this runner.")
+                    return state
+                if time.monotonic() - last_report >= self.progress_interval:
+                    rate = handled / max(time.monotonic() - started, 1e-6)
+                    progress_message = await self._report(bot, state, progress_message, rate)
+                    last_report = time.monotonic()
+        except Exception as e:
+            # وضعیت running می‌ماند تا /broadcast resume یا راه‌اندازی بعدی آن را ادامه دهد
+            logger.error(f"Broadcast {broadcast_id} interrupted: {e}")
+            state = await asyncio.to_thread(self.load, broadcast_id)
+            await self._report(bot, {**state, 'status': f"interrupted ({e})"}, progress_message, None)
+            return state
+        finally:
+            await asyncio.to_thread(stream.close)
+            try:
+                await asyncio.to_thread(self._release_lock, broadcast_id)
+            except Exception as e:
+                # قفل پس از LOCK_TTL خودش منقضی می‌شود
+                logger.error(f"Could not release broadcast {broadcast_id} lock: {e}")
+
+        state = await asyncio.to_thread(self.load, broadcast_id)
+        if state.get('status') == "done":
+            await asyncio.to_thread(self._finish, broadcast_id)
+        elapsed = time.monotonic() - started
+        await self._report(bot, state, progress_message, handled / elapsed if elapsed > 0 and handled else None)
+        logger.info(f"Broadcast {broadcast_id} {state.get('status')}: {format_progress(state)}")
+        return state
+
+    # ---- ادامه پس از ری‌استارت ----
+
+    def attach(self, job_queue: "JobQueue") -> None:
+        """بررسی broadcast نیمه‌کاره کمی پس از راه‌اندازی."""
+        job_queue.run_once(self._resume_job, when=20, name="broadcast_resume")
+
+    async def _resume_job(self, context: "ContextTypes.DEFAULT_TYPE") -> None:
+        if self.redis is None or self.running:
+            return
+        try:
+            broadcast_id = await asyncio.to_thread(self.active_id)
+            if broadcast_id and (await asyncio.to_thread(self.load, broadcast_id)).get('status') == "running":
+                logger.info(f"Resuming interrupted broadcast {broadcast_id}.")
+                self.start(context.application, broadcast_id)
+        except Exception as e:
+            logger.error(f"Could not resume broadcast: {e}")
+
+broadcast_engine = BroadcastEngine()
@@ -0,0 +1,74 @@
+import asyncio
+from typing import Any, Optional, TYPE_CHECKING
+
+from src.config import logger, PERSISTENCE_NAMESPACE
+from src.data.isee_rules import isee_rules
+from src.data.knowledge_base import reload_knowledge_base
+from src.database import get_redis_client
+
+if TYPE_CHECKING:
+    import redis
+    from telegram.ext import ContextTypes
+
+_MISSING = object()
+
+class ContentReloadSignal:
+    """
+    انتشار /reload_kb به همه پردازه‌ها (workerهای cluster و replicaها). دستور ادمین پس از بارگذاری در پردازه
+    خودش شمارنده مشترک Redis را INCR می‌کند؛ job دوره‌ای هر پردازه با دیدن عددی غیر از آخرین نسخه دیده‌شده
+    پایگاه دانش و قوانین ISEE را از فایل دوباره بارگذاری می‌کند. بدون Redis فقط همان پردازه بارگذاری می‌شود.
+    """
+
+    def __init__(self, redis_client: Any = _MISSING, namespace: str = PERSISTENCE_NAMESPACE):
+        self._redis = redis_client
+        self.key = f"{namespace}:content_reload"
+        # آخرین مقدار شمارنده؛ None یعنی هنوز خوانده نشده (بارگذاری هنگام راه‌اندازی تازه است)
+        self._seen: Optional[int] = None
+
+    @property
+    def redis(self) -> Optional["redis.Redis"]:
+        # اتصال Redis تا اولین استفاده ساخته نمی‌شود
+        if self._redis is _MISSING:
+            self._redis = get_redis_client()
+        return self._redis
+
+    async def announce(self) -> bool:
+        """اعلام بارگذاری مجدد به پردازه‌های دیگر. خروجی: آیا اعلام به Redis رسید."""
+        if self.redis is None:
+            return False
+        try:
+            self._seen = await asyncio.to_thread(self.redis.incr, self.key)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to announce content reload: {e}")
+            return False
+
+    async def check(self) -> bool:
+        """بارگذاری مجدد در صورت تغییر شمارنده. خروجی: آیا بارگذاری انجام شد."""
+        if self.redis is None:
+            return False
+        try:
+            value = await asyncio.to_thread(self.redis.get, self.key)
+        except Exception as e:
+            logger.error(f"Failed to read content reload counter: {e}")
+            return False
+        current = int(value or 0)
+        previous, self._seen = self._seen, current
+        if previous is None or current == previous:
+            return False
+        logger.info(f"Content reload announced by another process ({previous} -> {current}); reloading.")
+        try:
+            reload_knowledge_base()
+        except Exception as e:
+            logger.error(f"Error reloading knowledge base: {e}")
+        try:
+            isee_rules.reload()
+        except Exception as e:
+            logger.error(f"Error reloading ISEE rules: {e}")
+        return True
+
+async def content_reload_job(context: "ContextTypes.DEFAULT_TYPE") -> None:
+    """کار زمان‌بندی‌شده JobQueue برای دیدن /reload_kb اجراشده در پردازه‌های دیگر."""
+    await content_reload.check()
+
+content_reload = ContentReloadSignal()
@@ -1,11 +1,14 @@
 import logging
-from typing import Optional, List
+from typing import Optional, List, TYPE_CHECKING
 from datetime import datetime
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
 from tenacity import retry, stop_after_attempt, wait_exponential
 
-from src.config import logger, GOOGLE_CREDS, SHEET_ID, SCHOLARSHIPS_SHEET_NAME, QUESTIONS_SHEET_NAME
+from src.config import logger, GOOGLE_CREDS, SHEET_ID, SCHOLARSHIPS_SHEET_NAME, QUESTIONS_SHEET_NAME, SHEETS_API_URL
+from src.utils.metrics import track_dependency
+from src.utils.tracing import traced_async_sleep
+
+if TYPE_CHECKING:
+    import gspread
 
 # تنظیمات Google Sheets
 SCOPE = [
@@ -13,8 +16,26 @@ SCOPE = [
     "https://www.googleapis.com/auth/drive"
 ]
 
-def get_gspread_client() -> gspread.Client:
+GOOGLE_SHEETS_API = "https://sheets.googleapis.com"
+
+def _local_sheets_client(base_url: str) -> "gspread.Client":
+    """کلاینت gspread که درخواست‌ها را بدون احراز هویت به یک سرور سازگار محلی می‌فرستد."""
+    import gspread
+    import requests
+
+    class LocalSheetsSession(requests.Session):
+        def request(self, method, url, *args, **kwargs):
+            return super().request(method, url.replace(GOOGLE_SHEETS_API, base_url.rstrip('/'), 1), *args, **kwargs)
+
+    return gspread.Client(None, session=LocalSheetsSession())
+
+def get_gspread_client() -> "gspread.Client":
     """ایجاد کلاینت Google Sheets."""
+    if SHEETS_API_URL:
+        return _local_sheets_client(SHEETS_API_URL)
+    # import تنبل: gspread و oauth2client فقط هنگام اولین نوشتن/خواندن از Sheets بارگذاری می‌شوند
+    import gspread
+    from oauth2client.service_account import ServiceAccountCredentials
     try:
         if not GOOGLE_CREDS:
             logger.error("Google credentials not configured.")
@@ -34,7 +55,7 @@ def get_gspread_client() -> gspread.Client:
         logger.error(f"Failed to initialize Google Sheets client: {e}")
         raise
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10), sleep=traced_async_sleep)
 async def append_qa_to_sheet(user_id: int, question: str, answer: str) -> None:
     """ذخیره پرس‌وجو و پاسخ در Google Sheet."""
     try:
@@ -44,20 +65,22 @@ async def append_qa_to_sheet(user_id: int, question: str, answer: str) -> None:
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         row = [str(user_id), timestamp, question, answer]
         
-        sheet.append_row(row, value_input_option='RAW')
+        with track_dependency("sheets", "append_row"):
+            sheet.append_row(row, value_input_option='RAW')
         logger.info(f"Successfully appended Q&A for user {user_id} to sheet '{QUESTIONS_SHEET_NAME}'.")
     except Exception as e:
         logger.error(f"Error appending Q&A for user {user_id}: {e}")
         raise
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10), sleep=traced_async_sleep)
 async def get_user_history_from_sheet(user_id: int, lang: str = 'fa') -> str:
     """بازیابی تاریخچه پرس‌وجوهای کاربر از Google Sheet."""
     try:
         client = get_gspread_client()
         sheet = client.open_by_key(SHEET_ID).worksheet(QUESTIONS_SHEET_NAME)
         
-        records = sheet.get_all_records()
+        with track_dependency("sheets", "get_all_records"):
+            records = sheet.get_all_records()
         user_records = [r for r in records if str(r.get('user_id')) == str(user_id)]
         
         if not user_records:
@@ -93,14 +116,15 @@ async def get_user_history_from_sheet(user_id: int, lang: str = 'fa') -> str:
         logger.error(f"Error retrieving history for user {user_id}: {e}")
         raise
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10), sleep=traced_async_sleep)
 async def get_scholarships_from_sheet(lang: str = 'fa') -> List[dict]:
     """بازیابی اطلاعات بورسیه‌ها از Google Sheet."""
     try:
         client = get_gspread_client()
         sheet = client.open_by_key(SHEET_ID).worksheet(SCHOLARSHIPS_SHEET_NAME)
         
-        records = sheet.get_all_records()
+        with track_dependency("sheets", "get_all_records"):
+            records = sheet.get_all_records()
         scholarships = []
         
         for record in records:
@@ -117,3 +141,18 @@ async def get_scholarships_from_sheet(lang: str = 'fa') -> List[dict]:
     except Exception as e:
         logger.error(f"Error retrieving scholarships: {e}")
         raise
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10), sleep=traced_async_sleep)
+async def get_scholarship_records_from_sheet() -> List[dict]:
+    """ردیف‌های خام شیت بورسیه‌ها (همه زبان‌ها و ستون‌های معیار) برای ایندکس تطبیق بورسیه."""
+    try:
+        client = get_gspread_client()
+        sheet = client.open_by_key(SHEET_ID).worksheet(SCHOLARSHIPS_SHEET_NAME)
+        with track_dependency("sheets", "get_all_records"):
+            records = sheet.get_all_records()
+        logger.info(f"Retrieved {len(records)} scholarship rows from sheet '{SCHOLARSHIPS_SHEET_NAME}'.")
+        return records
+    except Exception as e:
+        logger.error(f"Error retrieving scholarship rows: {e}")
+        raise
+
@@ -0,0 +1,168 @@
+import argparse
+import csv
+import io
+import math
+import sys
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.data.isee_rules import ISEERuleset, isee_rules
+
+# سقف تعداد ردیف‌های یک فایل cohort
+MAX_BATCH_ROWS = 100_000
+# ستون‌های فایل CSV ورودی و ستون‌های اضافه‌شده به خروجی
+CSV_COLUMNS = ("family_members", "annual_income", "property_status", "property_size")
+RESULT_COLUMNS = ("isee_value", "tier", "amount")
+OWNER_VALUES = {"مالک", "owner", "proprietario", "yes", "1", "true"}
+
+def family_scales(rules: ISEERuleset, family_members: np.ndarray) -> np.ndarray:
+    """نسخه برداری ISEERuleset.scale."""
+    table = np.asarray(rules.family_scales)
+    largest = len(table) - 1
+    extended = table[largest] + rules.extra_member_scale * (family_members - largest)
+    return np.where(family_members <= largest, table[np.clip(family_members, 0, largest)], extended)
+
+def _round_cents(values: np.ndarray) -> np.ndarray:
+    """
+    گرد کردن به دو رقم اعشار دقیقاً مثل round پایتون. np.round با ضرب در 100 کار می‌کند و در مقادیر خیلی نزدیک
+    به نیمه ممکن است با round پایتون فرق کند؛ فقط همان چند مقدار با round پایتون دوباره حساب می‌شوند.
+    """
+    rounded = np.round(values, 2)
+    fraction = np.abs(values * 100 - np.floor(values * 100) - 0.5)
+    for index in np.flatnonzero(fraction < 1e-6):
+        rounded[index] = round(float(values[index]), 2)
+    return rounded
+
+def calculate_batch(family_members: Sequence[int], annual_income: Sequence[float], owner: Sequence[bool],
+                    property_size: Sequence[float], rules: Optional[ISEERuleset] = None) -> Dict[str, np.ndarray]:
+    """
+    محاسبه ISEE و سطح بورسیه برای آرایه‌ای از خانواده‌ها در یک گذر برداری.
+    نتیجه با ISEEService.calculate یکسان است. خروجی: آرایه‌های value، tier (اندیس در rules.tier_keys) و amount.
+    """
+    rules = rules or isee_rules.current()
+    members = np.asarray(family_members, dtype=np.int64)
+    income = np.asarray(annual_income, dtype=np.float64)
+    is_owner = np.asarray(owner, dtype=bool)
+    size = np.asarray(property_size, dtype=np.float64)
+
+    property_value = np.where(is_owner, size * rules.value_per_sqm * rules.property_weight, 0.0)
+    value = _round_cents((income + property_value) / family_scales(rules, members))
+    # همان جستجوی دودویی ISEERuleset.tier_index: value <= آستانه i  ⇔  searchsorted(side='left') <= i
+    tier = np.searchsorted(np.asarray(rules.thresholds), value, side='left')
+    amounts = np.array([rule.amount for rule in rules.tiers] + [rules.not_eligible.amount])
+    return {'value': value, 'tier': tier, 'amount': amounts[tier]}
+
+def income_thresholds(family_members: int, owner: bool = False, property_size: float = 0,
+                      rules: Optional[ISEERuleset] = None) -> List[Tuple[str, Optional[float]]]:
+    """
+    حداکثر درآمد سالانه (با دقت سنت) که هنوز به هر سطح بورسیه می‌رسد. None یعنی آن سطح با هیچ درآمد
+    نامنفی‌ای قابل دسترسی نیست (مثلاً ارزش ملک به تنهایی از آستانه بیشتر است).
+    """
+    rules = rules or isee_rules.current()
+    scale = rules.scale(family_members)
+    property_value = rules.property_value(owner, property_size)
+    results = []
+    for tier, threshold in zip(rules.tiers, rules.thresholds):
+        # تخمین تحلیلی و سپس اصلاح چند سنتی با همان محاسبه دقیق (گرد کردن ISEE مرز را چند سنت جابه‌جا می‌کند)
+        estimate = math.floor((threshold * scale - property_value) * 100) / 100
+        candidates = np.round(estimate + np.arange(-300, 301) / 100, 2)
+        candidates = candidates[candidates >= 0]
+        if candidates.size == 0:
+            results.append((tier.key, None))
+            continue
+        values = _round_cents((candidates + property_value) / scale)
+        eligible = candidates[values <= threshold]
+        results.append((tier.key, float(eligible.max()) if eligible.size else None))
+    return results
+
+# ---- CSV ----
+
+def parse_owner(value: str) -> bool:
+    return value.strip().lower() in OWNER_VALUES
+
+def read_cohort_csv(text: str) -> Dict[str, list]:
+    """خواندن فایل CSV با ستون‌های CSV_COLUMNS؛ خطای ValueError با شماره ردیف برای داده نامعتبر."""
+    reader = csv.DictReader(io.StringIO(text))
+    missing = [column for column in CSV_COLUMNS[:2] if column not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"Missing CSV columns: {', '.join(missing)}")
+    rows: Dict[str, list] = {column: [] for column in CSV_COLUMNS}
+    for line, row in enumerate(reader, start=2):
+        if len(rows["family_members"]) >= MAX_BATCH_ROWS:
+            raise ValueError(f"Too many rows (max {MAX_BATCH_ROWS}).")
+        try:
+            members = int(row["family_members"])
+            income = float(row["annual_income"])
+            size = float(row.get("property_size") or 0)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid number on line {line}.")
+        # nan و inf از float() عبور می‌کنند و از مقایسه‌های < 0 هم رد می‌شوند
+        if members < 1 or not math.isfinite(income) or not math.isfinite(size) or income < 0 or size < 0:
+            raise ValueError(f"Out-of-range value on line {line}.")
+        rows["family_members"].append(members)
+        rows["annual_income"].append(income)
+        rows["property_status"].append(parse_owner(row.get("property_status") or ""))
+        rows["property_size"].append(size)
+    return rows
+
+def calculate_csv(text: str, rules: Optional[ISEERuleset] = None) -> Tuple[str, Dict[str, int]]:
+    """محاسبه یک فایل cohort. خروجی: CSV نتایج و شمار خانواده‌ها در هر سطح."""
+    rules = rules or isee_rules.current()
+    rows = read_cohort_csv(text)
+    result = calculate_batch(rows["family_members"], rows["annual_income"], rows["property_status"],
+                             rows["property_size"], rules)
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(CSV_COLUMNS + RESULT_COLUMNS)
+    tier_keys = rules.tier_keys
+    tiers = [tier_keys[index] for index in result['tier']]
+    for index, tier in enumerate(tiers):
+        writer.writerow([
+            rows["family_members"][index],
+            rows["annual_income"][index],
+            "owner" if rows["property_status"][index] else "tenant",
+            rows["property_size"][index],
+            f"{result['value'][index]:.2f}",
+            tier,
+            int(result['amount'][index]),
+        ])
+    counts = Counter(tiers)
+    return output.getvalue(), {key: counts.get(key, 0) for key in tier_keys}
+
+def format_thresholds(thresholds: Iterable[Tuple[str, Optional[float]]]) -> str:
+    return "\n".join(
+        f"{key}: {'unreachable' if income is None else f'≤ {income:,.2f} EUR'}"
+        for key, income in thresholds
+    )
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Batch ISEE calculator for student cohorts")
+    parser.add_argument("csv", nargs="?", help=f"input CSV with columns {', '.join(CSV_COLUMNS)}")
+    parser.add_argument("-o", "--output", help="output CSV (default: stdout)")
+    parser.add_argument("--year", help="academic year of the ISEE rules (default: current)")
+    parser.add_argument("--thresholds", type=int, metavar="FAMILY_MEMBERS",
+                        help="print the income boundary of each tier instead of processing a CSV")
+    parser.add_argument("--owner-sqm", type=float, default=0, help="property size for --thresholds (owners)")
+    args = parser.parse_args(argv)
+    rules = isee_rules.for_year(args.year) if args.year else isee_rules.current()
+    if rules is None:
+        parser.error(f"unknown academic year {args.year!r} (available: {', '.join(isee_rules.academic_years)})")
+
+    if args.thresholds is not None:
+        print(format_thresholds(income_thresholds(args.thresholds, args.owner_sqm > 0, args.owner_sqm, rules)))
+        return
+    if not args.csv:
+        parser.error("a CSV file or --thresholds is required")
+    with open(args.csv, encoding="utf-8-sig") as f:
+        output, counts = calculate_csv(f.read(), rules)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8", newline="") as f:
+            f.write(output)
+    else:
+        sys.stdout.write(output)
+    print(", ".join(f"{key}: {count}" for key, count in counts.items()), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
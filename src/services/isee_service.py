@@ -1,12 +1,15 @@
 import logging
-import json
+import uuid
 from enum import Enum
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ApplicationHandlerStop, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ConversationHandler, ContextTypes
 from src.config import logger
+from src.data.isee_rules import ISEERuleset, isee_rules
 from src.utils.text_formatter import sanitize_markdown
-from src.database import get_db_cursor
+from src.services.write_behind import write_behind
+from src.services.scholarship_matcher import format_matches, scholarship_matcher
 from src.handlers.user_manager import MAIN_MENU, get_main_menu_keyboard
+from src.utils.metrics import instrument_handler
 
 class ISEEState(Enum):
     FAMILY = 1
@@ -14,92 +17,85 @@ class ISEEState(Enum):
     PROPERTY = 3
     PROPERTY_SIZE = 4
 
+# حداکثر بورسیه‌های پیشنهادی در پاسخ محاسبه ISEE
+MAX_MATCHED_SCHOLARSHIPS = 5
+
+# نسخه قالب فشرده ذخیره نتیجه ISEE در جدول sessions (2: سال تحصیلی قوانین به جای سقف)
+SESSION_FORMAT_VERSION = 2
+
+def compact_result(result: dict) -> dict:
+    """
+    شکل ذخیره‌ای نتیجه ISEE: فقط ورودی‌ها و خروجی‌های عددی و سال تحصیلی قوانین. متن‌های چندزبانه (وضعیت و
+    پیشنهاد) ذخیره نمی‌شوند و هنگام خواندن با expand_result از روی قوانین همان سال دوباره ساخته می‌شوند.
+    """
+    details = result['details']
+    return {
+        'v': SESSION_FORMAT_VERSION,
+        'y': result['academic_year'],
+        'f': details['family_members'],
+        'i': details['annual_income'],
+        'p': 'owner' if details['property_status'] == "مالک" else 'tenant',
+        's': details['property_size'],
+        'isee': result['value'],
+    }
+
+def _build_result(rules: ISEERuleset, isee_value: float, details: dict) -> dict:
+    tier = rules.tier(isee_value)
+    return {
+        'value': isee_value,
+        'status': tier.status,
+        'amount': tier.amount,
+        'details': details,
+        'suggestion': tier.suggestion,
+        'limit': rules.limit,
+        'academic_year': rules.academic_year
+    }
+
+def expand_result(data: dict) -> dict:
+    """بازسازی نتیجه کامل (همان شکل خروجی ISEEService.calculate) از داده ذخیره‌شده در sessions."""
+    if 'v' not in data:
+        # ردیف‌های قدیمی‌تر نتیجه کامل را ذخیره کرده‌اند
+        return data
+    # قالب 1 سال تحصیلی نداشت و با قوانین فعال بازسازی می‌شود
+    rules = isee_rules.for_year(data.get('y')) or isee_rules.current()
+    owner = data['p'] == 'owner'
+    return _build_result(rules, data['isee'], {
+        'family_members': data['f'],
+        'annual_income': data['i'],
+        'property_status': "مالک" if owner else "مستأجر",
+        'property_size': data['s'] if owner else 0
+    })
+
 class ISEEService:
     def __init__(self, json_data: dict, db_manager):
         self.data = json_data
         self.db = db_manager
-        self.scholarship_limit = None
-        self._setup_isee_parameters()
+        # قوانین ISEE هنگام ساخت سرویس بارگذاری و اعتبارسنجی می‌شوند تا خطای فایل در راه‌اندازی دیده شود
+        logger.info(f"ISEE rules active for academic year {self.rules.academic_year}.")
 
-    def _setup_isee_parameters(self):
-        """Extract ISEE limit from knowledge base."""
-        try:
-            scholarship_section = self.data.get("بورسیه و تقویم آموزشی", [])
-            for item in scholarship_section:
-                if "توضیح کامل عدد ISEE" in item.get("title", ""):
-                    content = item.get("content", [])
-                    for line in content:
-                        if "سقف ISEE" in line or "حداکثر" in line:
-                            if "€" in line:
-                                self.scholarship_limit = float(line.split("€")[-1].replace(",", "").strip())
-                                logger.info(f"ISEE limit set to: {self.scholarship_limit}")
-                                return
-            self.scholarship_limit = 27948.60  # Default for 2025/2026
-            logger.info(f"Using default ISEE limit: {self.scholarship_limit}")
-        except Exception as e:
-            logger.error(f"Error setting up ISEE parameters: {e}")
-            self.scholarship_limit = 27948.60
+    @property
+    def rules(self) -> ISEERuleset:
+        """قوانین سال تحصیلی جاری (src/data/isee_rules.json)."""
+        return isee_rules.current()
+
+    @property
+    def scholarship_limit(self) -> float:
+        return self.rules.limit
 
     def calculate(self, family_members: int, annual_income: float, 
                  property_status: str, property_size: float = 0) -> dict:
         """Calculate ISEE value and scholarship eligibility."""
         try:
-            # Family size parameters
-            family_params = {1: 1.00, 2: 1.57, 3: 2.04, 4: 2.46, 5: 2.85}
-            scale = family_params.get(family_members, 2.85 + 0.35 * (family_members - 5))
-            
-            # Calculate property value
-            property_value = property_size * 500 * 0.2 if property_status == "مالک" else 0
+            rules = self.rules
+            property_value = rules.property_value(property_status == "مالک", property_size)
             total_assets = annual_income + property_value
-            isee_value = round(total_assets / scale, 2)
-
-            # Determine scholarship status
-            if isee_value <= self.scholarship_limit * 0.55:
-                status = {"fa": "بورسیه کامل", "en": "Full scholarship", "it": "Borsa completa"}
-                amount = 5192
-                suggestion = {
-                    "fa": "شما واجد شرایط حداکثر کمک هزینه (5192 یورو + خوابگاه رایگان) هستید.",
-                    "en": "You are eligible for the maximum scholarship (5192 EUR + free dormitory).",
-                    "it": "Sei idoneo per la borsa massima (5192 EUR + dormitorio gratuito)."
-                }
-            elif isee_value <= self.scholarship_limit * 0.715:
-                status = {"fa": "بورسیه متوسط", "en": "Medium scholarship", "it": "Borsa media"}
-                amount = 3634
-                suggestion = {
-                    "fa": "شما واجد شرایط بورسیه متوسط (3634 یورو) هستید.",
-                    "en": "You are eligible for a medium scholarship (3634 EUR).",
-                    "it": "Sei idoneo per una borsa media (3634 EUR)."
-                }
-            elif isee_value <= self.scholarship_limit:
-                status = {"fa": "بورسیه جزئی", "en": "Partial scholarship", "it": "Borsa parziale"}
-                amount = 2000
-                suggestion = {
-                    "fa": "شما واجد شرایط بورسیه جزئی (2000 یورو) هستید.",
-                    "en": "You are eligible for a partial scholarship (2000 EUR).",
-                    "it": "Sei idoneo per una borsa parziale (2000 EUR)."
-                }
-            else:
-                status = {"fa": "عدم واجد شرایط", "en": "Not eligible", "it": "Non idoneo"}
-                amount = 0
-                suggestion = {
-                    "fa": "برای گزینه‌های دیگر با دانشگاه مشورت کنید.",
-                    "en": "Consult the university for other options.",
-                    "it": "Consulta l'università per altre opzioni."
-                }
-
-            return {
-                'value': isee_value,
-                'status': status,
-                'amount': amount,
-                'details': {
-                    'family_members': family_members,
-                    'annual_income': annual_income,
-                    'property_status': property_status,
-                    'property_size': property_size if property_status == "مالک" else 0
-                },
-                'suggestion': suggestion,
-                'limit': self.scholarship_limit
-            }
+            isee_value = round(total_assets / rules.scale(family_members), 2)
+            return _build_result(rules, isee_value, {
+                'family_members': family_members,
+                'annual_income': annual_income,
+                'property_status': property_status,
+                'property_size': property_size if property_status == "مالک" else 0
+            })
         except Exception as e:
             logger.error(f"Error calculating ISEE: {e}")
             raise
@@ -120,6 +116,7 @@ class ISEEService:
             map_to_parent={ConversationHandler.END: MAIN_MENU}
         )
 
+    @instrument_handler("isee", branch="start")
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Start the ISEE calculation process."""
         query = update.callback_query
@@ -136,6 +133,7 @@ class ISEEService:
         )
         return ISEEState.FAMILY
 
+    @instrument_handler("isee", branch="family")
     async def handle_family(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Handle family members input."""
         try:
@@ -167,6 +165,7 @@ class ISEEService:
             )
             return ISEEState.FAMILY
 
+    @instrument_handler("isee", branch="income")
     async def handle_income(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Handle annual income input."""
         try:
@@ -208,6 +207,7 @@ class ISEEService:
             )
             return ISEEState.INCOME
 
+    @instrument_handler("isee", branch="property")
     async def handle_property(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Handle property status selection."""
         query = update.callback_query
@@ -240,6 +240,7 @@ class ISEEService:
             return ISEEState.PROPERTY_SIZE
         return await self.finish(update, context)
 
+    @instrument_handler("isee", branch="property_size")
     async def handle_property_size(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Handle property size input."""
         try:
@@ -261,6 +262,7 @@ class ISEEService:
             )
             return ISEEState.PROPERTY_SIZE
 
+    @instrument_handler("isee", branch="finish")
     async def finish(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Complete ISEE calculation and display results."""
         data = context.user_data.get('isee', {})
@@ -313,21 +315,25 @@ class ISEEService:
                 )
             }
 
-            # Save to database
-            with get_db_cursor() as cur:
-                cur.execute(
-                    "INSERT INTO isee_calculations (user_id, isee_value) VALUES (%s, %s)",
-                    (update.effective_user.id, result['value'])
-                )
-                cur.execute(
-                    "INSERT INTO sessions (session_id, user_id, data) VALUES (%s, %s, %s)",
-                    (f"isee_{update.effective_user.id}_{int(result['value'])}", 
-                     update.effective_user.id, 
-                     json.dumps(result, ensure_ascii=False))
+            # ذخیره در پایگاه داده از طریق صف write-behind؛ پاسخ کاربر منتظر Postgres نمی‌ماند.
+            # شناسه سشن تصادفی است تا محاسبه دوباره با همان عدد ISEE با قید UNIQUE برخورد نکند
+            write_behind.record_isee_calculation(
+                update.effective_user.id, result['value'], f"isee_{uuid.uuid4().hex}", compact_result(result)
+            )
+
+            # بورسیه‌های باز و واجد شرایط بر اساس همین نتیجه و سن و زبان پروفایل
+            text = messages[lang]
+            try:
+                matches = scholarship_matcher.match_for_user(
+                    update.effective_user.id, isee_value=result['value'], limit=MAX_MATCHED_SCHOLARSHIPS
                 )
+                if matches:
+                    text += "\n\n" + format_matches(matches, lang)
+            except Exception as e:
+                logger.error(f"Error matching scholarships for user {update.effective_user.id}: {e}")
 
             await (update.message or update.callback_query.message).reply_text(
-                text=sanitize_markdown(messages[lang]),
+                text=sanitize_markdown(text),
                 parse_mode='MarkdownV2',
                 reply_markup=get_main_menu_keyboard(lang)
             )
@@ -1,13 +1,25 @@
 import logging
 from pathlib import Path
-from typing import Optional
-import openai
+from typing import Optional, TYPE_CHECKING
 from tenacity import retry, stop_after_attempt, wait_exponential
 
-from src.config import logger, OPENAI_API_KEY
+from src.config import logger, OPENAI_API_KEY, OPENAI_BASE_URL
+from src.utils.metrics import track_dependency
+from src.utils.tracing import traced_async_sleep
 
-# تنظیم کلید API
-openai.api_key = OPENAI_API_KEY
+if TYPE_CHECKING:
+    import openai
+
+# کلاینت OpenAI در اولین استفاده ساخته می‌شود تا import سنگین آن در راه‌اندازی سرد نباشد
+_client: Optional["openai.AsyncOpenAI"] = None
+
+def get_openai_client() -> "openai.AsyncOpenAI":
+    """بازگشت کلاینت async مشترک OpenAI."""
+    global _client
+    if _client is None:
+        import openai
+        _client = openai.AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
+    return _client
 
 # پرامپت سیستمی برای پاسخ‌های متنی
 SYSTEM_PROMPT = (
@@ -17,7 +29,7 @@ SYSTEM_PROMPT = (
     "Always respond in the user's selected language."
 )
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10), sleep=traced_async_sleep)
 async def get_ai_response(user_message: str, lang: str = 'fa') -> Optional[str]:
     """
     دریافت پاسخ از OpenAI Chat API برای پیام متنی کاربر.
@@ -37,12 +49,13 @@ async def get_ai_response(user_message: str, lang: str = 'fa') -> Optional[str]:
     ]
 
     try:
-        response = await openai.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            temperature=0.6,
-            max_tokens=1500
-        )
+        with track_dependency("openai", "chat"):
+            response = await get_openai_client().chat.completions.create(
+                model="gpt-4o",
+                messages=messages,
+                temperature=0.6,
+                max_tokens=1500
+            )
         ai_response = response.choices[0].message.content
         logger.info(f"Successfully received chat response from OpenAI for user message: '{user_message[:30]}...'")
         return ai_response
@@ -50,7 +63,7 @@ async def get_ai_response(user_message: str, lang: str = 'fa') -> Optional[str]:
         logger.error(f"Error calling OpenAI Chat API: {e}")
         return None
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10), sleep=traced_async_sleep)
 async def process_voice_message(voice_file_path: Path, lang: str = 'fa') -> Optional[str]:
     """
     تبدیل پیام صوتی به متن با استفاده از OpenAI Whisper API.
@@ -68,11 +81,12 @@ async def process_voice_message(voice_file_path: Path, lang: str = 'fa') -> Opti
 
     try:
         with open(voice_file_path, "rb") as audio_file:
-            transcript = await openai.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                language=LANGUAGE_CODES.get(lang, 'en')
-            )
+            with track_dependency("openai", "transcription"):
+                transcript = await get_openai_client().audio.transcriptions.create(
+                    model="whisper-1",
+                    file=audio_file,
+                    language=LANGUAGE_CODES.get(lang, 'en')
+                )
             logger.info(f"Successfully transcribed voice message. Text: '{transcript.text[:50]}...'")
             return transcript.text
     except Exception as e:
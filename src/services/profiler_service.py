@@ -0,0 +1,135 @@
+import asyncio
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+from typing import List, Optional, Tuple
+
+from src.config import logger
+
+class SamplingProfiler:
+    """
+    پروفایلر آماری کم‌هزینه: یک thread در فواصل کوتاه پشته thread حلقه رویداد را
+    نمونه‌برداری می‌کند و پشته‌های فشرده (قالب collapsed برای flamegraph) را می‌شمارد.
+    """
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._target_thread: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _frame_label(frame) -> str:
+        code = frame.f_code
+        filename = code.co_filename.rsplit('/', 1)[-1]
+        return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+    def _sample_loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target_thread)
+            if frame is None:
+                continue
+            labels: List[str] = []
+            while frame is not None and len(labels) < self.max_depth:
+                labels.append(self._frame_label(frame))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(labels))] += 1
+            self.samples += 1
+
+    def start(self, target_thread: Optional[int] = None) -> None:
+        self._target_thread = target_thread or threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample_loop, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def collapsed(self) -> str:
+        """خروجی collapsed-stack سازگار با flamegraph.pl و speedscope."""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def top_functions(self, limit: int = 15) -> List[Tuple[str, int, int]]:
+        """پرهزینه‌ترین توابع: (نام، نمونه‌های self، نمونه‌های inclusive)."""
+        self_counts: Counter = Counter()
+        inclusive_counts: Counter = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            self_counts[frames[-1]] += count
+            for label in set(frames):
+                inclusive_counts[label] += count
+        return [(label, count, inclusive_counts[label]) for label, count in self_counts.most_common(limit)]
+
+    def summary(self, limit: int = 15) -> str:
+        lines = [f"Samples: {self.samples} (interval {self.interval * 1000:.0f}ms)", "self% incl%  function"]
+        total = self.samples or 1
+        for label, self_count, inclusive in self.top_functions(limit):
+            lines.append(f"{self_count * 100 / total:5.1f} {inclusive * 100 / total:5.1f}  {label}")
+        return "\n".join(lines)
+
+_profile_lock = asyncio.Lock()
+
+async def profile_event_loop(seconds: float, interval: float = 0.005) -> SamplingProfiler:
+    """نمونه‌برداری از thread حلقه رویداد به مدت مشخص."""
+    async with _profile_lock:
+        profiler = SamplingProfiler(interval=interval)
+        profiler.start(threading.get_ident())
+        logger.info(f"Sampling profiler started for {seconds}s")
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            await asyncio.to_thread(profiler.stop)
+        logger.info(f"Sampling profiler finished with {profiler.samples} samples")
+        return profiler
+
+class MemoryTracker:
+    """مقایسه snapshotهای tracemalloc برای یافتن رشد حافظه."""
+
+    def __init__(self, frames: int = 10):
+        self.frames = frames
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+
+    @property
+    def active(self) -> bool:
+        return tracemalloc.is_tracing() and self._baseline is not None
+
+    def start(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        self._baseline = self._snapshot()
+
+    def stop(self) -> None:
+        self._baseline = None
+        tracemalloc.stop()
+
+    @staticmethod
+    def _snapshot() -> tracemalloc.Snapshot:
+        """snapshot بدون تخصیص‌های خود tracemalloc و importlib؛ مبنا و مقایسه هر دو از همین فیلتر می‌گذرند."""
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+
+    def diff(self, limit: int = 15) -> str:
+        """بیشترین رشد حافظه از snapshot قبلی؛ snapshot فعلی مبنای دفعه بعد می‌شود."""
+        snapshot = self._snapshot()
+        stats = snapshot.compare_to(self._baseline, 'lineno')
+        self._baseline = snapshot
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"Traced memory: current {current / 1024:.0f} KiB, peak {peak / 1024:.0f} KiB", "Top growth:"]
+        for stat in stats[:limit]:
+            frame = stat.traceback[0]
+            lines.append(
+                f"{stat.size_diff / 1024:+9.1f} KiB {stat.count_diff:+6d} blocks  "
+                f"{frame.filename.rsplit('/', 1)[-1]}:{frame.lineno}"
+            )
+        return "\n".join(lines)
+
+memory_tracker = MemoryTracker()
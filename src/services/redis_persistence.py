@@ -0,0 +1,214 @@
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from src.config import logger
+
+if TYPE_CHECKING:
+    import redis
+
+ConversationKey = Tuple[int | str, ...]
+
+def _dumps(data: Any) -> str:
+    """سریال‌سازی فشرده JSON."""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+class RedisPersistence(BasePersistence):
+    """
+    ذخیره user_data و وضعیت ConversationHandlerها در Redis.
+
+    نوشتن‌های user_data ابتدا در حافظه جمع می‌شوند و فقط کاربرانی که داده‌شان واقعاً تغییر کرده
+    (dirty) حداکثر flush_interval ثانیه بعد با یک pipeline نوشته می‌شوند؛ اگر تغییر دیگری
+    نرسد، یک flush زمان‌بندی‌شده آن‌ها را می‌نویسد و هنگام خاموشی (SIGTERM) Application.shutdown
+    باقی‌مانده را flush می‌کند. پیش از پردازش هر آپدیت، user_data آن کاربر از Redis تازه‌سازی می‌شود.
+    تغییر وضعیت ConversationHandlerها کم‌تعداد است و بلافاصله نوشته می‌شود تا قطع ناگهانی پردازه
+    جای کاربر در گفتگو را از بین نبرد. همه فراخوانی‌های Redis در thread جدا اجرا می‌شوند.
+
+    وضعیت ConversationHandlerها فقط هنگام راه‌اندازی خوانده می‌شود (PTB برای آن refresh ندارد)،
+    پس همه آپدیت‌های یک کاربر باید همیشه در یک پردازه اجرا شوند: مقیاس افقی از راه حالت cluster
+    است که با shard کردن بر اساس شناسه کاربر این را تضمین می‌کند. چند replica حالت single را
+    پشت load balancer روی یک namespace اجرا نکنید.
+    """
+
+    def __init__(self, client: "redis.Redis", namespace: str = "ptb", flush_interval: float = 5.0):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=flush_interval,
+        )
+        self.redis = client
+        self.namespace = namespace
+        self.flush_interval = flush_interval
+        self._user_data_key = f"{namespace}:user_data"
+        # آخرین نسخه نوشته‌شده/خوانده‌شده برای تشخیص تغییرات
+        self._user_snapshots: Dict[int, str] = {}
+        self._dirty_users: Dict[int, Optional[str]] = {}
+        self._dirty_conversations: Dict[str, Dict[str, Optional[str]]] = {}
+        self._last_flush = time.monotonic()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    def _conversation_key(self, name: str) -> str:
+        return f"{self.namespace}:conversations:{name}"
+
+    # ---- user_data ----
+
+    def _scan(self, key: str) -> List[Tuple[str, str]]:
+        return list(self.redis.hscan_iter(key, count=1000))
+
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        user_data = {}
+        try:
+            for field, value in await asyncio.to_thread(self._scan, self._user_data_key):
+                user_id = int(field)
+                self._user_snapshots[user_id] = value
+                user_data[user_id] = json.loads(value)
+            logger.info(f"Loaded persisted user_data for {len(user_data)} users from Redis.")
+        except Exception as e:
+            logger.error(f"Error loading user_data from Redis: {e}")
+        return user_data
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]) -> None:
+        serialized = _dumps(data)
+        if self._user_snapshots.get(user_id) == serialized:
+            return
+        self._user_snapshots[user_id] = serialized
+        self._dirty_users[user_id] = serialized
+        await self._maybe_flush()
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]) -> None:
+        if user_id in self._dirty_users:
+            # تغییرات محلی هنوز flush نشده‌اند و بر نسخه Redis مقدم‌اند
+            return
+        try:
+            stored = await asyncio.to_thread(self.redis.hget, self._user_data_key, user_id)
+        except Exception as e:
+            logger.error(f"Error refreshing user_data for user {user_id}: {e}")
+            return
+        if stored is None or stored == self._user_snapshots.get(user_id):
+            return
+        self._user_snapshots[user_id] = stored
+        user_data.clear()
+        user_data.update(json.loads(stored))
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._user_snapshots.pop(user_id, None)
+        self._dirty_users[user_id] = None
+        await self._maybe_flush()
+
+    # ---- conversations ----
+
+    async def get_conversations(self, name: str) -> Dict[ConversationKey, object]:
+        # فقط یک بار هنگام راه‌اندازی؛ مالک هر کاربر یک پردازه است (توضیح کلاس)
+        conversations = {}
+        try:
+            for field, value in await asyncio.to_thread(self._scan, self._conversation_key(name)):
+                conversations[tuple(json.loads(field))] = json.loads(value)
+        except Exception as e:
+            logger.error(f"Error loading conversation '{name}' from Redis: {e}")
+        return conversations
+
+    async def update_conversation(self, name: str, key: ConversationKey, new_state: Optional[object]) -> None:
+        field = _dumps(list(key))
+        state = None if new_state is None else _dumps(new_state)
+        redis_key = self._conversation_key(name)
+        try:
+            if state is None:
+                await asyncio.to_thread(self.redis.hdel, redis_key, field)
+            else:
+                await asyncio.to_thread(self.redis.hset, redis_key, field, state)
+        except Exception as e:
+            logger.error(f"Error writing conversation '{name}' state to Redis, deferring to next flush: {e}")
+            self._dirty_conversations.setdefault(name, {})[field] = state
+            await self._maybe_flush()
+            return
+        # نسخه قدیمی‌تر معلق از یک خطای قبلی نباید این نوشتن را در flush بعدی بازنویسی کند
+        self._dirty_conversations.get(name, {}).pop(field, None)
+
+    # ---- flush ----
+
+    async def _maybe_flush(self) -> None:
+        remaining = self.flush_interval - (time.monotonic() - self._last_flush)
+        if remaining <= 0:
+            await self.flush()
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._deferred_flush(remaining))
+
+    async def _deferred_flush(self, delay: float) -> None:
+        """نوشتن تغییرات معلق پس از delay، حتی اگر update دیگری نرسد."""
+        await asyncio.sleep(delay)
+        try:
+            await self.flush()
+        finally:
+            # تغییرات رسیده در حین flush، یا بازگردانده‌شده پس از خطا، نوبت بعدی را زمان‌بندی می‌کنند
+            if self._dirty_users or self._dirty_conversations:
+                self._flush_task = asyncio.create_task(self._deferred_flush(self.flush_interval))
+
+    async def flush(self) -> None:
+        """نوشتن همه تغییرات معلق با یک pipeline."""
+        # flushهای هم‌زمان پشت سر هم اجرا می‌شوند تا pipeline قدیمی‌تر نسخه جدیدتر را بازنویسی نکند
+        async with self._flush_lock:
+            await self._flush()
+
+    async def _flush(self) -> None:
+        self._last_flush = time.monotonic()
+        if not self._dirty_users and not self._dirty_conversations:
+            return
+        dirty_users, self._dirty_users = self._dirty_users, {}
+        dirty_conversations, self._dirty_conversations = self._dirty_conversations, {}
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for user_id, serialized in dirty_users.items():
+                if serialized is None:
+                    pipe.hdel(self._user_data_key, user_id)
+                else:
+                    pipe.hset(self._user_data_key, user_id, serialized)
+            for name, states in dirty_conversations.items():
+                key = self._conversation_key(name)
+                for field, state in states.items():
+                    if state is None:
+                        pipe.hdel(key, field)
+                    else:
+                        pipe.hset(key, field, state)
+            await asyncio.to_thread(pipe.execute)
+            logger.debug(f"Flushed {len(dirty_users)} users and {len(dirty_conversations)} conversations to Redis.")
+        except Exception as e:
+            logger.error(f"Error flushing persistence to Redis: {e}")
+            # بازگرداندن تغییرات برای تلاش در flush بعدی، بدون بازنویسی تغییرات جدیدتر
+            for user_id, serialized in dirty_users.items():
+                self._dirty_users.setdefault(user_id, serialized)
+            for name, states in dirty_conversations.items():
+                pending = self._dirty_conversations.setdefault(name, {})
+                for field, state in states.items():
+                    pending.setdefault(field, state)
+
+    # ---- داده‌هایی که ذخیره نمی‌شوند ----
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        return {}
+
+    async def update_bot_data(self, data: Dict[Any, Any]) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Dict[Any, Any]) -> None:
+        pass
+
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {}
+
+    async def update_chat_data(self, chat_id: int, data: Dict[Any, Any]) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[Any, Any]) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def get_callback_data(self) -> Optional[Any]:
+        return None
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
@@ -0,0 +1,343 @@
+import asyncio
+import heapq
+import time
+from datetime import date, datetime, time as day_time, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, TYPE_CHECKING
+from zoneinfo import ZoneInfo
+
+from src.config import (
+    logger,
+    PERSISTENCE_NAMESPACE,
+    REMINDER_BATCH_SIZE,
+    REMINDER_HOUR,
+    REMINDER_MAX_SLEEP,
+    REMINDER_OFFSET_DAYS,
+    REMINDER_TIMEZONE,
+)
+from src.data.academic_calendar import CalendarEvent, get_calendar_index
+from src.database import get_db_cursor, get_redis_client
+from src.services.user_cache import user_cache
+from src.utils.metrics import Counter, Gauge, track_dependency
+from src.utils.rate_limiter import SendRateLimiter, retry_after_seconds, telegram_rate_limiter
+from src.utils.text_formatter import sanitize_markdown
+
+if TYPE_CHECKING:
+    import redis
+    from telegram import Bot
+    from telegram.ext import ContextTypes, JobQueue
+
+REMINDERS_SENT = Counter("reminders_total", "Scheduled reminders by outcome", labelnames=("outcome",))
+REMINDERS_SENT.prealloc([("sent",), ("retried",), ("blocked",), ("stale",), ("failed",)])
+REMINDERS_PENDING = Gauge("reminders_pending", "Reminders waiting in the schedule")
+
+# تعداد ردیف‌های اشتراک در هر دور خواندن بازسازی زمان‌بندی
+REBUILD_FETCH_SIZE = 1000
+
+_MISSING = object()
+
+REMINDER_TEXTS = {
+    'fa': {0: "امروز", 1: "فردا", 'days': "{days} روز دیگر", 'text': "🔔 یادآوری: «{title}» {when} است.\n📅 {dates}"},
+    'en': {0: "today", 1: "tomorrow", 'days': "in {days} days", 'text': "🔔 Reminder: \"{title}\" is {when}.\n📅 {dates}"},
+    'it': {0: "oggi", 1: "domani", 'days': "tra {days} giorni", 'text': "🔔 Promemoria: \"{title}\" è {when}.\n📅 {dates}"},
+}
+
+def reminder_text(event: CalendarEvent, offset_days: int, lang: str) -> str:
+    texts = REMINDER_TEXTS.get(lang, REMINDER_TEXTS['fa'])
+    when = texts[offset_days] if offset_days in texts else texts['days'].format(days=offset_days)
+    dates = event.start.isoformat() if event.start == event.end else f"{event.start.isoformat()} → {event.end.isoformat()}"
+    return texts['text'].format(title=event.title.get(lang) or event.title.get('en', ''), when=when, dates=dates)
+
+class ReminderScheduler:
+    """
+    زمان‌بند یادآوری‌های اختیاری رویدادهای تقویم و مهلت بورسیه‌ها.
+
+    - اشتراک‌ها در جدول reminder_subscriptions ذخیره می‌شوند؛ هر اشتراک برای هر فاصله REMINDER_OFFSET_DAYS یک
+      عضو «user_id|offset|event_uid» با امتیاز زمان ارسال (epoch) در یک sorted set مشترک Redis دارد. بدون Redis
+      همان ساختار به‌صورت min-heap درون‌پردازه‌ای نگه داشته می‌شود (حذف تنبل با دیکشنری عضو -> زمان).
+    - به‌جای یک job برای هر کاربر فقط یک job یک‌باره در JobQueue برای زودترین زمان سررسید وجود دارد. هر بیداری
+      دسته‌های REMINDER_BATCH_SIZE تایی سررسیده را برمی‌دارد (O(log n) برای هر عضو، بدون پیمایش همه)، با
+      محدودکننده مشترک ارسال می‌فرستد و job را برای سررسید بعدی تنظیم می‌کند.
+    - برداشتن هر عضو با ZREM انجام می‌شود و فقط replicaای که ZREM آن موفق بوده پیام را می‌فرستد.
+      خواب هر job حداکثر REMINDER_MAX_SLEEP است تا اشتراک‌های ثبت‌شده روی replicaهای دیگر هم دیده شوند.
+    """
+
+    def __init__(self, redis_client: Any = _MISSING, batch_size: int = REMINDER_BATCH_SIZE,
+                 offsets: Tuple[int, ...] = REMINDER_OFFSET_DAYS, hour: int = REMINDER_HOUR,
+                 timezone: str = REMINDER_TIMEZONE, max_sleep: float = REMINDER_MAX_SLEEP,
+                 limiter: SendRateLimiter = telegram_rate_limiter, namespace: str = PERSISTENCE_NAMESPACE):
+        self._redis = redis_client
+        self.batch_size = batch_size
+        self.offsets = tuple(sorted(set(offsets), reverse=True))
+        self.hour = hour
+        self.timezone = ZoneInfo(timezone)
+        self.max_sleep = max_sleep
+        self.limiter = limiter
+        self.key = f"{namespace}:reminders"
+        self._heap: List[Tuple[float, str]] = []
+        self._scheduled: Dict[str, float] = {}
+        self._job_queue: Optional["JobQueue"] = None
+        self._job = None
+        self._job_at: Optional[float] = None
+        self._outcomes = {
+            outcome: REMINDERS_SENT.labels(outcome) for outcome in ("sent", "retried", "blocked", "stale", "failed")
+        }
+        REMINDERS_PENDING.set_function(self.pending)
+
+    @property
+    def redis(self) -> Optional["redis.Redis"]:
+        # اتصال Redis تا اولین استفاده ساخته نمی‌شود
+        if self._redis is _MISSING:
+            self._redis = get_redis_client()
+        return self._redis
+
+    # ---- اعضای زمان‌بندی ----
+
+    @staticmethod
+    def member(user_id: int, offset_days: int, event_uid: str) -> str:
+        return f"{user_id}|{offset_days}|{event_uid}"
+
+    @staticmethod
+    def parse_member(member: str) -> Tuple[int, int, str]:
+        user_id, offset_days, event_uid = member.split("|", 2)
+        return int(user_id), int(offset_days), event_uid
+
+    def reminder_times(self, user_id: int, event: CalendarEvent, now: Optional[float] = None) -> Dict[str, float]:
+        """اعضا و زمان ارسال یادآوری‌های آینده یک اشتراک (ساعت hour به وقت محلی، offset روز قبل از شروع)."""
+        now = time.time() if now is None else now
+        times = {}
+        for offset_days in self.offsets:
+            send_day = event.start - timedelta(days=offset_days)
+            at = datetime.combine(send_day, day_time(self.hour), tzinfo=self.timezone).timestamp()
+            if at > now:
+                times[self.member(user_id, offset_days, event.uid)] = at
+        return times
+
+    def _add(self, entries: Dict[str, float]) -> None:
+        if not entries:
+            return
+        client = self.redis
+        if client is not None:
+            try:
+                with track_dependency("redis", "reminders"):
+                    client.zadd(self.key, entries)
+                return
+            except Exception as e:
+                logger.error(f"Reminder Redis add failed, keeping {len(entries)} reminders in memory: {e}")
+        for member, at in entries.items():
+            self._scheduled[member] = at
+            heapq.heappush(self._heap, (at, member))
+
+    def _remove(self, members: List[str]) -> None:
+        if not members:
+            return
+        for member in members:
+            self._scheduled.pop(member, None)
+        client = self.redis
+        if client is not None:
+            try:
+                with track_dependency("redis", "reminders"):
+                    client.zrem(self.key, *members)
+            except Exception as e:
+                logger.error(f"Reminder Redis remove failed: {e}")
+
+    def _discard_stale_top(self) -> None:
+        while self._heap and self._scheduled.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def _claim_due(self, now: float, limit: int) -> List[str]:
+        """برداشتن حداکثر limit یادآوری سررسیده؛ هر عضو فقط برای یک replica برداشته می‌شود."""
+        claimed = []
+        self._discard_stale_top()
+        while self._heap and self._heap[0][0] <= now and len(claimed) < limit:
+            _, member = heapq.heappop(self._heap)
+            del self._scheduled[member]
+            claimed.append(member)
+            self._discard_stale_top()
+        client = self.redis
+        if client is not None and len(claimed) < limit:
+            try:
+                with track_dependency("redis", "reminders"):
+                    due = client.zrangebyscore(self.key, "-inf", now, start=0, num=limit - len(claimed))
+                    if due:
+                        pipe = client.pipeline(transaction=False)
+                        for member in due:
+                            pipe.zrem(self.key, member)
+                        removed = pipe.execute()
+                        claimed.extend(
+                            member.decode() if isinstance(member, bytes) else member
+                            for member, ok in zip(due, removed) if ok
+                        )
+            except Exception as e:
+                logger.error(f"Reminder Redis claim failed: {e}")
+        return claimed
+
+    def _next_due(self) -> Optional[float]:
+        self._discard_stale_top()
+        times = [self._heap[0][0]] if self._heap else []
+        client = self.redis
+        if client is not None:
+            try:
+                with track_dependency("redis", "reminders"):
+                    first = client.zrange(self.key, 0, 0, withscores=True)
+                if first:
+                    times.append(first[0][1])
+            except Exception as e:
+                logger.error(f"Reminder Redis peek failed: {e}")
+        return min(times) if times else None
+
+    def pending(self) -> int:
+        client = self.redis
+        if client is not None:
+            try:
+                return client.zcard(self.key) + len(self._scheduled)
+            except Exception:
+                pass
+        return len(self._scheduled)
+
+    # ---- اشتراک‌ها ----
+
+    def subscribed_uids(self, user_id: int) -> Set[str]:
+        with track_dependency("postgres", "reminders"):
+            with get_db_cursor(commit=False) as cursor:
+                cursor.execute("SELECT event_uid FROM reminder_subscriptions WHERE user_id = %s", (user_id,))
+                return {row[0] for row in cursor.fetchall()}
+
+    def subscribe(self, user_id: int, event: CalendarEvent) -> Dict[str, float]:
+        """ثبت اشتراک و یادآوری‌های آینده آن. خروجی: اعضا و زمان‌ها، برای زمان‌بندی job در حلقه رویداد."""
+        with track_dependency("postgres", "reminders"):
+            with get_db_cursor() as cursor:
+                cursor.execute(
+                    "INSERT INTO reminder_subscriptions (user_id, event_uid) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+                    (user_id, event.uid)
+                )
+        times = self.reminder_times(user_id, event)
+        self._add(times)
+        return times
+
+    def unsubscribe(self, user_id: int, event_uid: str) -> None:
+        with track_dependency("postgres", "reminders"):
+            with get_db_cursor() as cursor:
+                cursor.execute(
+                    "DELETE FROM reminder_subscriptions WHERE user_id = %s AND event_uid = %s", (user_id, event_uid)
+                )
+        self._remove([self.member(user_id, offset_days, event_uid) for offset_days in self.offsets])
+
+    async def toggle(self, user_id: int, event: CalendarEvent) -> bool:
+        """
+        تغییر اشتراک کاربر در یک رویداد. خروجی: True اگر اکنون مشترک است. کار Postgres و Redis در thread جدا
+        انجام می‌شود؛ job فقط در حلقه رویداد زمان‌بندی می‌شود چون JobQueue برای threadها امن نیست.
+        """
+        if event.uid in await asyncio.to_thread(self.subscribed_uids, user_id):
+            await asyncio.to_thread(self.unsubscribe, user_id, event.uid)
+            return False
+        times = await asyncio.to_thread(self.subscribe, user_id, event)
+        if times:
+            self._schedule(min(times.values()))
+        return True
+
+    def _unsubscribe_user(self, user_id: int) -> None:
+        """حذف همه اشتراک‌های کاربری که ربات را مسدود کرده است."""
+        for event_uid in self.subscribed_uids(user_id):
+            self.unsubscribe(user_id, event_uid)
+
+    def rebuild(self) -> int:
+        """
+        بازسازی یادآوری‌های آینده از جدول اشتراک‌ها (هنگام راه‌اندازی؛ تاریخ‌های تغییرکرده پایگاه دانش هم اعمال
+        می‌شوند). افزودن دوباره عضو موجود فقط امتیازش را به‌روز می‌کند. خروجی: تعداد یادآوری‌های زمان‌بندی‌شده.
+        """
+        index = get_calendar_index()
+        now = time.time()
+        total = 0
+        with track_dependency("postgres", "reminders"):
+            with get_db_cursor(commit=False) as cursor:
+                cursor.execute("SELECT user_id, event_uid FROM reminder_subscriptions")
+                while True:
+                    rows = cursor.fetchmany(REBUILD_FETCH_SIZE)
+                    if not rows:
+                        break
+                    entries: Dict[str, float] = {}
+                    for user_id, event_uid in rows:
+                        event = index.get(event_uid)
+                        if event is not None:
+                            entries.update(self.reminder_times(user_id, event, now))
+                    self._add(entries)
+                    total += len(entries)
+        logger.info(f"Reminder schedule rebuilt with {total} upcoming reminders.")
+        return total
+
+    # ---- زمان‌بندی و ارسال ----
+
+    def attach(self, job_queue: "JobQueue") -> None:
+        """ثبت در JobQueue؛ زمان‌بندی پس از بازسازی از پایگاه داده در اولین اجرای job شروع می‌شود."""
+        self._job_queue = job_queue
+        job_queue.run_once(self._startup_job, when=30, name="reminders_rebuild")
+
+    async def _startup_job(self, context: "ContextTypes.DEFAULT_TYPE") -> None:
+        try:
+            await asyncio.to_thread(self.rebuild)
+        except Exception as e:
+            logger.error(f"Reminder schedule rebuild failed: {e}")
+        await self._run(context)
+
+    def _schedule(self, at: float) -> None:
+        """اطمینان از اینکه job بعدی دیرتر از at اجرا نمی‌شود (فقط یک job فعال)."""
+        if self._job_queue is None:
+            return
+        if self._job is not None and self._job_at is not None and self._job_at <= at:
+            return
+        if self._job is not None:
+            self._job.schedule_removal()
+        delay = min(max(0.0, at - time.time()), self.max_sleep)
+        self._job_at = time.time() + delay
+        self._job = self._job_queue.run_once(self._run, when=delay, name="reminders")
+
+    async def _run(self, context: "ContextTypes.DEFAULT_TYPE") -> None:
+        self._job = self._job_at = None
+        try:
+            while True:
+                claimed = await asyncio.to_thread(self._claim_due, time.time(), self.batch_size)
+                if claimed:
+                    await self.send_batch(context.bot, claimed)
+                if len(claimed) < self.batch_size:
+                    break
+        except Exception as e:
+            logger.error(f"Reminder run failed: {e}")
+        next_due = await asyncio.to_thread(self._next_due)
+        self._schedule(next_due if next_due is not None else time.time() + self.max_sleep)
+
+    async def send_batch(self, bot: "Bot", members: Iterable[str]) -> None:
+        """ارسال یک دسته هم‌زمان؛ سرعت واقعی را محدودکننده مشترک ارسال تعیین می‌کند."""
+        await asyncio.gather(*(self._send(bot, member) for member in members))
+
+    async def _send(self, bot: "Bot", member: str) -> None:
+        from telegram.error import Forbidden, RetryAfter
+        user_id, offset_days, event_uid = self.parse_member(member)
+        event = get_calendar_index().get(event_uid)
+        if event is None or event.end < date.today():
+            self._outcomes["stale"].inc()
+            return
+        # در نبود پروفایل در cache، get_profile به Postgres می‌رود
+        profile = await asyncio.to_thread(user_cache.get_profile, user_id)
+        lang = (profile or {}).get('language') or 'fa'
+        await self.limiter.acquire(user_id)
+        try:
+            await bot.send_message(
+                chat_id=user_id,
+                text=sanitize_markdown(reminder_text(event, offset_days, lang)),
+                parse_mode='MarkdownV2'
+            )
+            self._outcomes["sent"].inc()
+        except RetryAfter as e:
+            retry_after = retry_after_seconds(e)
+            await self.limiter.pause(retry_after)
+            await asyncio.to_thread(self._add, {member: time.time() + retry_after})
+            self._outcomes["retried"].inc()
+        except Forbidden:
+            logger.info(f"User {user_id} blocked the bot; removing their reminder subscriptions.")
+            self._outcomes["blocked"].inc()
+            await asyncio.to_thread(self._unsubscribe_user, user_id)
+        except Exception as e:
+            logger.error(f"Failed to send reminder {member}: {e}")
+            self._outcomes["failed"].inc()
+
+reminder_scheduler = ReminderScheduler()
@@ -0,0 +1,244 @@
+from bisect import bisect_left
+from datetime import date
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, TYPE_CHECKING
+
+from src.config import logger
+from src.data.callback_ids import callback_ids
+from src.data.knowledge_base import get_knowledge_base, get_knowledge_base_version
+from src.database import get_db_cursor
+from src.services.user_cache import user_cache
+
+if TYPE_CHECKING:
+    from telegram.ext import ContextTypes
+
+INFINITY = float('inf')
+# بورسیه بدون ددلاین پس از همه بورسیه‌های دارای ددلاین مرتب می‌شود
+NO_DEADLINE = date.max
+
+class Scholarship(NamedTuple):
+    key: str
+    title: Dict[str, str]
+    amount: float
+    isee_max: float
+    age_min: int
+    age_max: int
+    deadline: date
+    # None یعنی محدودیت زبان ندارد
+    languages: Optional[frozenset]
+    callback: Optional[str]
+    link: str
+
+def _parse_date(value) -> Optional[date]:
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(str(value).strip())
+    except ValueError:
+        return None
+
+def _parse_number(value, default: float) -> float:
+    if value in (None, ''):
+        return default
+    try:
+        return float(str(value).replace(',', ''))
+    except ValueError:
+        return default
+
+def _parse_languages(value) -> Optional[frozenset]:
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    languages = frozenset(str(lang).strip().lower() for lang in value if str(lang).strip())
+    return languages or None
+
+def scholarship_from_criteria(key: str, title: Dict[str, str], criteria: Dict,
+                              callback: Optional[str] = None, link: str = '') -> Scholarship:
+    """ساخت یک رکورد از معیارهای ساخت‌یافته؛ معیار ناموجود یعنی بدون محدودیت."""
+    return Scholarship(
+        key=key,
+        title=title,
+        amount=_parse_number(criteria.get('amount'), 0),
+        isee_max=_parse_number(criteria.get('isee_max'), INFINITY),
+        age_min=int(_parse_number(criteria.get('age_min'), 0)),
+        age_max=int(_parse_number(criteria.get('age_max'), 1000)),
+        deadline=_parse_date(criteria.get('deadline')) or NO_DEADLINE,
+        languages=_parse_languages(criteria.get('languages')),
+        callback=callback,
+        link=link,
+    )
+
+def scholarships_from_knowledge_base(knowledge_base: Dict) -> List[Scholarship]:
+    """آیتم‌هایی از پایگاه دانش که کلید «criteria» دارند."""
+    scholarships = []
+    for category, items in knowledge_base.items():
+        if not isinstance(items, list):
+            continue
+        for item in items:
+            if not isinstance(item, dict) or not isinstance(item.get('criteria'), dict):
+                continue
+            item_id = str(item.get('id', ''))
+            scholarships.append(scholarship_from_criteria(
+                f"kb:{category}:{item_id}", item.get('title', {}), item['criteria'],
+                callback=callback_ids.encode(category, item_id), link=item['criteria'].get('link', '')
+            ))
+    return scholarships
+
+def scholarships_from_sheet(records: Iterable[Dict]) -> List[Scholarship]:
+    """
+    ردیف‌های شیت Scholarship؛ ستون‌های معیار: isee_max، age_min، age_max، deadline، amount، languages.
+    فقط ردیف‌هایی که isee_max عددی یا deadline معتبر ISO دارند وارد تطبیق می‌شوند؛ ردیف با deadline
+    ناخوانا به‌جای «بدون ددلاین» شدن کنار گذاشته و لاگ می‌شود.
+    """
+    scholarships = []
+    skipped = 0
+    for index, record in enumerate(records):
+        deadline = record.get('deadline')
+        if deadline not in (None, '') and _parse_date(deadline) is None:
+            logger.warning(f"Skipping scholarship sheet row {index + 2}: unparseable deadline {deadline!r}")
+            skipped += 1
+            continue
+        if _parse_number(record.get('isee_max'), INFINITY) == INFINITY and _parse_date(deadline) is None:
+            skipped += 1
+            continue
+        title = {lang: record.get(f'title_{lang}') or record.get('title_en', '') for lang in ('fa', 'en', 'it')}
+        scholarships.append(scholarship_from_criteria(f"sheet:{index}", title, record, link=record.get('link', '')))
+    if skipped:
+        logger.info(f"Scholarship sheet: {len(scholarships)} rows with criteria, {skipped} rows skipped.")
+    return scholarships
+
+class ScholarshipIndex:
+    """
+    ایندکس بورسیه‌ها برای پیدا کردن موارد واجد شرایط بدون پیمایش همه رکوردها:
+    - شناسه‌ها مرتب بر اساس سقف ISEE و بر اساس ددلاین؛ با bisect پسوندی که شرط ISEE یا باز بودن را دارد پیدا
+      می‌شود و از پسوند کوتاه‌تر شروع می‌کنیم.
+    - بازه سنی و زبان برای همان نامزدها با مقایسه O(1) بررسی می‌شوند.
+    - رتبه هر بورسیه در ترتیب نهایی (ددلاین نزدیک‌تر، سپس مبلغ بیشتر) از پیش حساب شده است.
+    """
+
+    def __init__(self, scholarships: Sequence[Scholarship]):
+        self.scholarships = list(scholarships)
+        by_isee = sorted(range(len(self.scholarships)), key=lambda i: self.scholarships[i].isee_max)
+        self._isee_ids = by_isee
+        self._isee_keys = [self.scholarships[i].isee_max for i in by_isee]
+        by_deadline = sorted(range(len(self.scholarships)),
+                             key=lambda i: (self.scholarships[i].deadline, -self.scholarships[i].amount))
+        self._deadline_ids = by_deadline
+        self._deadline_keys = [self.scholarships[i].deadline for i in by_deadline]
+        self._rank = [0] * len(self.scholarships)
+        for rank, i in enumerate(by_deadline):
+            self._rank[i] = rank
+
+    def _eligible(self, i: int, isee_value: Optional[float], age: Optional[int], language: Optional[str]) -> bool:
+        scholarship = self.scholarships[i]
+        if isee_value is not None and scholarship.isee_max < isee_value:
+            return False
+        if age is not None and not (scholarship.age_min <= age <= scholarship.age_max):
+            return False
+        return not language or scholarship.languages is None or language in scholarship.languages
+
+    def __len__(self) -> int:
+        return len(self.scholarships)
+
+    def match(self, isee_value: Optional[float] = None, age: Optional[int] = None,
+              language: Optional[str] = None, today: Optional[date] = None, limit: Optional[int] = None
+              ) -> List[Scholarship]:
+        """بورسیه‌های باز و واجد شرایط، مرتب بر اساس ددلاین و سپس مبلغ. معیار None بررسی نمی‌شود."""
+        today = today or date.today()
+        open_start = bisect_left(self._deadline_keys, today)
+        open_count = len(self._deadline_ids) - open_start
+        if isee_value is not None:
+            isee_start = bisect_left(self._isee_keys, isee_value)
+            isee_count = len(self._isee_ids) - isee_start
+        else:
+            isee_start, isee_count = 0, len(self._isee_ids)
+
+        if isee_count * 4 < open_count:
+            # پسوند ISEE خیلی کوتاه‌تر است: همه آن بررسی و سپس بر اساس رتبه نهایی مرتب می‌شود
+            matches = sorted(
+                (i for i in self._isee_ids[isee_start:]
+                 if self.scholarships[i].deadline >= today and self._eligible(i, None, age, language)),
+                key=self._rank.__getitem__
+            )[:limit]
+        else:
+            # بورسیه‌های باز از قبل به ترتیب نهایی‌اند؛ با رسیدن به limit پیمایش متوقف می‌شود
+            matches = []
+            for i in self._deadline_ids[open_start:]:
+                if self._eligible(i, isee_value, age, language):
+                    matches.append(i)
+                    if limit is not None and len(matches) >= limit:
+                        break
+        return [self.scholarships[i] for i in matches]
+
+class ScholarshipMatcher:
+    """ایندکس بورسیه‌های پایگاه دانش و شیت؛ با تغییر نسخه پایگاه دانش یا ردیف‌های شیت دوباره ساخته می‌شود."""
+
+    def __init__(self):
+        self._index: Optional[ScholarshipIndex] = None
+        self._version: Optional[str] = None
+        self._sheet: List[Scholarship] = []
+
+    @property
+    def index(self) -> ScholarshipIndex:
+        version = get_knowledge_base_version()
+        if self._index is None or version != self._version:
+            scholarships = scholarships_from_knowledge_base(get_knowledge_base()) + self._sheet
+            self._index = ScholarshipIndex(scholarships)
+            self._version = version
+            logger.info(f"Scholarship index built with {len(scholarships)} entries.")
+        return self._index
+
+    def set_sheet_records(self, records: Iterable[Dict]) -> None:
+        self._sheet = scholarships_from_sheet(records)
+        self._index = None
+
+    def match_for_user(self, user_id: int, isee_value: Optional[float] = None,
+                       limit: Optional[int] = None) -> List[Scholarship]:
+        """
+        بورسیه‌های واجد شرایط برای کاربر بر اساس سن و زبان پروفایل و آخرین ISEE.
+        اگر isee_value داده نشود آخرین محاسبه کاربر از پایگاه داده خوانده می‌شود.
+        """
+        profile = user_cache.get_profile(user_id) or {}
+        if isee_value is None:
+            isee_value = latest_isee_value(user_id)
+        return self.index.match(isee_value=isee_value, age=profile.get('age'), language=profile.get('language'),
+                                limit=limit)
+
+def latest_isee_value(user_id: int) -> Optional[float]:
+    with get_db_cursor(commit=False) as cursor:
+        cursor.execute(
+            "SELECT isee_value FROM isee_calculations WHERE user_id = %s ORDER BY calculation_date DESC LIMIT 1",
+            (user_id,)
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+def format_matches(matches: Sequence[Scholarship], lang: str) -> str:
+    """فهرست متنی بورسیه‌ها (متن ساده، پیش از اسکیپ MarkdownV2)."""
+    headers = {
+        'fa': "🎯 بورسیه‌های مناسب شما:",
+        'en': "🎯 Scholarships you qualify for:",
+        'it': "🎯 Borse di studio adatte a te:"
+    }
+    deadline_labels = {'fa': "مهلت", 'en': "deadline", 'it': "scadenza"}
+    lines = [headers.get(lang, headers['en'])]
+    for scholarship in matches:
+        title = scholarship.title.get(lang) or scholarship.title.get('en', '')
+        details = []
+        if scholarship.amount:
+            details.append(f"{scholarship.amount:,.0f} €")
+        if scholarship.deadline != NO_DEADLINE:
+            details.append(f"{deadline_labels.get(lang, 'deadline')}: {scholarship.deadline.isoformat()}")
+        lines.append(f"• {title}" + (f" ({', '.join(details)})" if details else ""))
+    return "\n".join(lines)
+
+scholarship_matcher = ScholarshipMatcher()
+
+async def refresh_scholarship_sheet_job(context: "ContextTypes.DEFAULT_TYPE") -> None:
+    """کار زمان‌بندی‌شده JobQueue: افزودن ردیف‌های شیت Scholarship به ایندکس تطبیق."""
+    from src.services.google_sheets_service import get_scholarship_records_from_sheet
+    try:
+        scholarship_matcher.set_sheet_records(await get_scholarship_records_from_sheet())
+    except Exception as e:
+        logger.error(f"Scholarship sheet refresh failed, keeping previous rows: {e}")
+
@@ -5,8 +5,9 @@ from src.config import logger
 from src.utils.text_formatter import sanitize_markdown
 from src.utils.paginator import Paginator
 from src.utils.keyboard_builder import get_main_menu_keyboard
-from src.database import get_db_cursor
-from src.data.knowledge_base import search_knowledge_base, get_content_by_path
+from src.services.user_cache import user_cache
+from src.data.knowledge_base import search_knowledge_base, get_content_pages
+from src.utils.metrics import instrument_handler
 
 class SearchEngine:
     def __init__(self, paginator: Paginator):
@@ -16,6 +17,7 @@ class SearchEngine:
         """بازگشت handler برای جستجو."""
         return MessageHandler(filters.TEXT & ~filters.COMMAND, self.search)
 
+    @instrument_handler("search")
     async def search(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """مدیریت جستجوی کاربر."""
         from src.handlers.user_manager import MAIN_MENU
@@ -24,10 +26,7 @@ class SearchEngine:
             return MAIN_MENU
         query = update.message.text.lower()
         user_id = update.effective_user.id
-        with get_db_cursor() as cur:
-            cur.execute("SELECT language FROM users WHERE telegram_id = %s", (user_id,))
-            result = cur.fetchone()
-            lang = result[0] if result else 'fa'
+        lang = user_cache.get_language(user_id)
 
         try:
             # استفاده از search_knowledge_base برای جستجو
@@ -46,16 +45,11 @@ class SearchEngine:
                 context.user_data['awaiting_search_query'] = False
                 return MAIN_MENU
 
-            # آماده‌سازی محتوا برای صفحه‌بندی
+            # آماده‌سازی محتوا برای صفحه‌بندی؛ نتایج طولانی به چند صفحه شکسته می‌شوند
             formatted_results = []
             for result in results:
-                callback = result['callback'].replace("menu:", "")
-                content, file_path = get_content_by_path(callback.split(":"), lang)
-                formatted_results.append({
-                    "content": content,
-                    "file_path": file_path,
-                    "callback": result['callback']
-                })
+                pages, file_path = get_content_pages(result['path'], lang)
+                formatted_results.extend(self.paginator.content_pages(pages, file_path, result['callback']))
 
             # ذخیره نتایج در Paginator
             self.paginator.create_session(user_id, formatted_results, 'search')
@@ -68,9 +62,7 @@ class SearchEngine:
 
             # ارسال محتوا و فایل (اگه وجود داره)
             await update.message.reply_text(
-                sanitize_markdown(f"{page_data['content']['content']}\n\nصفحه {page_data['page_num']} از {page_data['total_pages']}" if lang == 'fa' else
-                                f"{page_data['content']['content']}\n\nPage {page_data['page_num']} of {page_data['total_pages']}" if lang == 'en' else
-                                f"{page_data['content']['content']}\n\nPagina {page_data['page_num']} di {page_data['total_pages']}"),
+                sanitize_markdown(self.paginator.format_page(page_data, lang)),
                 parse_mode='MarkdownV2',
                 reply_markup=self.paginator.get_pagination_markup(page_data, lang)
             )
@@ -0,0 +1,53 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING
+
+from src.config import logger, SESSION_RETENTION_DAYS, SESSION_PURGE_BATCH_SIZE
+from src.database import get_db_cursor
+from src.utils.metrics import Counter, track_dependency
+
+if TYPE_CHECKING:
+    from telegram.ext import ContextTypes
+
+SESSIONS_PURGED = Counter("sessions_purged_total", "Expired rows deleted from the sessions table")
+
+# مکث بین دسته‌ها تا autovacuum و نوشتن‌های عادی فرصت گرفتن قفل و I/O داشته باشند (ثانیه)
+PURGE_BATCH_PAUSE = 0.1
+
+# هر دسته تراکنش کوتاه خودش را دارد؛ SKIP LOCKED اجازه می‌دهد چند replica هم‌زمان بدون انتظار روی هم purge کنند
+PURGE_BATCH_SQL = """
+DELETE FROM sessions WHERE id IN (
+    SELECT id FROM sessions WHERE created_at < %s LIMIT %s FOR UPDATE SKIP LOCKED
+)
+"""
+
+def purge_batch(cutoff: datetime, batch_size: int = SESSION_PURGE_BATCH_SIZE) -> int:
+    """حذف حداکثر batch_size سشن قدیمی‌تر از cutoff در یک تراکنش. خروجی: تعداد ردیف‌های حذف‌شده."""
+    with track_dependency("postgres", "session_purge"):
+        with get_db_cursor() as cursor:
+            cursor.execute(PURGE_BATCH_SQL, (cutoff, batch_size))
+            deleted = cursor.rowcount
+    SESSIONS_PURGED.inc(deleted)
+    return deleted
+
+async def purge_expired_sessions(retention_days: int = SESSION_RETENTION_DAYS,
+                                 batch_size: int = SESSION_PURGE_BATCH_SIZE) -> int:
+    """حذف دسته‌ای همه سشن‌های قدیمی‌تر از retention_days روز. خروجی: تعداد کل ردیف‌های حذف‌شده."""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    total = 0
+    while True:
+        deleted = await asyncio.to_thread(purge_batch, cutoff, batch_size)
+        total += deleted
+        if deleted < batch_size:
+            break
+        await asyncio.sleep(PURGE_BATCH_PAUSE)
+    if total:
+        logger.info(f"Purged {total} sessions older than {retention_days} days.")
+    return total
+
+async def purge_sessions_job(context: "ContextTypes.DEFAULT_TYPE") -> None:
+    """کار زمان‌بندی‌شده JobQueue برای purge سشن‌های منقضی."""
+    try:
+        await purge_expired_sessions()
+    except Exception as e:
+        logger.error(f"Session purge failed: {e}")
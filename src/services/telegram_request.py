@@ -0,0 +1,32 @@
+from typing import Any, Tuple
+
+from telegram.request import HTTPXRequest
+
+from src.utils.metrics import DEPENDENCY_ERRORS, DEPENDENCY_LATENCY, track_dependency
+
+# متدهای Bot API که ربات صدا می‌زند؛ هر مسیر دیگری زیر «other» شمرده می‌شود تا تعداد سری‌ها محدود بماند
+TELEGRAM_METHODS = frozenset({
+    "getMe", "getUpdates", "setWebhook", "deleteWebhook", "getWebhookInfo", "setMyCommands",
+    "sendMessage", "editMessageText", "editMessageReplyMarkup", "deleteMessage", "answerCallbackQuery",
+    "sendDocument", "sendPhoto", "sendVoice", "sendChatAction", "forwardMessage", "copyMessage", "getFile",
+})
+FILE_DOWNLOAD = "file_download"
+OTHER_METHOD = "other"
+
+_OPERATIONS = tuple(("telegram", method) for method in (*sorted(TELEGRAM_METHODS), FILE_DOWNLOAD, OTHER_METHOD))
+DEPENDENCY_LATENCY.prealloc(_OPERATIONS)
+DEPENDENCY_ERRORS.prealloc(_OPERATIONS)
+
+def telegram_operation(url: str) -> str:
+    """برچسب متریک برای یک URL ربات: نام متد، «file_download» برای دانلود فایل، یا «other»."""
+    if "/file/bot" in url:
+        return FILE_DOWNLOAD
+    method = url.rsplit('/', 1)[-1]
+    return method if method in TELEGRAM_METHODS else OTHER_METHOD
+
+class InstrumentedRequest(HTTPXRequest):
+    """درخواست HTTP تلگرام که تأخیر هر متد Bot API را در متریک‌ها ثبت می‌کند."""
+
+    async def do_request(self, url: str, method: str, *args: Any, **kwargs: Any) -> Tuple[int, bytes]:
+        with track_dependency("telegram", telegram_operation(url)):
+            return await super().do_request(url, method, *args, **kwargs)
@@ -0,0 +1,193 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple, TYPE_CHECKING
+
+from src.config import logger, PERSISTENCE_NAMESPACE, USER_CACHE_SIZE, USER_CACHE_TTL, USER_CACHE_REDIS_TTL
+from src.database import get_db_cursor, get_redis_client
+from src.utils.metrics import Counter, Gauge, track_dependency
+
+if TYPE_CHECKING:
+    import redis
+
+PROFILE_FIELDS = ("first_name", "last_name", "age", "email", "language", "score")
+
+USER_CACHE_LOOKUPS = Counter(
+    "user_cache_lookups_total", "User profile lookups by where they were answered", labelnames=("result",)
+)
+USER_CACHE_LOOKUPS.prealloc([("local_hit",), ("redis_hit",), ("miss",), ("stale",)])
+USER_CACHE_SIZE_GAUGE = Gauge("user_cache_entries", "User profiles held in the in-process cache")
+
+_MISSING = object()
+
+class UserProfileCache:
+    """
+    کش read-through پروفایل کاربران جلوی جدول users.
+    - لایه اول: LRU درون‌پردازه‌ای با TTL کوتاه (پاسخ بدون هیچ I/O).
+    - لایه دوم: Redis مشترک بین replicaها؛ هر ورودی شماره نسخه کاربر را همراه دارد.
+    - نوشتن‌ها (ثبت‌نام، تغییر زبان) پس از commit در Postgres شماره نسخه را در Redis افزایش می‌دهند. ورودی‌ای که
+      از خواندن پیش از آن نوشتن ساخته شده نسخه قدیمی دارد و هنگام خواندن رد می‌شود (محافظت در برابر خواندن کهنه).
+    نبودِ کاربر cache نمی‌شود تا ثبت‌نام روی replica دیگر فوراً دیده شود.
+    """
+
+    def __init__(self, redis_client: Any = _MISSING, size: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL,
+                 redis_ttl: int = USER_CACHE_REDIS_TTL, namespace: str = PERSISTENCE_NAMESPACE):
+        self._redis = redis_client
+        self.size = size
+        self.ttl = ttl
+        self.redis_ttl = redis_ttl
+        self.namespace = namespace
+        # user_id -> (زمان انقضا, پروفایل)
+        self._entries: "OrderedDict[int, Tuple[float, Dict]]" = OrderedDict()
+        self.lookups = USER_CACHE_LOOKUPS
+        self._local_hits = USER_CACHE_LOOKUPS.labels("local_hit")
+        self._redis_hits = USER_CACHE_LOOKUPS.labels("redis_hit")
+        self._misses = USER_CACHE_LOOKUPS.labels("miss")
+        self._stale = USER_CACHE_LOOKUPS.labels("stale")
+        USER_CACHE_SIZE_GAUGE.set_function(lambda: len(self._entries))
+
+    @property
+    def redis(self) -> Optional["redis.Redis"]:
+        # اتصال Redis تا اولین استفاده ساخته نمی‌شود
+        if self._redis is _MISSING:
+            self._redis = get_redis_client()
+        return self._redis
+
+    def _key(self, user_id: int) -> str:
+        return f"{self.namespace}:user:{user_id}"
+
+    def _version_key(self, user_id: int) -> str:
+        return f"{self.namespace}:user:{user_id}:version"
+
+    # ---- لایه محلی ----
+
+    def _local_get(self, user_id: int) -> Any:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return _MISSING
+        expires_at, profile = entry
+        if expires_at <= time.monotonic():
+            del self._entries[user_id]
+            return _MISSING
+        self._entries.move_to_end(user_id)
+        return profile
+
+    def _local_put(self, user_id: int, profile: Dict) -> None:
+        self._entries[user_id] = (time.monotonic() + self.ttl, profile)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    # ---- لایه Redis ----
+
+    def _redis_get(self, user_id: int) -> Tuple[Any, int]:
+        """خروجی: (پروفایل یا _MISSING، نسخه فعلی کاربر)."""
+        client = self.redis
+        if client is None:
+            return _MISSING, 0
+        try:
+            with track_dependency("redis", "user_cache_get"):
+                raw, version = client.mget(self._key(user_id), self._version_key(user_id))
+        except Exception as e:
+            logger.error(f"Redis user cache read failed for user {user_id}: {e}")
+            return _MISSING, 0
+        version = int(version or 0)
+        if not raw:
+            return _MISSING, version
+        entry = json.loads(raw)
+        if entry.get("v") != version:
+            self._stale.inc()
+            return _MISSING, version
+        return entry.get("p"), version
+
+    def _redis_put(self, user_id: int, profile: Dict, version: int) -> None:
+        client = self.redis
+        if client is None:
+            return
+        try:
+            with track_dependency("redis", "user_cache_set"):
+                client.set(self._key(user_id), json.dumps({"v": version, "p": profile}, ensure_ascii=False),
+                           ex=self.redis_ttl)
+        except Exception as e:
+            logger.error(f"Redis user cache write failed for user {user_id}: {e}")
+
+    def _bump_version(self, user_id: int) -> int:
+        client = self.redis
+        if client is None:
+            return 0
+        try:
+            with track_dependency("redis", "user_cache_set"):
+                version = int(client.incr(self._version_key(user_id)))
+                # نسخه منقضی‌شده به 0 برمی‌گردد و ورودی‌های قدیمی را نامعتبر می‌کند، پس انقضا امن است
+                client.expire(self._version_key(user_id), self.redis_ttl)
+            return version
+        except Exception as e:
+            logger.error(f"Redis user cache version bump failed for user {user_id}: {e}")
+            return 0
+
+    # ---- API ----
+
+    def get_profile(self, user_id: int) -> Optional[Dict]:
+        """پروفایل کاربر (دیکشنری با PROFILE_FIELDS) یا None اگر ثبت‌نام نکرده باشد. خطای پایگاه داده منتشر می‌شود."""
+        profile = self._local_get(user_id)
+        if profile is not _MISSING:
+            self._local_hits.inc()
+            return profile
+
+        profile, version = self._redis_get(user_id)
+        if profile is not _MISSING:
+            self._redis_hits.inc()
+        else:
+            self._misses.inc()
+            profile = self._load_from_database(user_id)
+            if profile is None:
+                return None
+            # با نسخه‌ای که پیش از خواندن Postgres دیده شد ذخیره می‌شود؛ اگر در این فاصله نوشتنی رخ داده باشد
+            # نسخه تغییر کرده و این ورودی در خواندن بعدی رد می‌شود
+            self._redis_put(user_id, profile, version)
+        self._local_put(user_id, profile)
+        return profile
+
+    def get_language(self, user_id: int, default: str = 'fa') -> str:
+        profile = self.get_profile(user_id)
+        return (profile or {}).get("language") or default
+
+    def store_profile(self, user_id: int, profile: Dict) -> None:
+        """ثبت پروفایل تازه نوشته‌شده در Postgres (مثلاً پس از ثبت‌نام) در هر دو لایه."""
+        profile = {field: profile.get(field) for field in PROFILE_FIELDS}
+        self._local_put(user_id, profile)
+        version = self._bump_version(user_id)
+        self._redis_put(user_id, profile, version)
+
+    def update_language(self, user_id: int, language: str) -> None:
+        """ذخیره زبان جدید در Postgres و به‌روزرسانی cache."""
+        with get_db_cursor() as cursor:
+            cursor.execute("UPDATE users SET language = %s WHERE telegram_id = %s", (language, user_id))
+        profile = self._local_get(user_id)
+        if profile is not _MISSING:
+            self.store_profile(user_id, dict(profile, language=language))
+        else:
+            self.invalidate(user_id)
+
+    def invalidate(self, user_id: int) -> None:
+        """حذف کاربر از cache پس از تغییری که پروفایل کامل آن در دسترس نیست."""
+        self._entries.pop(user_id, None)
+        self._bump_version(user_id)
+
+    def _load_from_database(self, user_id: int) -> Optional[Dict]:
+        with get_db_cursor() as cursor:
+            cursor.execute(
+                "SELECT first_name, last_name, age, email, language, score FROM users WHERE telegram_id = %s",
+                (user_id,)
+            )
+            row = cursor.fetchone()
+        return dict(zip(PROFILE_FIELDS, row)) if row else None
+
+    def stats(self) -> Dict[str, float]:
+        """تعداد پاسخ‌ها به تفکیک لایه و نرخ hit کل."""
+        counts = {labels[0]: child.value for labels, child in self.lookups.children()}
+        total = counts.get("local_hit", 0) + counts.get("redis_hit", 0) + counts.get("miss", 0)
+        hits = counts.get("local_hit", 0) + counts.get("redis_hit", 0)
+        return dict(counts, entries=len(self._entries), hit_rate=hits / total if total else 0.0)
+
+user_cache = UserProfileCache()
@@ -0,0 +1,242 @@
+import asyncio
+import json
+from typing import Awaitable, Callable, Dict, List, Optional, Set, TYPE_CHECKING
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+from src.config import logger
+from src.utils.metrics import REGISTRY
+from src.utils.update_deduplicator import UpdateDeduplicator
+
+if TYPE_CHECKING:
+    import redis
+
+# نوع آپدیت‌هایی که شناسه کاربر را در فیلد from دارند
+_USER_PAYLOAD_KEYS = (
+    "message", "edited_message", "callback_query", "inline_query",
+    "chosen_inline_result", "pre_checkout_query", "shipping_query",
+)
+
+Forwarder = Callable[[Dict], Awaitable[bool]]
+
+def extract_user_id(payload: Dict) -> Optional[int]:
+    """استخراج شناسه کاربر از JSON خام آپدیت بدون ساختن شیء Update."""
+    for key in _USER_PAYLOAD_KEYS:
+        section = payload.get(key)
+        if isinstance(section, dict):
+            user = section.get("from") or section.get("chat")
+            if isinstance(user, dict) and "id" in user:
+                return int(user["id"])
+    return None
+
+def shard_key(namespace: str, shard: int) -> str:
+    return f"{namespace}:updates:shard:{shard}"
+
+class LocalForwarder:
+    """
+    ارسال آپدیت به صف همان Application در حالت تک‌پردازه. اگر زمان‌بند آپدیت جای خالی
+    در مسیر نداشته باشد، یا ready (مثلاً آماده شدن طرح پایگاه داده) هنوز set نشده باشد،
+    آپدیت پذیرفته نمی‌شود تا webhook با 503 پاسخ دهد و تلگرام بعداً دوباره بفرستد.
+    تکراری‌ها (deduplicator زمان‌بند) پیش از پذیرش با 200 کنار گذاشته می‌شوند تا جای صف را نگیرند.
+    """
+
+    def __init__(self, application: Application, ready: Optional[asyncio.Event] = None):
+        self.application = application
+        self.ready = ready
+
+    async def __call__(self, payload: Dict) -> bool:
+        if self.ready is not None and not self.ready.is_set():
+            return False
+        processor = self.application.update_processor
+        deduplicator = getattr(processor, 'deduplicator', None)
+        update_id = payload.get("update_id")
+        if deduplicator is not None and not await deduplicator.claim(update_id):
+            return True
+        update = Update.de_json(payload, self.application.bot)
+        admit = getattr(processor, 'try_admit', None)
+        if admit is not None and not admit(update):
+            # تلاش مجدد تلگرام پس از 503 نباید تکراری شمرده شود
+            if deduplicator is not None:
+                await deduplicator.unclaim(update_id)
+            return False
+        await self.application.update_queue.put(update)
+        return True
+
+class ShardedForwarder:
+    """
+    پخش آپدیت‌ها بین N پردازه worker بر اساس شناسه کاربر از طریق لیست‌های Redis.
+    همه آپدیت‌های یک کاربر به یک worker می‌روند تا ترتیبشان حفظ شود. تکراری‌ها همین‌جا حذف
+    می‌شوند؛ worker آپدیت‌های بازگردانده از لیست processing را دوباره پردازش می‌کند.
+    """
+
+    def __init__(self, redis_client: "redis.Redis", num_workers: int, max_backlog: int,
+                 namespace: str = "scholarino", deduplicator: Optional[UpdateDeduplicator] = None):
+        self.redis = redis_client
+        self.num_workers = num_workers
+        self.max_backlog = max_backlog
+        self.namespace = namespace
+        self.deduplicator = deduplicator
+        # آخرین طول شناخته‌شده هر صف؛ برای backpressure بدون LLEN در هر درخواست
+        self._backlog: List[int] = [0] * num_workers
+
+    def shard_for(self, payload: Dict) -> int:
+        user_id = extract_user_id(payload)
+        if user_id is None:
+            user_id = payload.get("update_id", 0)
+        return user_id % self.num_workers
+
+    async def __call__(self, payload: Dict) -> bool:
+        shard = self.shard_for(payload)
+        key = shard_key(self.namespace, shard)
+        if self._backlog[shard] >= self.max_backlog:
+            self._backlog[shard] = await asyncio.to_thread(self.redis.llen, key)
+            if self._backlog[shard] >= self.max_backlog:
+                logger.warning(f"Worker shard {shard} is {self._backlog[shard]} updates behind; rejecting update.")
+                return False
+        update_id = payload.get("update_id")
+        if self.deduplicator is not None and not await self.deduplicator.claim(update_id):
+            return True
+        try:
+            self._backlog[shard] = await asyncio.to_thread(
+                self.redis.rpush, key, json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+            )
+        except Exception:
+            if self.deduplicator is not None:
+                await self.deduplicator.unclaim(update_id)
+            raise
+        return True
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    """خروجی متریک‌ها با فرمت متنی Prometheus."""
+    return web.Response(text=REGISTRY.render(), content_type="text/plain", charset="utf-8")
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """سرور جداگانه /metrics برای پردازه‌های worker که webhook ندارند."""
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Metrics server listening on {host}:{port}")
+    return runner
+
+class WebhookServer:
+    """سرور سبک aiohttp برای دریافت webhook تلگرام و تحویل آن به forwarder."""
+
+    def __init__(self, secret_token: str, forwarder: Forwarder, path: str = "/webhook"):
+        self.secret_token = secret_token
+        self.forwarder = forwarder
+        self.app = web.Application()
+        self.app.router.add_post(path, self.handle_webhook)
+        self.app.router.add_get("/healthz", self.handle_health)
+        self.app.router.add_get("/metrics", handle_metrics)
+        self._runner: Optional[web.AppRunner] = None
+
+    async def handle_webhook(self, request: web.Request) -> web.Response:
+        if request.headers.get("X-Telegram-Bot-Api-Secret-Token") != self.secret_token:
+            logger.warning("Rejected webhook request with invalid secret token.")
+            return web.Response(status=403)
+        try:
+            payload = await request.json()
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            logger.error(f"Invalid webhook payload: {e}")
+            return web.Response(status=400)
+        try:
+            accepted = await self.forwarder(payload)
+        except Exception as e:
+            logger.error(f"Error forwarding update {payload.get('update_id')}: {e}")
+            return web.Response(status=500)
+        # پاسخ 503 باعث می‌شود تلگرام بعداً دوباره تلاش کند (backpressure)
+        return web.Response(status=200 if accepted else 503)
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+    async def start(self, host: str, port: int) -> None:
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info(f"Webhook server listening on {host}:{port}")
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+def processing_key(namespace: str, shard: int) -> str:
+    return f"{namespace}:updates:processing:{shard}"
+
+def recover_processing(redis_client: "redis.Redis", key: str, processing: str) -> int:
+    """برگرداندن آپدیت‌های تأییدنشده اجرای قبلی به ابتدای صف shard، با همان ترتیب."""
+    recovered = 0
+    while redis_client.lmove(processing, key, "RIGHT", "LEFT") is not None:
+        recovered += 1
+    return recovered
+
+async def consume_shard(application: Application, redis_client: "redis.Redis", shard: int,
+                        namespace: str = "scholarino", stop_event: Optional[asyncio.Event] = None) -> None:
+    """
+    حلقه worker: خواندن آپدیت‌های یک shard از Redis و تحویل به Application.
+    فقط وقتی آپدیتی برداشته می‌شود که جای خالی باشد (حداکثر max_concurrent_updates آپدیت در جریان)،
+    تا بقیه در Redis بمانند و backpressure دریافت‌کننده کار کند. هر آپدیت با LMOVE به لیست processing
+    منتقل و پس از پایان پردازش حذف (ack) می‌شود؛ آپدیت‌های مانده از یک worker از کار افتاده هنگام
+    راه‌اندازی به صف برمی‌گردند. ترتیب آپدیت‌های هر کاربر را قفل کاربر در PriorityUpdateProcessor حفظ می‌کند.
+    """
+    key = shard_key(namespace, shard)
+    processing = processing_key(namespace, shard)
+    stop_event = stop_event or asyncio.Event()
+    processor = application.update_processor
+    slots = asyncio.Semaphore(processor.max_concurrent_updates)
+    tasks: Set[asyncio.Task] = set()
+
+    recovered = await asyncio.to_thread(recover_processing, redis_client, key, processing)
+    if recovered:
+        logger.warning(f"Re-queued {recovered} unacknowledged updates from {processing}")
+    logger.info(f"Worker consuming updates from {key}")
+
+    async def process(raw: str, update: Update) -> None:
+        try:
+            try:
+                await processor.process_update(update, application.process_update(update))
+            except Exception as e:
+                logger.error(f"Error processing update {update.update_id} from {key}: {e}")
+            # آپدیت لغوشده ack نمی‌شود تا در راه‌اندازی بعدی دوباره پردازش شود
+            await ack(raw)
+        finally:
+            slots.release()
+
+    async def ack(raw: str) -> None:
+        try:
+            await asyncio.to_thread(redis_client.lrem, processing, 1, raw)
+        except Exception as e:
+            logger.error(f"Error acknowledging update in {processing}: {e}")
+
+    try:
+        while not stop_event.is_set():
+            await slots.acquire()
+            try:
+                raw = await asyncio.to_thread(redis_client.blmove, key, processing, 1, "LEFT", "RIGHT")
+            except Exception as e:
+                slots.release()
+                logger.error(f"Error reading from {key}: {e}")
+                await asyncio.sleep(1)
+                continue
+            if raw is None:
+                slots.release()
+                continue
+            try:
+                update = Update.de_json(json.loads(raw), application.bot)
+            except Exception as e:
+                slots.release()
+                logger.error(f"Error decoding update from {key}: {e}")
+                await ack(raw)
+                continue
+            task = application.create_task(process(raw, update), update=update)
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        # آپدیت‌های در حال اجرا تمام و ack می‌شوند؛ بقیه در Redis برای اجرای بعدی می‌مانند
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
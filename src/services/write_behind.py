@@ -0,0 +1,384 @@
+import asyncio
+import json
+import os
+import socket
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple, TYPE_CHECKING
+
+from src.config import (
+    logger,
+    PERSISTENCE_NAMESPACE,
+    WRITE_BEHIND_BATCH_SIZE,
+    WRITE_BEHIND_FLUSH_INTERVAL,
+    WRITE_BEHIND_MAX_BACKOFF,
+)
+from src.database import get_db_cursor, get_redis_client
+from src.utils.metrics import Counter, Gauge, track_dependency
+
+if TYPE_CHECKING:
+    import redis
+
+# جدول‌های پشتیبانی‌شده: ستون‌ها و بخش ON CONFLICT دستور INSERT چندسطری
+TABLES: Dict[str, Tuple[Tuple[str, ...], str]] = {
+    "isee_calculations": (
+        ("user_id", "isee_value", "calculation_date", "client_id"), "ON CONFLICT (client_id) DO NOTHING"
+    ),
+    "sessions": (("session_id", "user_id", "data", "created_at"), "ON CONFLICT (session_id) DO NOTHING"),
+}
+# حداکثر سطر در هر دستور INSERT
+ROWS_PER_STATEMENT = 500
+
+WRITE_BEHIND_RECORDS = Counter(
+    "write_behind_records_total", "Records handled by the write-behind queue", labelnames=("outcome",)
+)
+WRITE_BEHIND_RECORDS.prealloc([("enqueued",), ("written",), ("retried",), ("dead",)])
+WRITE_BEHIND_PENDING = Gauge("write_behind_pending", "Records waiting in the write-behind queue")
+
+_MISSING = object()
+
+def _utcnow() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def build_insert(table: str, rows: Sequence[Sequence[Any]]) -> Tuple[str, List[Any]]:
+    """
+    ساخت یک INSERT چندسطری با پارامترهای %s (بدون وابستگی به psycopg2.extras). سطرهای کوتاه‌تر (رکوردهای
+    مانده در صف از نسخه قبل از افزودن ستون جدید) با NULL کامل می‌شوند.
+    """
+    columns, conflict = TABLES[table]
+    row_placeholder = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    sql = (
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
+        + ", ".join([row_placeholder] * len(rows))
+        + (f" {conflict}" if conflict else "")
+    )
+    params = [value for row in rows for value in (*row, *([None] * (len(columns) - len(row))))]
+    return sql, params
+
+class WriteBehindQueue:
+    """
+    صف نوشتن با تأخیر برای رکوردهایی که پاسخ کاربر نباید منتظرشان بماند (محاسبات ISEE و سشن‌ها).
+
+    - رکوردها با enqueue (بدون I/O پایگاه داده) ثبت می‌شوند. اگر Redis در دسترس باشد در یک لیست Redis
+      نگه داشته می‌شوند تا ری‌استارت پردازه آن‌ها را از بین نبرد و هر replica بتواند صف را خالی کند.
+      در غیر این صورت در حافظه می‌مانند.
+    - flush با رسیدن به batch_size یا هر flush_interval ثانیه انجام می‌شود: دسته با LMOVEهای یک تراکنش
+      به لیست processing همین پردازه منتقل و همه جدول‌ها با INSERTهای چندسطری در یک تراکنش Postgres
+      (داخل thread) نوشته می‌شوند. لیست processing فقط پس از commit پاک می‌شود.
+    - خطای اتصال: دسته در همان تراکنشی که processing پاک می‌شود به ابتدای صف Redis برمی‌گردد و flush بعدی
+      با backoff نمایی تا max_backoff انجام می‌شود. خطای داده (مثلاً نقض کلید خارجی): رکوردها تک‌تک امتحان
+      می‌شوند و رکوردهای معیوب به لیست dead منتقل می‌شوند.
+    - هر پردازه یک کلید heartbeat دارد؛ لیست processing پردازه‌ای که heartbeat آن منقضی شده (از کار افتاده)
+      هنگام start و سپس هر RECOVERY_INTERVAL ثانیه به صف برمی‌گردد. تحویل دست‌کم یک‌بار است.
+    - drain هنگام خاموش شدن تا جای ممکن صف را خالی می‌کند.
+    """
+
+    RECOVERY_INTERVAL = 60.0
+
+    def __init__(self, redis_client: Any = _MISSING, batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+                 flush_interval: float = WRITE_BEHIND_FLUSH_INTERVAL, max_backoff: float = WRITE_BEHIND_MAX_BACKOFF,
+                 namespace: str = PERSISTENCE_NAMESPACE):
+        self._redis = redis_client
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self.key = f"{namespace}:write_behind"
+        self.dead_key = f"{namespace}:write_behind:dead"
+        self.consumer = f"{socket.gethostname()}:{os.getpid()}"
+        self.processing_key = f"{self.key}:processing:{self.consumer}"
+        self.heartbeat_key = f"{self.key}:consumer:{self.consumer}"
+        self.heartbeat_ttl = int(max(60.0, 3 * (flush_interval + max_backoff)))
+        self._next_recovery = 0.0
+        # رکوردهای دسته جاری که از حافظه آمده‌اند (نه از processing) و لیست processing به‌جامانده از settle ناموفق
+        self._taken_from_memory: List[str] = []
+        self._stranded = False
+        self._stopping = False
+        self._memory: Deque[str] = deque()
+        self._unflushed = 0
+        self._backoff = 0.0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._records = {
+            outcome: WRITE_BEHIND_RECORDS.labels(outcome) for outcome in ("enqueued", "written", "retried", "dead")
+        }
+        WRITE_BEHIND_PENDING.set_function(self.pending)
+
+    @property
+    def redis(self) -> Optional["redis.Redis"]:
+        # اتصال Redis تا اولین استفاده ساخته نمی‌شود
+        if self._redis is _MISSING:
+            self._redis = get_redis_client()
+        return self._redis
+
+    # ---- ورودی ----
+
+    def enqueue(self, table: str, row: Sequence[Any]) -> None:
+        """افزودن یک سطر برای نوشتن بعدی؛ ترتیب مقادیر مطابق TABLES است."""
+        if table not in TABLES:
+            raise ValueError(f"Unknown write-behind table: {table}")
+        self._push([json.dumps([table, list(row)], ensure_ascii=False)])
+        self._records["enqueued"].inc()
+        self._unflushed += 1
+        self._ensure_running()
+        if self._unflushed >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    def record_isee_calculation(self, user_id: int, isee_value: float, session_id: str, data: Dict) -> None:
+        """ثبت یک محاسبه ISEE و سشن آن با زمان واقعی محاسبه (نه زمان flush)."""
+        created_at = _utcnow()
+        self.enqueue("isee_calculations", (user_id, isee_value, created_at, session_id))
+        self.enqueue("sessions", (session_id, user_id, json.dumps(data, ensure_ascii=False), created_at))
+
+    def pending(self) -> int:
+        client = self.redis
+        if client is not None:
+            try:
+                return client.llen(self.key) + len(self._memory)
+            except Exception:
+                pass
+        return len(self._memory)
+
+    # ---- ذخیره‌سازی صف ----
+
+    def _push(self, items: List[str]) -> None:
+        client = self.redis
+        if client is not None:
+            try:
+                client.rpush(self.key, *items)
+                return
+            except Exception as e:
+                logger.error(f"Write-behind Redis push failed, keeping {len(items)} records in memory: {e}")
+        self._memory.extend(items)
+
+    def _take(self, limit: int) -> List[str]:
+        """
+        برداشتن حداکثر limit رکورد؛ ابتدا رکوردهای حافظه و سپس Redis. رکوردهای Redis با LMOVE به لیست
+        processing این پردازه می‌روند تا اگر پردازه حین نوشتن از کار بیفتد از بین نروند.
+        """
+        items = [self._memory.popleft() for _ in range(min(limit, len(self._memory)))]
+        self._taken_from_memory = list(items)
+        client = self.redis
+        if client is not None and len(items) < limit:
+            try:
+                # باقی‌مانده دسته قبلی (اگر پاک کردن آن ناموفق بوده) پیش از دسته جدید به صف برمی‌گردد
+                if self._stranded:
+                    self._requeue(client, self.processing_key)
+                    self._stranded = False
+                # همه LMOVEها در یک تراکنش تا دو replica یک دسته را با هم برندارند
+                pipe = client.pipeline(transaction=True)
+                for _ in range(limit - len(items)):
+                    pipe.lmove(self.key, self.processing_key, "LEFT", "RIGHT")
+                items.extend(item for item in pipe.execute() if item is not None)
+            except Exception as e:
+                logger.error(f"Write-behind Redis take failed: {e}")
+        return items
+
+    def _settle(self, retry: List[str]) -> bool:
+        """
+        پایان یک دسته: رکوردهای retry به ابتدای صف برمی‌گردند و لیست processing در همان تراکنش پاک می‌شود.
+        در نبود Redis رکوردها به ابتدای صف حافظه برمی‌گردند. خروجی False یعنی Redis خطا داد و flush باید بایستد.
+        """
+        client = self.redis
+        if client is not None:
+            try:
+                pipe = client.pipeline(transaction=True)
+                if retry:
+                    pipe.lpush(self.key, *reversed(retry))
+                pipe.delete(self.processing_key)
+                pipe.execute()
+                return True
+            except Exception as e:
+                # رکوردهای Redis در processing می‌مانند و در take بعدی به صف برمی‌گردند
+                logger.error(f"Write-behind Redis settle failed: {e}")
+                self._stranded = True
+                from_memory = set(self._taken_from_memory)
+                self._memory.extendleft(reversed([item for item in retry if item in from_memory]))
+                return False
+        self._memory.extendleft(reversed(retry))
+        return True
+
+    @staticmethod
+    def _requeue(client: "redis.Redis", processing_key: str) -> int:
+        """برگرداندن محتوای یک لیست processing به ابتدای صف با حفظ ترتیب."""
+        key = processing_key.rsplit(":processing:", 1)[0]
+        moved = 0
+        while client.lmove(processing_key, key, "RIGHT", "LEFT") is not None:
+            moved += 1
+        return moved
+
+    def _heartbeat_and_recover(self) -> None:
+        """تمدید heartbeat این پردازه و بازگرداندن دسته‌های پردازه‌های از کار افتاده."""
+        client = self.redis
+        if client is None:
+            return
+        try:
+            client.set(self.heartbeat_key, 1, ex=self.heartbeat_ttl)
+            if time.monotonic() < self._next_recovery:
+                return
+            self._next_recovery = time.monotonic() + self.RECOVERY_INTERVAL
+            for processing_key in client.scan_iter(match=f"{self.key}:processing:*", count=100):
+                consumer = processing_key.rsplit(":processing:", 1)[1]
+                if consumer == self.consumer or client.exists(f"{self.key}:consumer:{consumer}"):
+                    continue
+                moved = self._requeue(client, processing_key)
+                if moved:
+                    logger.warning(f"Recovered {moved} write-behind records left by consumer {consumer}.")
+        except Exception as e:
+            logger.error(f"Write-behind heartbeat/recovery failed: {e}")
+
+    # ---- flush ----
+
+    def start(self) -> None:
+        """
+        شروع حلقه flush (مثلاً پس از راه‌اندازی تا رکوردهای مانده از اجرای قبلی نوشته شوند).
+        اولین دور حلقه دسته‌های نیمه‌کاره پردازه‌های از کار افتاده را هم به صف برمی‌گرداند.
+        """
+        self._next_recovery = 0.0
+        self._ensure_running()
+
+    def _ensure_running(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._stopping = False
+        self._task = loop.create_task(self._run())
+
+    async def _run(self) -> None:
+        # پرچم توقف علاوه بر cancel: wait_for در پایتون ۳.۱۱ اگر رویداد هم‌زمان set شده باشد cancel را نادیده می‌گیرد
+        while not self._stopping:
+            await asyncio.to_thread(self._heartbeat_and_recover)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval + self._backoff)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Write-behind flush loop error: {e}")
+
+    async def flush(self) -> int:
+        """نوشتن رکوردهای صف تا خالی شدن یا اولین خطای اتصال. خروجی: تعداد رکوردهای نوشته‌شده."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        written = 0
+        async with self._flush_lock:
+            self._unflushed = 0
+            while True:
+                items = self._take(self.batch_size)
+                if not items:
+                    break
+                if not await self._write_batch(items):
+                    break
+                written += len(items)
+        return written
+
+    async def _write_batch(self, items: List[str]) -> bool:
+        rows_by_table: Dict[str, List[List[Any]]] = {}
+        for item in items:
+            table, row = json.loads(item)
+            rows_by_table.setdefault(table, []).append(row)
+        try:
+            await asyncio.to_thread(self._insert, rows_by_table)
+        except Exception as e:
+            if self._is_connection_error(e):
+                self._backoff = min(max(self._backoff * 2, 1.0), self.max_backoff)
+                logger.error(f"Write-behind flush of {len(items)} records failed, retrying in "
+                             f"{self.flush_interval + self._backoff:.0f}s: {e}")
+                self._records["retried"].inc(len(items))
+                self._settle(items)
+                return False
+            logger.error(f"Write-behind batch of {len(items)} records rejected, writing one by one: {e}")
+            settled = self._settle(await self._write_individually(items))
+        else:
+            self._records["written"].inc(len(items))
+            settled = self._settle([])
+        self._backoff = 0.0
+        return settled
+
+    async def _write_individually(self, items: List[str]) -> List[str]:
+        """نوشتن تک‌تک رکوردها؛ خروجی: رکوردهایی که به خاطر خطای اتصال باید دوباره امتحان شوند."""
+        retry = []
+        for item in items:
+            table, row = json.loads(item)
+            try:
+                await asyncio.to_thread(self._insert, {table: [row]})
+                self._records["written"].inc()
+            except Exception as e:
+                if self._is_connection_error(e):
+                    retry.append(item)
+                    self._records["retried"].inc()
+                    continue
+                logger.error(f"Dropping write-behind record for {table} to the dead-letter list: {e}")
+                self._records["dead"].inc()
+                self._dead_letter(item, str(e))
+        return retry
+
+    def _dead_letter(self, item: str, error: str) -> None:
+        client = self.redis
+        if client is None:
+            return
+        try:
+            client.rpush(self.dead_key, json.dumps({"record": item, "error": error, "at": _utcnow()}))
+        except Exception as e:
+            logger.error(f"Could not store dead write-behind record: {e}")
+
+    @staticmethod
+    def _is_connection_error(error: Exception) -> bool:
+        """خطاهای گذرا (اتصال، قطع ارتباط) که تکرار همان دسته را توجیه می‌کنند."""
+        try:
+            import psycopg2
+        except ImportError:
+            return isinstance(error, (ConnectionError, TimeoutError))
+        return isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError, ConnectionError, TimeoutError))
+
+    @staticmethod
+    def _insert(rows_by_table: Dict[str, List[List[Any]]]) -> None:
+        with track_dependency("postgres", "write_behind"):
+            with get_db_cursor() as cursor:
+                for table, rows in rows_by_table.items():
+                    for start in range(0, len(rows), ROWS_PER_STATEMENT):
+                        sql, params = build_insert(table, rows[start:start + ROWS_PER_STATEMENT])
+                        cursor.execute(sql, params)
+
+    async def drain(self, timeout: float = 10.0) -> None:
+        """خالی کردن صف هنگام خاموش شدن؛ رکوردهای باقی‌مانده در Redis برای replica یا اجرای بعدی می‌مانند."""
+        if self._task is not None:
+            self._stopping = True
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        deadline = time.monotonic() + timeout
+        while self.pending() and time.monotonic() < deadline:
+            if not await self.flush():
+                await asyncio.sleep(min(1.0, max(0.0, deadline - time.monotonic())))
+        if self._memory:
+            # در نبود اتصال پایگاه داده، رکوردهای حافظه دست‌کم به Redis منتقل می‌شوند
+            items, self._memory = list(self._memory), deque()
+            self._push(items)
+        client = self.redis
+        if client is not None:
+            # خاموشی عادی: بقیه replicaها لازم نیست تا انقضای heartbeat منتظر بمانند
+            try:
+                if self._stranded:
+                    self._requeue(client, self.processing_key)
+                client.delete(self.heartbeat_key)
+            except Exception as e:
+                logger.error(f"Write-behind shutdown cleanup failed: {e}")
+        remaining = self.pending()
+        if remaining:
+            logger.warning(f"Write-behind queue drained with {remaining} records still pending.")
+        else:
+            logger.info("Write-behind queue drained.")
+
+write_behind = WriteBehindQueue()
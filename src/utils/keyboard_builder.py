@@ -1,9 +1,92 @@
+from typing import Callable, Dict, Hashable, List, Optional
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from src.config import logger
-from src.utils.text_formatter import sanitize_markdown
+from src.data.academic_calendar import event_key
+from src.data.callback_ids import callback_ids
+from src.data.knowledge_base import get_knowledge_base, get_knowledge_base_version
+
+LANGUAGES = ('fa', 'en', 'it')
+
+# چیدمان منوی اصلی: هر ردیف شامل (برچسب به تفکیک زبان, callback_data)
+MAIN_MENU_LAYOUT = (
+    (
+        ({'fa': "📚 بورسیه‌ها", 'en': "📚 Scholarships", 'it': "📚 Borse di studio"}, "menu:scholarships"),
+        ({'fa': "📅 تقویم تحصیلی", 'en': "📅 Academic Calendar", 'it': "📅 Calendario accademico"}, "menu:calendar"),
+        ({'fa': "🌦️ آب‌وهوا", 'en': "🌦️ Weather", 'it': "🌦️ Meteo"}, "menu:weather"),
+    ),
+    (
+        ({'fa': "🔍 جستجو", 'en': "🔍 Search", 'it': "🔍 Cerca"}, "action:search"),
+        ({'fa': "📞 تماس با ادمین", 'en': "📞 Contact Admin", 'it': "📞 Contatta l'admin"}, "action:contact_admin"),
+        ({'fa': "📊 محاسبه ISEE", 'en': "📊 Calculate ISEE", 'it': "📊 Calcola ISEE"}, "action:isee"),
+    ),
+    (
+        ({'fa': "👤 پروفایل", 'en': "👤 Profile", 'it': "👤 Profilo"}, "menu:profile"),
+        ({'fa': "📖 راهنما", 'en': "📖 Help", 'it': "📖 Aiuto"}, "menu:help"),
+        ({'fa': "🌐 تغییر زبان", 'en': "🌐 Change Language", 'it': "🌐 Cambia Lingua"}, "menu:change_language"),
+    ),
+)
+
+# چیدمان منوی تقویم: پرس‌وجوهای بازه‌ای روی ایندکس تاریخ‌دار و خروجی ics
+CALENDAR_MENU_LAYOUT = (
+    (
+        ({'fa': "🗓 این هفته", 'en': "🗓 This week", 'it': "🗓 Questa settimana"}, "menu:cal_week"),
+        ({'fa': "📆 ۳۰ روز آینده", 'en': "📆 Next 30 days", 'it': "📆 Prossimi 30 giorni"}, "menu:cal_month"),
+    ),
+    (
+        ({'fa': "⏰ نزدیک‌ترین مهلت", 'en': "⏰ Next deadline", 'it': "⏰ Prossima scadenza"}, "menu:cal_next"),
+        ({'fa': "📥 افزودن به تقویم (ics)", 'en': "📥 Add to calendar (ics)", 'it': "📥 Aggiungi al calendario (ics)"},
+         "menu:cal_ics"),
+    ),
+    (
+        ({'fa': "🔔 یادآوری‌ها", 'en': "🔔 Reminders", 'it': "🔔 Promemoria"}, "menu:cal_remind"),
+    ),
+)
+
+BACK_TEXT = {
+    'fa': "🔙 بازگشت",
+    'en': "🔙 Back",
+    'it': "🔙 Indietro"
+}
+
+class KeyboardRegistry:
+    """
+    نگهداری کیبوردهای ساخته‌شده به ازای هر کلید (نوع کیبورد و زبان). InlineKeyboardMarkup تغییرناپذیر است،
+    پس یک نمونه بین همه پاسخ‌ها مشترک می‌ماند. با تغییر نسخه knowledge base (بارگذاری مجدد) همه کیبوردها
+    دوباره ساخته می‌شوند.
+    """
+
+    def __init__(self):
+        self._keyboards: Dict[Hashable, InlineKeyboardMarkup] = {}
+        self._version: Optional[str] = None
+        self.builds = 0
+
+    def get(self, key: Hashable, builder: Callable[[], InlineKeyboardMarkup]) -> InlineKeyboardMarkup:
+        version = get_knowledge_base_version()
+        if version != self._version:
+            if self._keyboards:
+                logger.info(f"Knowledge base version changed to {version}; rebuilding keyboards.")
+            self._keyboards.clear()
+            self._version = version
+        markup = self._keyboards.get(key)
+        if markup is None:
+            markup = self._keyboards[key] = builder()
+            self.builds += 1
+        return markup
+
+    def clear(self) -> None:
+        self._keyboards.clear()
+        self._version = None
+
+keyboard_registry = KeyboardRegistry()
+
+def _normalize_lang(lang: str) -> str:
+    return lang if lang in LANGUAGES else 'fa'
 
 def get_language_keyboard() -> InlineKeyboardMarkup:
     """ساخت کیبورد برای انتخاب زبان."""
+    return keyboard_registry.get(("language",), _build_language_keyboard)
+
+def _build_language_keyboard() -> InlineKeyboardMarkup:
     try:
         keyboard = [
             [
@@ -19,78 +102,101 @@ def get_language_keyboard() -> InlineKeyboardMarkup:
 
 def get_main_menu_keyboard(lang: str = 'fa') -> InlineKeyboardMarkup:
     """ایجاد کیبورد منوی اصلی."""
+    lang = _normalize_lang(lang)
+    return keyboard_registry.get(("main_menu", lang), lambda: _build_main_menu_keyboard(lang))
+
+def _build_main_menu_keyboard(lang: str) -> InlineKeyboardMarkup:
     try:
-        buttons = {
-            'fa': [
-                [
-                    InlineKeyboardButton("📚 بورسیه‌ها", callback_data="menu:scholarships"),
-                    InlineKeyboardButton("📅 تقویم تحصیلی", callback_data="menu:calendar"),
-                    InlineKeyboardButton("🌦️ آب‌وهوا", callback_data="menu:weather")
-                ],
-                [
-                    InlineKeyboardButton("🔍 جستجو", callback_data="action:search"),
-                    InlineKeyboardButton("📞 تماس با ادمین", callback_data="action:contact_admin"),
-                    InlineKeyboardButton("📊 محاسبه ISEE", callback_data="action:isee")
-                ],
-                [
-                    InlineKeyboardButton("👤 پروفایل", callback_data="menu:profile"),
-                    InlineKeyboardButton("📖 راهنما", callback_data="menu:help"),
-                    InlineKeyboardButton("🌐 تغییر زبان", callback_data="menu:change_language")
-                ]
-            ],
-            'en': [
-                [
-                    InlineKeyboardButton("📚 Scholarships", callback_data="menu:scholarships"),
-                    InlineKeyboardButton("📅 Academic Calendar", callback_data="menu:calendar"),
-                    InlineKeyboardButton("🌦️ Weather", callback_data="menu:weather")
-                ],
-                [
-                    InlineKeyboardButton("🔍 Search", callback_data="action:search"),
-                    InlineKeyboardButton("📞 Contact Admin", callback_data="action:contact_admin"),
-                    InlineKeyboardButton("📊 Calculate ISEE", callback_data="action:isee")
-                ],
-                [
-                    InlineKeyboardButton("👤 Profile", callback_data="menu:profile"),
-                    InlineKeyboardButton("📖 Help", callback_data="menu:help"),
-                    InlineKeyboardButton("🌐 Change Language", callback_data="menu:change_language")
-                ]
-            ],
-            'it': [
-                [
-                    InlineKeyboardButton("📚 Borse di studio", callback_data="menu:scholarships"),
-                    InlineKeyboardButton("📅 Calendario accademico", callback_data="menu:calendar"),
-                    InlineKeyboardButton("🌦️ Meteo", callback_data="menu:weather")
-                ],
-                [
-                    InlineKeyboardButton("🔍 Cerca", callback_data="action:search"),
-                    InlineKeyboardButton("📞 Contatta l'admin", callback_data="action:contact_admin"),
-                    InlineKeyboardButton("📊 Calcola ISEE", callback_data="action:isee")
-                ],
-                [
-                    InlineKeyboardButton("👤 Profilo", callback_data="menu:profile"),
-                    InlineKeyboardButton("📖 Aiuto", callback_data="menu:help"),
-                    InlineKeyboardButton("🌐 Cambia Lingua", callback_data="menu:change_language")
-                ]
-            ]
-        }
-        return InlineKeyboardMarkup(buttons.get(lang, buttons['fa']))
+        keyboard = [
+            [InlineKeyboardButton(labels[lang], callback_data=callback) for labels, callback in row]
+            for row in MAIN_MENU_LAYOUT
+        ]
+        return InlineKeyboardMarkup(keyboard)
     except Exception as e:
         logger.error(f"Error creating main menu keyboard: {e}")
         return InlineKeyboardMarkup([])
 
+def get_back_keyboard(lang: str = 'fa', back_option: str = "menu:main_menu") -> InlineKeyboardMarkup:
+    """کیبورد تک‌دکمه‌ای بازگشت."""
+    lang = _normalize_lang(lang)
+    return keyboard_registry.get(
+        ("back", lang, back_option),
+        lambda: InlineKeyboardMarkup([[InlineKeyboardButton(BACK_TEXT[lang], callback_data=back_option)]])
+    )
+
+def get_category_keyboard(category: str, lang: str = 'fa', back_option: str = "menu:main_menu") -> InlineKeyboardMarkup:
+    """کیبورد آیتم‌های یک دسته از knowledge base؛ برای هر زبان و نسخه محتوا یک بار ساخته می‌شود."""
+    lang = _normalize_lang(lang)
+    return keyboard_registry.get(
+        ("category", category, lang, back_option),
+        lambda: get_item_keyboard(_category_items(category, lang), lang, back_option)
+    )
+
+def get_calendar_keyboard(category: str, lang: str = 'fa') -> InlineKeyboardMarkup:
+    """کیبورد منوی تقویم: دکمه‌های CALENDAR_MENU_LAYOUT، سپس آیتم‌های متنی دسته تقویم و بازگشت."""
+    lang = _normalize_lang(lang)
+    return keyboard_registry.get(("calendar", category, lang), lambda: _build_calendar_keyboard(category, lang))
+
+def _build_calendar_keyboard(category: str, lang: str) -> InlineKeyboardMarkup:
+    try:
+        keyboard = [
+            [InlineKeyboardButton(labels[lang], callback_data=callback) for labels, callback in row]
+            for row in CALENDAR_MENU_LAYOUT
+        ]
+        keyboard += [
+            [InlineKeyboardButton(item['title'], callback_data=item['callback'])]
+            for item in _category_items(category, lang)
+        ]
+        keyboard.append([InlineKeyboardButton(BACK_TEXT[lang], callback_data="menu:main_menu")])
+        return InlineKeyboardMarkup(keyboard)
+    except Exception as e:
+        logger.error(f"Error creating calendar keyboard: {e}")
+        return InlineKeyboardMarkup([])
+
+def get_reminder_keyboard(events: list, subscribed: set, lang: str = 'fa') -> InlineKeyboardMarkup:
+    """
+    کیبورد اشتراک یادآوری: یک دکمه تغییر وضعیت برای هر رویداد. به وضعیت اشتراک کاربر بستگی دارد،
+    پس در keyboard_registry نگه داشته نمی‌شود.
+    """
+    lang = _normalize_lang(lang)
+    try:
+        keyboard = [
+            [InlineKeyboardButton(
+                f"{'🔔' if event.uid in subscribed else '🔕'} {event.start.isoformat()} {event.title.get(lang, '')}",
+                callback_data=f"menu:r:{event_key(event.uid)}"
+            )]
+            for event in events
+        ]
+        keyboard.append([InlineKeyboardButton(BACK_TEXT[lang], callback_data="menu:calendar")])
+        return InlineKeyboardMarkup(keyboard)
+    except Exception as e:
+        logger.error(f"Error creating reminder keyboard: {e}")
+        return InlineKeyboardMarkup([])
+
+def _category_items(category: str, lang: str) -> List[Dict]:
+    items = get_knowledge_base().get(category, [])
+    if not isinstance(items, list):
+        logger.warning(f"Invalid category format: {category}")
+        return []
+    return [
+        {
+            'title': item.get('title', {}).get(lang, item.get('title', {}).get('en', '')),
+            'callback': callback_ids.encode(category, item.get('id', ''))
+        }
+        for item in items
+    ]
+
 def get_item_keyboard(items: list, lang: str = 'fa', back_option: str = "menu:main_menu") -> InlineKeyboardMarkup:
-    """ایجاد کیبورد برای آیتم‌ها با دکمه بازگشت."""
+    """
+    ایجاد کیبورد برای آیتم‌ها با دکمه بازگشت.
+    متن دکمه‌ها به‌صورت ساده نمایش داده می‌شود و نباید برای MarkdownV2 اسکیپ شود.
+    """
     try:
         keyboard = [
-            [InlineKeyboardButton(sanitize_markdown(item['title']), callback_data=item['callback'])]
+            [InlineKeyboardButton(item['title'], callback_data=item['callback'])]
             for item in items
         ]
-        back_text = {
-            'fa': "🔙 بازگشت",
-            'en': "🔙 Back",
-            'it': "🔙 Indietro"
-        }
-        keyboard.append([InlineKeyboardButton(back_text.get(lang, "🔙 Back"), callback_data=back_option)])
+        keyboard.append([InlineKeyboardButton(BACK_TEXT.get(lang, "🔙 Back"), callback_data=back_option)])
         return InlineKeyboardMarkup(keyboard)
     except Exception as e:
         logger.error(f"Error creating item keyboard: {e}")
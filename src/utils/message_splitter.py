@@ -0,0 +1,104 @@
+import re
+from typing import TYPE_CHECKING, List, Optional, Sequence
+
+if TYPE_CHECKING:
+    from telegram import InlineKeyboardMarkup, Message
+
+from src.config import logger
+from src.utils.text_formatter import MARKDOWN_V2_SPECIAL_CHARS, sanitize_markdown
+
+# سقف طول پیام تلگرام (پس از اسکیپ)
+TELEGRAM_MESSAGE_LIMIT = 4096
+# فضای رزرو برای پاورقی «صفحه X از Y» که بعداً به هر صفحه اضافه می‌شود
+PAGE_FOOTER_RESERVE = 64
+
+# مرزهای شکستن به ترتیب اولویت: پاراگراف، خط، جمله (فارسی/لاتین)، کلمه
+_BOUNDARIES = (
+    re.compile(r'(?<=\n\n)'),
+    re.compile(r'(?<=\n)'),
+    re.compile(r'(?<=[.!?؟…;؛] )'),
+    re.compile(r'(?<= )'),
+)
+
+_ESCAPED_CHARS = frozenset(MARKDOWN_V2_SPECIAL_CHARS)
+
+def escaped_length(text: str) -> int:
+    """
+    طول متن پس از sanitize_markdown. اسکیپ کاراکتر به کاراکتر است، پس طول‌ها جمع‌پذیرند
+    و می‌توان تکه‌ها را بدون اسکیپ دوباره کنار هم شمرد.
+    """
+    extra = text.count('\n') - text.count('\r')
+    for char in _ESCAPED_CHARS:
+        if char in text:
+            extra += text.count(char)
+    return len(text) + extra
+
+def _hard_split(text: str, budget: int) -> List[str]:
+    """آخرین راه: شکستن کاراکتری متنی که هیچ مرز طبیعی ندارد."""
+    chunks, current, size = [], [], 0
+    for char in text:
+        cost = escaped_length(char)
+        if size + cost > budget and current:
+            chunks.append("".join(current))
+            current, size = [], 0
+        current.append(char)
+        size += cost
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+def _split(text: str, budget: int, level: int = 0) -> List[str]:
+    if escaped_length(text) <= budget:
+        return [text]
+    if level >= len(_BOUNDARIES):
+        return _hard_split(text, budget)
+    parts = [part for part in _BOUNDARIES[level].split(text) if part]
+    if len(parts) == 1:
+        return _split(text, budget, level + 1)
+
+    chunks: List[str] = []
+    current, size = "", 0
+    for part in parts:
+        cost = escaped_length(part)
+        if size + cost <= budget:
+            current += part
+            size += cost
+            continue
+        if current:
+            chunks.append(current)
+            current, size = "", 0
+        if cost <= budget:
+            current, size = part, cost
+        else:
+            # تکه‌ای که به‌تنهایی جا نمی‌شود با مرز ریزتر شکسته می‌شود
+            chunks.extend(_split(part, budget, level + 1))
+    if current:
+        chunks.append(current)
+    return chunks
+
+def split_message(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT, reserve: int = 0) -> List[str]:
+    """
+    شکستن متن خام (پیش از اسکیپ) روی مرز پاراگراف، خط، جمله و کلمه، طوری که هر تکه پس از
+    sanitize_markdown حداکثر limit - reserve کاراکتر باشد. چون اسکیپ بعد از شکستن انجام
+    می‌شود، هیچ دنباله اسکیپی بین دو پیام نصف نمی‌شود.
+    """
+    if not text:
+        return []
+    chunks = [chunk.strip() for chunk in _split(text, limit - reserve)]
+    return [chunk for chunk in chunks if chunk]
+
+async def send_text_chunks(message: "Message", text: str, reply_markup: Optional["InlineKeyboardMarkup"] = None,
+                           edit: bool = False, chunks: Optional[Sequence[str]] = None) -> None:
+    """
+    ارسال متن طولانی به‌صورت چند پیام پشت سر هم؛ کیبورد فقط به پیام آخر اضافه می‌شود.
+    با edit=True تکه اول جایگزین متن پیام فعلی می‌شود (مثلاً پیام «در حال دریافت...»).
+    """
+    chunks = list(chunks) if chunks is not None else split_message(text)
+    if len(chunks) > 1:
+        logger.info(f"Sending long text as {len(chunks)} messages.")
+    for index, chunk in enumerate(chunks):
+        markup = reply_markup if index == len(chunks) - 1 else None
+        if index == 0 and edit:
+            await message.edit_text(sanitize_markdown(chunk), parse_mode='MarkdownV2', reply_markup=markup)
+        else:
+            await message.reply_text(sanitize_markdown(chunk), parse_mode='MarkdownV2', reply_markup=markup)
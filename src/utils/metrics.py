@@ -0,0 +1,273 @@
+import functools
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from src.utils.tracing import span
+
+# باکت‌های پیش‌فرض تأخیر (ثانیه) از چند میلی‌ثانیه تا تماس‌های طولانی OpenAI
+DEFAULT_LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+class MetricsRegistry:
+    """مجموعه متریک‌های پردازه و خروجی متنی سازگار با Prometheus."""
+
+    def __init__(self):
+        self._metrics: List["_Metric"] = []
+
+    def register(self, metric: "_Metric") -> None:
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for label_values, child in metric.children():
+                lines.extend(child.samples(metric.name, _format_labels(metric.labelnames, label_values)))
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+def _escape_label(value: str) -> str:
+    """اسکیپ مقدار برچسب طبق فرمت متنی Prometheus."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    parts = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _with_extra_label(labels: str, extra: str) -> str:
+    """افزودن یک برچسب (مثل le) به رشته برچسب‌های موجود."""
+    return "{" + extra + "}" if not labels else labels[:-1] + "," + extra + "}"
+
+class _Metric:
+    """
+    پایه متریک‌ها. هر ترکیب برچسب یک فرزند از پیش ساخته‌شده دارد که پس از اولین
+    labels() در دیکشنری نگه داشته می‌شود؛ افزایش‌ها فقط جمع عدد صحیح بدون قفل‌اند
+    (حلقه رویداد تک‌نخی است).
+    """
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str = "", labelnames: Sequence[str] = (),
+                 registry: Optional[MetricsRegistry] = REGISTRY):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+        if registry is not None:
+            registry.register(self)
+
+    def _new_child(self) -> "_Metric":
+        raise NotImplementedError
+
+    def labels(self, *values: Any) -> "_Metric":
+        """بازگشت فرزند مربوط به مقادیر برچسب (به ترتیب labelnames)."""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            child = self._children[key] = self._new_child()
+        return child
+
+    def prealloc(self, label_sets: Iterable[Sequence[Any]]) -> None:
+        """ساخت از پیش فرزندها برای برچسب‌های شناخته‌شده."""
+        for values in label_sets:
+            self.labels(*values)
+
+    def children(self) -> Iterable[Tuple[Tuple[str, ...], "_Metric"]]:
+        if not self.labelnames:
+            return [((), self)]
+        return list(self._children.items())
+
+    def samples(self, name: str, labels: str) -> List[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    """شمارنده افزایشی."""
+    kind = "counter"
+
+    def __init__(self, name: str, description: str = "", labelnames: Sequence[str] = (),
+                 registry: Optional[MetricsRegistry] = REGISTRY):
+        super().__init__(name, description, labelnames, registry)
+        self.value = 0
+
+    def _new_child(self) -> "Counter":
+        return Counter(self.name, registry=None)
+
+    def inc(self, amount: int = 1) -> None:
+        self.value += amount
+
+    def samples(self, name: str, labels: str) -> List[str]:
+        return [f"{name}{labels} {self.value}"]
+
+class Gauge(_Metric):
+    """مقدار لحظه‌ای؛ می‌تواند با تابع هنگام خواندن محاسبه شود."""
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str = "", labelnames: Sequence[str] = (),
+                 registry: Optional[MetricsRegistry] = REGISTRY):
+        super().__init__(name, description, labelnames, registry)
+        self.value: float = 0
+        self._function: Optional[Callable[[], float]] = None
+
+    def _new_child(self) -> "Gauge":
+        return Gauge(self.name, registry=None)
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self._function = function
+
+    def samples(self, name: str, labels: str) -> List[str]:
+        value = self._function() if self._function else self.value
+        return [f"{name}{labels} {value}"]
+
+class Histogram(_Metric):
+    """هیستوگرام تأخیر با باکت‌های ثابت و شمارنده‌های از پیش تخصیص‌یافته."""
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str = "", labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+                 registry: Optional[MetricsRegistry] = REGISTRY):
+        super().__init__(name, description, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+        # خانه آخر برای مقادیر بزرگ‌تر از بزرگ‌ترین باکت (+Inf)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def _new_child(self) -> "Histogram":
+        return Histogram(self.name, buckets=self.buckets, registry=None)
+
+    def observe(self, value: float) -> None:
+        """ثبت یک مقدار در باکت مناسب."""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """اندازه‌گیری زمان اجرای یک بلاک."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def quantile(self, q: float) -> float:
+        """تخمین چندک از روی باکت‌ها (کران بالای باکت)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return self.buckets[index] if index < len(self.buckets) else float('inf')
+        return float('inf')
+
+    def snapshot(self) -> Dict[str, float]:
+        """خلاصه‌ای از وضعیت فعلی هیستوگرام."""
+        return {
+            'count': self.count,
+            'avg': self.sum / self.count if self.count else 0.0,
+            'p50': self.quantile(0.50),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+        }
+
+    def samples(self, name: str, labels: str) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            cumulative += bucket_count
+            bucket_labels = _with_extra_label(labels, 'le="%s"' % bound)
+            lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+        inf_labels = _with_extra_label(labels, 'le="+Inf"')
+        lines.append(f"{name}_bucket{inf_labels} {self.count}")
+        lines.append(f"{name}_sum{labels} {self.sum}")
+        lines.append(f"{name}_count{labels} {self.count}")
+        return lines
+
+# ---- متریک‌های مشترک handlerها و وابستگی‌های خارجی ----
+
+HANDLER_LATENCY = Histogram(
+    "handler_latency_seconds", "Handler execution time", labelnames=("handler", "branch")
+)
+HANDLER_ERRORS = Counter(
+    "handler_errors_total", "Unhandled exceptions raised by handlers", labelnames=("handler", "branch")
+)
+DEPENDENCY_LATENCY = Histogram(
+    "dependency_latency_seconds", "Latency of calls to external dependencies",
+    labelnames=("dependency", "operation")
+)
+DEPENDENCY_ERRORS = Counter(
+    "dependency_errors_total", "Failed calls to external dependencies", labelnames=("dependency", "operation")
+)
+
+DEPENDENCY_OPERATIONS = (
+    ("postgres", "connect"), ("postgres", "commit"),
+    ("postgres", "write_behind"), ("postgres", "session_purge"), ("postgres", "reminders"),
+    ("postgres", "broadcast"),
+    ("redis", "pagination_get"), ("redis", "pagination_set"),
+    ("redis", "user_cache_get"), ("redis", "user_cache_set"), ("redis", "reminders"),
+    ("openai", "chat"), ("openai", "transcription"),
+    ("sheets", "append_row"), ("sheets", "get_all_records"),
+)
+DEPENDENCY_LATENCY.prealloc(DEPENDENCY_OPERATIONS)
+DEPENDENCY_ERRORS.prealloc(DEPENDENCY_OPERATIONS)
+
+@contextmanager
+def track_dependency(dependency: str, operation: str) -> Iterator[None]:
+    """اندازه‌گیری تأخیر و خطاهای یک تماس به وابستگی خارجی (به همراه span در trace فعلی)."""
+    histogram = DEPENDENCY_LATENCY.labels(dependency, operation)
+    start = time.perf_counter()
+    try:
+        with span(f"{dependency}.{operation}"):
+            yield
+    except BaseException:
+        DEPENDENCY_ERRORS.labels(dependency, operation).inc()
+        raise
+    finally:
+        histogram.observe(time.perf_counter() - start)
+
+def instrument_handler(name: str, branch: Optional[Callable[..., str] | str] = None):
+    """
+    دکوراتور برای handlerهای async: زمان اجرا را با برچسب handler و شاخه ثبت می‌کند.
+    branch یا نام ثابت شاخه است یا تابعی که از آرگومان‌های handler نام شاخه را استخراج می‌کند.
+    """
+    def decorator(func):
+        static_branch = branch if isinstance(branch, str) else ""
+        default_histogram = HANDLER_LATENCY.labels(name, static_branch)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            branch_name = static_branch
+            if callable(branch):
+                try:
+                    branch_name = branch(*args, **kwargs)
+                except Exception:
+                    branch_name = "unknown"
+            histogram = default_histogram if branch_name == static_branch else HANDLER_LATENCY.labels(name, branch_name)
+            start = time.perf_counter()
+            try:
+                with span(name, branch=branch_name) if branch_name else span(name):
+                    return await func(*args, **kwargs)
+            except BaseException:
+                HANDLER_ERRORS.labels(name, branch_name).inc()
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
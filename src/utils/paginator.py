@@ -4,7 +4,9 @@ from typing import Optional, Dict, List, Any
 from datetime import datetime
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from src.config import logger
+from src.data.callback_ids import to_base36
 from src.database import get_redis_client
+from src.utils.metrics import track_dependency
 from src.utils.text_formatter import sanitize_markdown
 from src.utils.keyboard_builder import get_main_menu_keyboard
 
@@ -28,7 +30,8 @@ class Paginator:
                 'created_at': datetime.now().isoformat()
             }
             if self.redis:
-                self.redis.setex(self._get_key(user_id), self.expire_time, json.dumps(session_data))
+                with track_dependency("redis", "pagination_set"):
+                    self.redis.setex(self._get_key(user_id), self.expire_time, json.dumps(session_data))
                 logger.info(f"Pagination session created for user {user_id}")
             else:
                 logger.warning("Redis not available, pagination session not created.")
@@ -41,7 +44,8 @@ class Paginator:
             if not self.redis:
                 logger.warning("Redis not available for pagination.")
                 return None
-            data = self.redis.get(self._get_key(user_id))
+            with track_dependency("redis", "pagination_get"):
+                data = self.redis.get(self._get_key(user_id))
             if not data:
                 logger.info(f"No pagination session found for user {user_id}")
                 return None
@@ -50,7 +54,8 @@ class Paginator:
             if session['current_page'] >= session['total_pages']:
                 logger.info(f"Reached last page for user {user_id}")
                 return None
-            self.redis.setex(self._get_key(user_id), self.expire_time, json.dumps(session))
+            with track_dependency("redis", "pagination_set"):
+                self.redis.setex(self._get_key(user_id), self.expire_time, json.dumps(session))
             return self._prepare_page(session)
         except Exception as e:
             logger.error(f"Error getting next page for user {user_id}: {e}")
@@ -62,7 +67,8 @@ class Paginator:
             if not self.redis:
                 logger.warning("Redis not available for pagination.")
                 return None
-            data = self.redis.get(self._get_key(user_id))
+            with track_dependency("redis", "pagination_get"):
+                data = self.redis.get(self._get_key(user_id))
             if not data:
                 logger.info(f"No pagination session found for user {user_id}")
                 return None
@@ -71,12 +77,39 @@ class Paginator:
             if session['current_page'] < 0:
                 logger.info(f"Reached first page for user {user_id}")
                 return None
-            self.redis.setex(self._get_key(user_id), self.expire_time, json.dumps(session))
+            with track_dependency("redis", "pagination_set"):
+                self.redis.setex(self._get_key(user_id), self.expire_time, json.dumps(session))
             return self._prepare_page(session)
         except Exception as e:
             logger.error(f"Error getting previous page for user {user_id}: {e}")
             return None
 
+    def get_page(self, user_id: int, page_index: int) -> Optional[Dict]:
+        """
+        دریافت صفحه با شماره مشخص (از دکمه‌های «pg:<شماره>»). برخلاف قبلی/بعدی، کلیک دوباره روی یک
+        پیام قدیمی همان صفحه را نشان می‌دهد و از صفحه فعلی سشن مستقل است.
+        """
+        try:
+            if not self.redis:
+                logger.warning("Redis not available for pagination.")
+                return None
+            with track_dependency("redis", "pagination_get"):
+                data = self.redis.get(self._get_key(user_id))
+            if not data:
+                logger.info(f"No pagination session found for user {user_id}")
+                return None
+            session = json.loads(data)
+            if not 0 <= page_index < session['total_pages']:
+                logger.info(f"Page {page_index} out of range for user {user_id}")
+                return None
+            session['current_page'] = page_index
+            with track_dependency("redis", "pagination_set"):
+                self.redis.setex(self._get_key(user_id), self.expire_time, json.dumps(session))
+            return self._prepare_page(session)
+        except Exception as e:
+            logger.error(f"Error getting page {page_index} for user {user_id}: {e}")
+            return None
+
     def _prepare_page(self, session: Dict) -> Dict:
         """آماده‌سازی داده‌های صفحه."""
         return {
@@ -86,18 +119,32 @@ class Paginator:
             'type': session['type']
         }
 
+    @staticmethod
+    def content_pages(pages: List[str], file_path: Optional[str], callback: str) -> List[Dict]:
+        """تبدیل صفحه‌های یک محتوا به آیتم‌های سشن؛ فایل فقط همراه صفحه اول ارسال می‌شود."""
+        return [
+            {"content": page, "file_path": file_path if index == 0 else None, "callback": callback}
+            for index, page in enumerate(pages)
+        ]
+
+    def format_page(self, page_data: Dict, lang: str = 'fa') -> str:
+        """متن خام صفحه به همراه پاورقی «صفحه X از Y» (فضای آن در message_splitter رزرو شده است)."""
+        page_word = 'صفحه' if lang == 'fa' else 'Page' if lang == 'en' else 'Pagina'
+        of_word = 'از' if lang == 'fa' else 'of' if lang == 'en' else 'di'
+        return f"{page_data['content']['content']}\n\n{page_word} {page_data['page_num']} {of_word} {page_data['total_pages']}"
+
     def get_pagination_markup(self, page_data: Dict, lang: str = 'fa') -> InlineKeyboardMarkup:
         """ایجاد کیبورد صفحه‌بندی."""
         buttons = []
         if page_data['page_num'] > 1:
             buttons.append(InlineKeyboardButton(
                 "⬅️ قبلی" if lang == 'fa' else "⬅️ Previous" if lang == 'en' else "⬅️ Precedente",
-                callback_data="pagination:prev"
+                callback_data=f"pg:{to_base36(page_data['page_num'] - 2)}"
             ))
         if page_data['page_num'] < page_data['total_pages']:
             buttons.append(InlineKeyboardButton(
                 "بعدی ➡️" if lang == 'fa' else "Next ➡️" if lang == 'en' else "Successivo ➡️",
-                callback_data="pagination:next"
+                callback_data=f"pg:{to_base36(page_data['page_num'])}"
             ))
         buttons.append(InlineKeyboardButton(
             "🔙 بازگشت" if lang == 'fa' else "🔙 Back" if lang == 'en' else "🔙 Indietro",
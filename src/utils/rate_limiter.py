@@ -0,0 +1,164 @@
+import asyncio
+import time
+from typing import Any, Dict, Optional, TYPE_CHECKING
+
+from src.config import logger, PERSISTENCE_NAMESPACE, TELEGRAM_GLOBAL_RATE, TELEGRAM_PER_CHAT_INTERVAL
+from src.database import get_redis_client
+
+if TYPE_CHECKING:
+    import redis
+
+# بعد از این تعداد چت، ورودی‌هایی که فاصله‌شان گذشته است حذف می‌شوند
+PER_CHAT_PRUNE_THRESHOLD = 10_000
+
+_MISSING = object()
+
+class TokenBucket:
+    """
+    سطل توکن با رزرو: هر درخواست فوراً توکنش را برمی‌دارد (موجودی می‌تواند منفی شود) و مدت انتظار لازم
+    را می‌گیرد. بدون قفل و به ترتیب درخواست‌ها (FIFO) کار می‌کند، چون رزرو بین دو await انجام می‌شود.
+    _updated مبدأ پر شدن سطل است و در حین pause در آینده قرار می‌گیرد تا پس از pause رزروها با همان
+    نرخ rate پشت سر هم انجام شوند، نه همه با هم.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        # تا این زمان (مثلاً پس از پاسخ 429) هیچ توکنی داده نمی‌شود
+        self._paused_until = 0.0
+        # با هر pause زیاد می‌شود تا acquireهای در انتظار دوباره رزرو کنند
+        self.generation = 0
+
+    def reserve(self, tokens: float = 1) -> float:
+        """برداشتن tokens توکن؛ خروجی: چند ثانیه باید پیش از استفاده صبر کرد."""
+        now = time.monotonic()
+        if now > self._updated:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+        self._tokens -= tokens
+        delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        return (self._updated - now) + delay
+
+    async def acquire(self, tokens: float = 1) -> None:
+        """صبر تا آماده شدن توکن؛ اگر در حین انتظار pause شود، رزرو پس از pause تکرار می‌شود."""
+        while True:
+            generation = self.generation
+            delay = self.reserve(tokens)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if generation == self.generation:
+                return
+
+    def pause(self, seconds: float) -> None:
+        """
+        توقف کامل سطل برای seconds ثانیه: مبدأ پر شدن به پایان pause منتقل می‌شود و رزروهای قبلی بخشوده
+        می‌شوند، چون acquireهای در انتظار پس از بیدار شدن دوباره رزرو می‌کنند.
+        """
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._updated = max(self._updated, self._paused_until)
+        self._tokens = 0.0
+        self.generation += 1
+
+class SendRateLimiter:
+    """
+    محدودکننده ارسال پیام‌های ربات: سقف کلی پیام در ثانیه (global_rate) و حداقل فاصله بین دو پیام به یک
+    چت (per_chat_interval). همه ارسال‌های گروهی (یادآوری‌ها، پیام همگانی) باید از یک نمونه مشترک استفاده
+    کنند تا مجموعشان از محدودیت تلگرام بیشتر نشود. پاسخ 429 با pause کل ارسال‌ها را متوقف می‌کند.
+
+    سطل محلی فقط ارسال‌های همین پردازه را صاف می‌کند؛ سقف global_rate بین همه پردازه‌ها (workerها و
+    replicaها) با یک شمارنده پنجره یک‌ثانیه‌ای در Redis اعمال می‌شود و pause هم از طریق Redis به بقیه
+    پردازه‌ها می‌رسد. در نبود Redis فقط محدودیت محلی اعمال می‌شود.
+    """
+
+    def __init__(self, global_rate: float = TELEGRAM_GLOBAL_RATE,
+                 per_chat_interval: float = TELEGRAM_PER_CHAT_INTERVAL,
+                 redis_client: Any = _MISSING, namespace: str = PERSISTENCE_NAMESPACE):
+        self.global_rate = global_rate
+        self.bucket = TokenBucket(global_rate)
+        self.per_chat_interval = per_chat_interval
+        self._redis = redis_client
+        self.window_prefix = f"{namespace}:send_rate"
+        self.pause_key = f"{namespace}:send_rate:paused_until"
+        # chat_id -> زودترین زمان (monotonic) مجاز برای پیام بعدی
+        self._next_allowed: Dict[int, float] = {}
+
+    @property
+    def redis(self) -> Optional["redis.Redis"]:
+        # اتصال Redis تا اولین استفاده ساخته نمی‌شود
+        if self._redis is _MISSING:
+            self._redis = get_redis_client()
+        return self._redis
+
+    def _reserve_chat(self, chat_id: int) -> float:
+        now = time.monotonic()
+        chat_at = max(now, self._next_allowed.get(chat_id, 0.0))
+        self._next_allowed[chat_id] = chat_at + self.per_chat_interval
+        if len(self._next_allowed) > PER_CHAT_PRUNE_THRESHOLD:
+            self._prune(now)
+        return chat_at - now
+
+    def reserve(self, chat_id: int) -> float:
+        """رزرو محلی (چت و سطل)؛ خروجی: چند ثانیه باید پیش از ارسال صبر کرد."""
+        return max(self._reserve_chat(chat_id), self.bucket.reserve())
+
+    async def acquire(self, chat_id: int) -> None:
+        """صبر تا زمانی که ارسال یک پیام به chat_id مجاز باشد."""
+        chat_ready = time.monotonic() + self._reserve_chat(chat_id)
+        await self.bucket.acquire()
+        remaining = chat_ready - time.monotonic()
+        if remaining > 0:
+            await asyncio.sleep(remaining)
+        await self._acquire_shared()
+
+    async def _acquire_shared(self) -> None:
+        """گرفتن یک جا در پنجره یک‌ثانیه‌ای مشترک؛ اگر پنجره پر یا ارسال‌ها متوقف باشد تا پنجره بعد صبر می‌کند."""
+        client = self.redis
+        if client is None:
+            return
+        while True:
+            now = time.time()
+            window = int(now)
+            key = f"{self.window_prefix}:{window}"
+            try:
+                pipe = client.pipeline(transaction=False)
+                pipe.get(self.pause_key)
+                pipe.incr(key)
+                pipe.expire(key, 2)
+                paused_until, used, _ = await asyncio.to_thread(pipe.execute)
+            except Exception as e:
+                logger.error(f"Shared send rate check failed, using the local limit only: {e}")
+                return
+            if paused_until and float(paused_until) > now:
+                await asyncio.sleep(float(paused_until) - now)
+            elif used <= self.global_rate:
+                return
+            else:
+                await asyncio.sleep(window + 1 - now)
+
+    async def pause(self, seconds: float) -> None:
+        """اعمال retry_after پاسخ 429 روی همه ارسال‌ها، در همه پردازه‌ها."""
+        logger.warning(f"Telegram flood limit hit, pausing sends for {seconds:.1f}s.")
+        # سطل محلی پیش از هر await متوقف می‌شود تا ارسال‌های هم‌زمان همین پردازه فوراً بایستند
+        self.bucket.pause(seconds)
+        client = self.redis
+        if client is not None:
+            try:
+                await asyncio.to_thread(
+                    client.set, self.pause_key, time.time() + seconds, px=max(1, int(seconds * 1000))
+                )
+            except Exception as e:
+                logger.error(f"Could not share send pause through Redis: {e}")
+
+    def _prune(self, now: float) -> None:
+        self._next_allowed = {chat_id: at for chat_id, at in self._next_allowed.items() if at > now}
+
+def retry_after_seconds(error: Exception) -> float:
+    """مقدار retry_after خطای RetryAfter تلگرام به ثانیه (در نسخه‌های جدید ممکن است timedelta باشد)."""
+    retry_after = getattr(error, 'retry_after', 1)
+    return retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else float(retry_after)
+
+telegram_rate_limiter = SendRateLimiter()
@@ -0,0 +1,38 @@
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Tuple
+
+# زمان شروع پردازه؛ main.py این مقدار را پیش از importهای سنگین ثبت می‌کند
+PROCESS_START = time.perf_counter()
+
+class StartupProfiler:
+    """ثبت زمان هر مرحله از راه‌اندازی و چاپ جدول خلاصه."""
+
+    def __init__(self, enabled: bool = False, origin: float = PROCESS_START):
+        self.enabled = enabled
+        self.origin = origin
+        self.phases: List[Tuple[str, float, float]] = []
+
+    def record(self, name: str, start: float, end: float) -> None:
+        self.phases.append((name, start, end))
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """اندازه‌گیری یک مرحله (برای کدهای sync و async هر دو کار می‌کند)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter())
+
+    def report(self) -> str:
+        """جدول زمان‌بندی مراحل نسبت به شروع پردازه (میلی‌ثانیه)."""
+        lines = [f"{'phase':<24}{'start ms':>10}{'duration ms':>14}"]
+        for name, start, end in sorted(self.phases, key=lambda phase: phase[1]):
+            lines.append(f"{name:<24}{(start - self.origin) * 1000:>10.1f}{(end - start) * 1000:>14.1f}")
+        lines.append(f"{'total':<24}{'':>10}{(time.perf_counter() - self.origin) * 1000:>14.1f}")
+        return "\n".join(lines)
+
+    def print_report(self) -> None:
+        if self.enabled:
+            print("Startup profile:\n" + self.report(), flush=True)
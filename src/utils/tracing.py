@@ -0,0 +1,231 @@
+import asyncio
+import contextvars
+import json
+import queue
+import random
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from src.config import (
+    logger,
+    TRACE_ENABLED,
+    TRACE_SAMPLE_RATE,
+    TRACE_EXPORTER,
+    TRACE_FILE,
+    TRACE_OTLP_ENDPOINT,
+    TRACE_SLOW_THRESHOLD,
+)
+
+SERVICE_NAME = "scholarino"
+
+class Span:
+    """یک بازه زمانی در درخت trace یک آپدیت."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent", "attributes", "children",
+                 "start_ns", "end_ns", "error")
+
+    def __init__(self, name: str, trace_id: str, parent: Optional["Span"] = None, **attributes: Any):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent = parent
+        self.attributes = attributes
+        self.children: List["Span"] = []
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.error: Optional[str] = None
+        if parent is not None:
+            parent.children.append(self)
+
+    @property
+    def duration(self) -> float:
+        """مدت زمان به ثانیه."""
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def iter_spans(self) -> Iterator["Span"]:
+        yield self
+        for child in self.children:
+            yield from child.iter_spans()
+
+    def render_tree(self, depth: int = 0) -> str:
+        """نمایش متنی درخت spanها برای لاگ درخواست‌های کند."""
+        root = self
+        while root.parent is not None:
+            root = root.parent
+        offset_ms = (self.start_ns - root.start_ns) / 1e6
+        attributes = " ".join(f"{key}={value}" for key, value in self.attributes.items())
+        line = f"{'  ' * depth}{self.name} +{offset_ms:.1f}ms {self.duration * 1000:.1f}ms"
+        if attributes:
+            line += f" [{attributes}]"
+        if self.error:
+            line += f" ERROR={self.error}"
+        return "\n".join([line] + [child.render_tree(depth + 1) for child in self.children])
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+class FileExporter:
+    """نوشتن هر trace به‌صورت یک خط JSON در فایل."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, root: Span) -> None:
+        record = {
+            "trace_id": root.trace_id,
+            "spans": [
+                {
+                    "span_id": span.span_id,
+                    "parent_id": span.parent.span_id if span.parent else None,
+                    "name": span.name,
+                    "start_ns": span.start_ns,
+                    "end_ns": span.end_ns,
+                    "attributes": span.attributes,
+                    "error": span.error,
+                }
+                for span in root.iter_spans()
+            ],
+        }
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+class OTLPExporter:
+    """ارسال trace با فرمت OTLP/HTTP JSON به یک collector."""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+
+    @staticmethod
+    def _attributes(attributes: Dict[str, Any]) -> List[Dict]:
+        return [{"key": key, "value": {"stringValue": str(value)}} for key, value in attributes.items()]
+
+    def export(self, root: Span) -> None:
+        spans = []
+        for span in root.iter_spans():
+            otlp_span = {
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": 1,
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns),
+                "attributes": self._attributes(span.attributes),
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+            }
+            if span.parent:
+                otlp_span["parentSpanId"] = span.parent.span_id
+            spans.append(otlp_span)
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": self._attributes({"service.name": SERVICE_NAME})},
+                "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": spans}],
+            }]
+        }
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(payload, default=str).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=5):
+            pass
+
+class Tracer:
+    """
+    ساخت trace برای هر آپدیت. همه traceها در حافظه ساخته می‌شوند (هزینه چند میکروثانیه)،
+    اما فقط نمونه‌های انتخاب‌شده یا درخواست‌های کندتر از آستانه export/لاگ می‌شوند.
+    export در یک thread پس‌زمینه انجام می‌شود تا حلقه رویداد مسدود نشود.
+    """
+
+    def __init__(self, enabled: bool, sample_rate: float, slow_threshold: float, exporter=None):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.exporter = exporter
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=1000)
+        self._worker: Optional[threading.Thread] = None
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._export_loop, name="trace-exporter", daemon=True)
+            self._worker.start()
+
+    def _export_loop(self) -> None:
+        while True:
+            root = self._queue.get()
+            try:
+                self.exporter.export(root)
+            except Exception as e:
+                logger.error(f"Error exporting trace {root.trace_id}: {e}")
+
+    def finish(self, root: Span) -> None:
+        """تصمیم‌گیری درباره لاگ/export پس از پایان span ریشه."""
+        slow = root.duration >= self.slow_threshold
+        if slow:
+            logger.warning(f"Slow update ({root.duration:.2f}s), span tree:\n{root.render_tree()}")
+        if self.exporter and (slow or random.random() < self.sample_rate):
+            self._ensure_worker()
+            try:
+                self._queue.put_nowait(root)
+            except queue.Full:
+                logger.warning("Trace export queue full; dropping trace.")
+
+def _build_exporter():
+    if TRACE_EXPORTER == "file":
+        return FileExporter(TRACE_FILE)
+    if TRACE_EXPORTER == "otlp" and TRACE_OTLP_ENDPOINT:
+        return OTLPExporter(TRACE_OTLP_ENDPOINT)
+    return None
+
+tracer = Tracer(TRACE_ENABLED, TRACE_SAMPLE_RATE, TRACE_SLOW_THRESHOLD, _build_exporter())
+
+@contextmanager
+def start_trace(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """شروع span ریشه برای یک آپدیت."""
+    if not tracer.enabled:
+        yield None
+        return
+    root = Span(name, f"{random.getrandbits(128):032x}", **attributes)
+    token = _current_span.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.error = type(e).__name__
+        raise
+    finally:
+        root.end_ns = time.time_ns()
+        _current_span.reset(token)
+        tracer.finish(root)
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """span فرزند؛ اگر trace فعالی وجود نداشته باشد هیچ کاری نمی‌کند."""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, parent.trace_id, parent, **attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = type(e).__name__
+        raise
+    finally:
+        child.end_ns = time.time_ns()
+        _current_span.reset(token)
+
+async def traced_async_sleep(seconds: float) -> None:
+    """جایگزین asyncio.sleep برای tenacity تا انتظار بین تلاش‌ها در trace دیده شود."""
+    with span("retry.sleep", seconds=seconds):
+        await asyncio.sleep(seconds)
+
+def traced_sleep(seconds: float) -> None:
+    """نسخه sync برای توابعی مثل setup_database."""
+    with span("retry.sleep", seconds=seconds):
+        time.sleep(seconds)
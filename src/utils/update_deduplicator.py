@@ -0,0 +1,94 @@
+import asyncio
+from collections import deque
+from typing import Deque, Optional, Set, TYPE_CHECKING
+
+from src.config import logger
+from src.utils.metrics import Counter
+
+if TYPE_CHECKING:
+    import redis
+
+DUPLICATE_UPDATES = Counter("updates_duplicate_total", "Duplicate updates dropped before processing")
+
+class LocalDedupFilter:
+    """فیلتر حلقوی در حافظه برای حالت تک‌replica: آخرین N شناسه آپدیت را نگه می‌دارد."""
+
+    def __init__(self, capacity: int = 10000):
+        self.capacity = capacity
+        self._order: Deque[int] = deque()
+        self._seen: Set[int] = set()
+
+    def add(self, update_id: int) -> bool:
+        """افزودن شناسه؛ اگر قبلاً دیده شده باشد False برمی‌گرداند."""
+        if update_id in self._seen:
+            return False
+        self._seen.add(update_id)
+        self._order.append(update_id)
+        if len(self._order) > self.capacity:
+            self._seen.discard(self._order.popleft())
+        return True
+
+    def discard(self, update_id: int) -> None:
+        """حذف شناسه تا تحویل بعدی همان آپدیت تکراری شمرده نشود."""
+        if update_id in self._seen:
+            self._seen.discard(update_id)
+            self._order.remove(update_id)
+
+class UpdateDeduplicator:
+    """
+    حذف آپدیت‌های تکراری ناشی از تلاش مجدد webhook تلگرام، در forwarder و پیش از پذیرش آپدیت،
+    تا تکراری‌ها جای صف را اشغال نکنند. با Redis (SET NX + TTL) بین چند replica مشترک است و
+    در نبود Redis به فیلتر محلی برمی‌گردد.
+    """
+
+    def __init__(self, redis_client: Optional["redis.Redis"] = None, ttl: int = 3600,
+                 local_capacity: int = 10000, namespace: str = "scholarino"):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.namespace = namespace
+        self.local = LocalDedupFilter(local_capacity)
+        self.duplicates = DUPLICATE_UPDATES
+
+    def _key(self, update_id: int) -> str:
+        return f"{self.namespace}:update:{update_id}"
+
+    def is_new(self, update_id: Optional[int]) -> bool:
+        """بررسی اینکه آپدیت برای اولین بار دیده می‌شود؛ تکراری‌ها شمرده می‌شوند."""
+        if update_id is None:
+            return True
+        is_new = None
+        if self.redis is not None:
+            try:
+                is_new = bool(self.redis.set(self._key(update_id), 1, nx=True, ex=self.ttl))
+            except Exception as e:
+                logger.error(f"Redis dedup check failed for update {update_id}, using local filter: {e}")
+        if is_new is None:
+            is_new = self.local.add(update_id)
+        if not is_new:
+            self.duplicates.inc()
+            logger.info(f"Dropping duplicate update {update_id} (total duplicates: {self.duplicates.value})")
+        return is_new
+
+    async def claim(self, update_id: Optional[int]) -> bool:
+        """نسخه async از is_new؛ فراخوانی Redis در thread جدا اجرا می‌شود تا حلقه رویداد مسدود نشود."""
+        if self.redis is None:
+            return self.is_new(update_id)
+        return await asyncio.to_thread(self.is_new, update_id)
+
+    async def unclaim(self, update_id: Optional[int]) -> None:
+        """نسخه async از release."""
+        if self.redis is None:
+            self.release(update_id)
+        else:
+            await asyncio.to_thread(self.release, update_id)
+
+    def release(self, update_id: Optional[int]) -> None:
+        """آزاد کردن شناسه آپدیتی که ثبت شد ولی اجرا نشد، تا تحویل مجدد تلگرام پردازش شود."""
+        if update_id is None:
+            return
+        self.local.discard(update_id)
+        if self.redis is not None:
+            try:
+                self.redis.delete(self._key(update_id))
+            except Exception as e:
+                logger.error(f"Failed to release dedup key for update {update_id}: {e}")
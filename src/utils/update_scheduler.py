@@ -0,0 +1,221 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Dict, Hashable, Optional, Set
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from src.config import logger
+from src.utils.metrics import Counter, Gauge, Histogram
+from src.utils.update_deduplicator import UpdateDeduplicator
+from src.utils.tracing import start_trace
+
+FAST_LANE = "fast"
+SLOW_LANE = "slow"
+
+# دکمه‌هایی که با وجود callback بودن، منتظر OpenAI می‌مانند
+SLOW_CALLBACK_DATA = frozenset({"menu:weather"})
+
+LANE_WAIT = Histogram("update_lane_wait_seconds", "Time an update waits for a lane slot", labelnames=("lane",))
+LANE_LATENCY = Histogram("update_lane_latency_seconds", "End-to-end update latency per lane", labelnames=("lane",))
+LANE_REJECTED = Counter("update_lane_rejected_total", "Updates rejected with HTTP 503 because the lane queue was full",
+                        labelnames=("lane",))
+LANE_RUNNING = Gauge("update_lane_running", "Updates currently running per lane", labelnames=("lane",))
+LANE_WAITING = Gauge("update_lane_waiting", "Updates accepted but not yet running per lane", labelnames=("lane",))
+
+class Lane:
+    """یک مسیر پردازش با محدودیت هم‌زمانی و صف محدود."""
+
+    def __init__(self, name: str, concurrency: int, queue_size: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.semaphore = asyncio.BoundedSemaphore(concurrency)
+        # آپدیت‌های پذیرفته‌شده که هنوز اجرا نشده‌اند (در update_queue یا منتظر قفل کاربر/سمافور)
+        self.waiting = 0
+        self.running = 0
+        self.rejected = LANE_REJECTED.labels(name)
+        self.wait_time = LANE_WAIT.labels(name)
+        self.latency = LANE_LATENCY.labels(name)
+        LANE_RUNNING.labels(name).set_function(lambda: self.running)
+        LANE_WAITING.labels(name).set_function(lambda: self.waiting)
+
+    def is_full(self) -> bool:
+        return self.waiting >= self.queue_size
+
+class _UserLock:
+    """قفل ترتیب آپدیت‌های یک کاربر به همراه تعداد آپدیت‌هایی که به آن نیاز دارند."""
+
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+class PriorityUpdateProcessor(BaseUpdateProcessor):
+    """
+    زمان‌بند آپدیت‌ها با دو مسیر جدا: مسیر سریع برای callbackها و دستورات،
+    و مسیر کند برای پیام‌های متنی/صوتی که منتظر OpenAI می‌مانند.
+    مسیرها فقط بین کاربران مختلف اولویت می‌دهند؛ آپدیت‌های یک کاربر (یا چت) با یک قفل جدا
+    به ترتیب رسیدن و یکی‌یکی اجرا می‌شوند، چون ConversationHandler و user_data برای اجرای
+    هم‌زمان یک کاربر امن نیستند.
+    """
+
+    def __init__(self, fast_concurrency: int, fast_queue_size: int,
+                 slow_concurrency: int, slow_queue_size: int,
+                 deduplicator: Optional[UpdateDeduplicator] = None):
+        super().__init__(max_concurrent_updates=fast_concurrency + slow_concurrency)
+        # حذف تکراری‌ها در LocalForwarder و پیش از try_admit انجام می‌شود؛ اینجا برای آمار نگه داشته می‌شود
+        self.deduplicator = deduplicator
+        self.lanes: Dict[str, Lane] = {
+            FAST_LANE: Lane(FAST_LANE, fast_concurrency, fast_queue_size),
+            SLOW_LANE: Lane(SLOW_LANE, slow_concurrency, slow_queue_size),
+        }
+        self._user_locks: Dict[Hashable, _UserLock] = {}
+        # شناسه آپدیت‌هایی که try_admit جایشان را در صف مسیر رزرو کرده است
+        self._admitted: Set[int] = set()
+        self._idle = asyncio.Condition()
+
+    @staticmethod
+    def classify(update: object) -> str:
+        """تعیین مسیر پردازش برای یک آپدیت."""
+        if not isinstance(update, Update):
+            return FAST_LANE
+        if update.callback_query:
+            return SLOW_LANE if update.callback_query.data in SLOW_CALLBACK_DATA else FAST_LANE
+        message = update.effective_message
+        if message and message.text and message.text.startswith('/'):
+            return FAST_LANE
+        return SLOW_LANE
+
+    @staticmethod
+    def serialization_key(update: object) -> Optional[Hashable]:
+        """کلید ترتیب: شناسه کاربر، و برای آپدیت‌های بدون کاربر شناسه چت."""
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user:
+            return ("user", update.effective_user.id)
+        if update.effective_chat:
+            return ("chat", update.effective_chat.id)
+        return None
+
+    @property
+    def in_flight(self) -> int:
+        """تعداد آپدیت‌های پذیرفته‌شده‌ای که هنوز تمام نشده‌اند."""
+        return sum(lane.waiting + lane.running for lane in self.lanes.values())
+
+    def try_admit(self, update: object) -> bool:
+        """
+        رزرو جا در صف مسیر پیش از تحویل آپدیت به update_queue. اگر صف پر باشد False برمی‌گرداند
+        تا webhook با 503 پاسخ دهد و تلگرام بعداً دوباره بفرستد؛ آپدیت پذیرفته‌شده هرگز دور ریخته نمی‌شود.
+        """
+        lane = self.lanes[self.classify(update)]
+        update_id = getattr(update, 'update_id', None)
+        if lane.is_full():
+            lane.rejected.inc()
+            logger.warning(f"{lane.name} lane queue full ({lane.queue_size}); rejecting update {update_id}")
+            return False
+        lane.waiting += 1
+        if update_id is not None:
+            self._admitted.add(update_id)
+        return True
+
+    async def wait_for_capacity(self, limit: Optional[int] = None) -> None:
+        """انتظار تا تعداد آپدیت‌های در جریان کمتر از limit شود (پیش‌فرض: جمع هم‌زمانی مسیرها)."""
+        limit = limit or self.max_concurrent_updates
+        async with self._idle:
+            await self._idle.wait_for(lambda: self.in_flight < limit)
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        """
+        جایگزین سمافور سراسری کلاس پایه: هر مسیر سمافور خودش را دارد تا
+        کارهای کند ظرفیت مسیر سریع را اشغال نکنند.
+        """
+        await self.do_process_update(update, coroutine)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        lane = self.lanes[self.classify(update)]
+        update_id = getattr(update, 'update_id', None)
+        # آپدیت‌هایی که از try_admit نگذشته‌اند (مثلاً polling) هم شمرده می‌شوند ولی رد نمی‌شوند
+        if update_id in self._admitted:
+            self._admitted.discard(update_id)
+        else:
+            lane.waiting += 1
+
+        received = time.perf_counter()
+        key = self.serialization_key(update)
+        user_lock = None
+        if key is not None:
+            user_lock = self._user_locks.get(key)
+            if user_lock is None:
+                user_lock = self._user_locks[key] = _UserLock()
+            user_lock.users += 1
+        try:
+            try:
+                # قفل کاربر پیش از سمافور گرفته می‌شود تا آپدیت منتظرِ هم‌کاربر جای مسیر را اشغال نکند
+                if user_lock is not None:
+                    await user_lock.lock.acquire()
+                try:
+                    await lane.semaphore.acquire()
+                except BaseException:
+                    if user_lock is not None:
+                        user_lock.lock.release()
+                    raise
+            except BaseException:
+                coroutine.close()
+                raise
+            finally:
+                lane.waiting -= 1
+            started = time.perf_counter()
+            lane.wait_time.observe(started - received)
+            lane.running += 1
+            try:
+                with start_trace("update", update_id=update_id, lane=lane.name,
+                                 queued_ms=round((started - received) * 1000, 1)):
+                    await coroutine
+            finally:
+                lane.running -= 1
+                lane.semaphore.release()
+                if user_lock is not None:
+                    user_lock.lock.release()
+                lane.latency.observe(time.perf_counter() - received)
+        finally:
+            if user_lock is not None:
+                user_lock.users -= 1
+                if not user_lock.users:
+                    self._user_locks.pop(key, None)
+            await self._notify_capacity()
+
+    async def _notify_capacity(self) -> None:
+        async with self._idle:
+            self._idle.notify_all()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """وضعیت فعلی هر مسیر به همراه خلاصه هیستوگرام‌ها."""
+        return {
+            name: {
+                'running': lane.running,
+                'waiting': lane.waiting,
+                'rejected': lane.rejected.value,
+                'wait': lane.wait_time.snapshot(),
+                'latency': lane.latency.snapshot(),
+            }
+            for name, lane in self.lanes.items()
+        }
+
+    async def initialize(self) -> None:
+        logger.info(
+            "Update scheduler started: "
+            + ", ".join(f"{lane.name}=(concurrency {lane.concurrency}, queue {lane.queue_size})"
+                        for lane in self.lanes.values())
+        )
+
+    async def shutdown(self) -> None:
+        for name, lane_stats in self.stats().items():
+            latency = lane_stats['latency']
+            logger.info(
+                f"{name} lane: {latency['count']} updates, p50={latency['p50']}s, "
+                f"p95={latency['p95']}s, p99={latency['p99']}s, rejected={lane_stats['rejected']}"
+            )
+        if self.deduplicator:
+            logger.info(f"Duplicate updates dropped: {self.deduplicator.duplicates.value}")
@@ -0,0 +1,5 @@
+# ریشه مخزن در sys.path تا importهای «src.» مثل اجرای main.py کار کنند
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from src.data.isee_rules import isee_rules
+from src.services.isee_batch import calculate_batch, read_cohort_csv
+
+# تعداد خانواده‌های تصادفی در مقایسه نسخه برداری با محاسبه تکی
+PARITY_FAMILIES = 50_000
+
+def scalar_isee(rules, family_members: int, annual_income: float, owner: bool, property_size: float) -> float:
+    """همان فرمول ISEEService.calculate (بدون وابستگی به telegram)."""
+    return round((annual_income + rules.property_value(owner, property_size)) / rules.scale(family_members), 2)
+
+def test_calculate_batch_matches_scalar_calculation():
+    rules = isee_rules.current()
+    rng = np.random.default_rng(2024)
+    members = rng.integers(1, 12, PARITY_FAMILIES)
+    income = np.round(rng.uniform(0, 120_000, PARITY_FAMILIES), 2)
+    owner = rng.random(PARITY_FAMILIES) < 0.4
+    size = np.round(rng.uniform(0, 250, PARITY_FAMILIES), 1)
+
+    result = calculate_batch(members, income, owner, size, rules)
+
+    amounts = [rule.amount for rule in rules.tiers] + [rules.not_eligible.amount]
+    for index in range(PARITY_FAMILIES):
+        expected = scalar_isee(rules, int(members[index]), float(income[index]), bool(owner[index]), float(size[index]))
+        assert result['value'][index] == expected, index
+        assert result['tier'][index] == rules.tier_index(expected), index
+        assert result['amount'][index] == amounts[rules.tier_index(expected)], index
+
+@pytest.mark.parametrize("income, size", [
+    ("nan", "0"), ("inf", "0"), ("-inf", "0"), ("1000", "nan"), ("1000", "inf"),
+])
+def test_read_cohort_csv_rejects_non_finite_values(income, size):
+    text = f"family_members,annual_income,property_status,property_size\n3,{income},owner,{size}\n"
+    with pytest.raises(ValueError, match="line 2"):
+        read_cohort_csv(text)
+
+def test_read_cohort_csv_accepts_valid_rows():
+    rows = read_cohort_csv("family_members,annual_income,property_status,property_size\n3,25000.5,owner,80\n")
+    assert rows == {
+        "family_members": [3], "annual_income": [25000.5], "property_status": [True], "property_size": [80.0],
+    }